@@ -0,0 +1,386 @@
+"""Архивация завершённых экспериментов: сжатие и срок хранения (без зависимостей от Qt).
+
+Пример:
+    python balance_archive.py data --max-gb 50 --max-age-days 365
+
+Текстовые файлы эксперимента (CSV, метрики .jsonl) сжимаются gzip в
+<файл>.gz рядом с исходным. Сжатый файл сначала пишется во временный,
+затем распаковывается обратно и сверяется с исходным по размеру и CRC32;
+только после этого исходный удаляется. Время изменения переносится на
+архив - по нему CsvReader узнаёт дату записи. .bin по умолчанию не
+сжимается: он и так компактен, а Viewer отображает его в память (с
+compress_bin=True - тоже в .bin.gz). Кэши просмотра (.cache.bin,
+.pyramid.npz) сжатых файлов удаляются - они пересоздаются.
+
+Недописанные <файл>.gz.tmp (архивацию прервали при выходе) удаляются
+при следующем проходе sweep, исходный файл сжимается заново.
+
+Срок хранения: папки exp_* старше max_age_days удаляются целиком, затем,
+пока всё вместе больше max_bytes, - самые старые. Читатели balance_data
+и Viewer открывают .csv.gz и .bin.gz так же, как несжатые файлы.
+
+Папки, куда ещё пишет другая сессия (второй GUI, balance_cli), sweep и
+срок хранения пропускают: идущая сессия держит в своей папке метку
+.session (SessionMarker) и обновляет её раз в минуту, а папка, где
+какой-либо файл менялся за последние ACTIVE_AGE с, считается занятой.
+Метка упавшей сессии перестаёт мешать через те же ACTIVE_AGE с.
+"""
+import os
+import sys
+import gzip
+import zlib
+import queue
+import shutil
+import logging
+import argparse
+import threading
+import time
+
+from balance_data import export_csv, open_samples
+from balance_metrics import METRICS
+
+log = logging.getLogger(__name__)
+
+_files = METRICS.counter("archive.files")
+_bytes_in = METRICS.counter("archive.bytes_in")
+_bytes_out = METRICS.counter("archive.bytes_out")
+_errors = METRICS.counter("archive.errors")
+_removed = METRICS.counter("archive.removed_experiments")
+_stale = METRICS.counter("archive.stale_tmp")
+
+TEXT_SUFFIXES = (".csv", ".jsonl")
+CACHE_SUFFIXES = (".cache.bin", ".pyramid.npz")
+SESSION_MARKER = ".session"
+ACTIVE_AGE = 600        # с: папка с более свежими изменениями занята другой сессией
+
+
+def _crc(f, chunk):
+    crc, size = 0, 0
+    while True:
+        data = f.read(chunk)
+        if not data:
+            return crc, size
+        crc = zlib.crc32(data, crc)
+        size += len(data)
+
+
+def compress_file(src, level=6, chunk=1 << 20):
+    """Сжать src в src.gz с проверкой; исходный удаляется. Вернуть (байт до, байт после)."""
+    dst = src + ".gz"
+    tmp = dst + ".tmp"
+    st = os.stat(src)
+    crc, size = 0, 0
+    try:
+        with open(src, "rb") as fin, open(tmp, "wb") as raw:
+            with gzip.GzipFile(os.path.basename(src), "wb", level, raw, st.st_mtime) as fout:
+                while True:
+                    data = fin.read(chunk)
+                    if not data:
+                        break
+                    crc = zlib.crc32(data, crc)
+                    size += len(data)
+                    fout.write(data)
+            raw.flush()
+            os.fsync(raw.fileno())
+        with gzip.open(tmp, "rb") as f:
+            if _crc(f, chunk) != (crc, size):
+                raise ValueError(f"{src}: compressed copy does not match")
+        if os.path.getsize(src) != size:
+            raise ValueError(f"{src}: file changed while compressing")
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    os.utime(tmp, ns=(st.st_atime_ns, st.st_mtime_ns))
+    os.replace(tmp, dst)
+    os.remove(src)
+    for suffix in CACHE_SUFFIXES:
+        cache = src + suffix
+        if os.path.exists(cache):
+            os.remove(cache)
+    return size, os.path.getsize(dst)
+
+
+def decompress_file(src, dst, chunk=1 << 20):
+    """Распаковать src (.gz) в dst через временный файл."""
+    tmp = dst + ".tmp"
+    with gzip.open(src, "rb") as fin, open(tmp, "wb") as fout:
+        shutil.copyfileobj(fin, fout, chunk)
+    os.replace(tmp, dst)
+
+
+def archivable(name, compress_bin=False):
+    """Сжимать ли файл с таким именем."""
+    if name.endswith((".gz", ".tmp") + CACHE_SUFFIXES):
+        return False
+    return name.endswith(TEXT_SUFFIXES) or (compress_bin and name.endswith(".bin"))
+
+
+def folder_files(folder, compress_bin=False):
+    """Файлы папки эксперимента, которые можно сжать."""
+    try:
+        names = sorted(os.listdir(folder))
+    except OSError:
+        return []
+    return [os.path.join(folder, n) for n in names
+            if archivable(n, compress_bin) and os.path.isfile(os.path.join(folder, n))]
+
+
+def remove_stale_tmp(folder):
+    """Удалить недописанные <файл>.gz.tmp, чей исходный файл ещё на месте -> сколько удалено.
+
+    Такие остаются, если архивацию прервали (выход после ARCHIVE_EXIT_WAIT);
+    исходный файл цел и будет сжат заново.
+    """
+    removed = 0
+    try:
+        names = os.listdir(folder)
+    except OSError:
+        return 0
+    for name in names:
+        if not name.endswith(".gz.tmp"):
+            continue
+        path = os.path.join(folder, name)
+        if os.path.exists(path[:-len(".gz.tmp")]):
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            removed += 1
+            _stale.add()
+            log.info("removed unfinished %s", path)
+    return removed
+
+
+def session_active(folder, now=None, active_age=ACTIVE_AGE):
+    """Пишет ли в папку другая сессия: метка или файлы менялись за active_age с."""
+    now = time.time() if now is None else now
+    try:
+        entries = list(os.scandir(folder))
+    except OSError:
+        return False
+    for entry in entries:
+        try:
+            if now - entry.stat().st_mtime < active_age:
+                return True
+        except OSError:
+            continue
+    return False
+
+
+class SessionMarker:
+    """Метка .session идущей сессии в папке эксперимента (см. session_active).
+
+    touch() можно звать часто: файл обновляется не чаще раза в interval с
+    и только если папка уже создана. remove() - при выходе.
+    """
+
+    def __init__(self, folder, interval=60.0):
+        self.path = os.path.join(folder, SESSION_MARKER)
+        self.interval = interval
+        self._last = None
+
+    def touch(self):
+        now = time.monotonic()
+        if self._last is not None and now - self._last < self.interval:
+            return
+        if not os.path.isdir(os.path.dirname(self.path)):
+            return
+        try:
+            with open(self.path, "w") as f:
+                f.write(f"{os.getpid()}\n")
+        except OSError as e:
+            log.warning("failed to write %s: %s", self.path, e)
+            return
+        self._last = now
+
+    def remove(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            log.warning("failed to remove %s: %s", self.path, e)
+
+
+def _folder_size(folder):
+    total = 0
+    for dirpath, _, filenames in os.walk(folder):
+        for name in filenames:
+            try:
+                total += os.path.getsize(os.path.join(dirpath, name))
+            except OSError:
+                pass
+    return total
+
+
+def _experiments(root):
+    """Папки exp_* под root -> [(время, путь)] от старых к новым."""
+    found = []
+    try:
+        names = os.listdir(root)
+    except OSError:
+        return found
+    for name in names:
+        path = os.path.join(root, name)
+        if not name.startswith("exp_") or not os.path.isdir(path):
+            continue
+        try:
+            ts = float(name[4:])
+        except ValueError:
+            ts = os.path.getmtime(path)
+        found.append((ts, path))
+    return sorted(found)
+
+
+def apply_retention(root, max_bytes=None, max_age_days=None, keep=(), now=None,
+                    active_age=ACTIVE_AGE):
+    """Удалить старые папки exp_* под root по возрасту и общему размеру -> список удалённых.
+
+    Папки из keep (идущая сессия) и папки, куда ещё пишет другая сессия
+    (session_active), не трогаются никогда.
+    """
+    if max_bytes is None and max_age_days is None:
+        return []
+    keep = {os.path.abspath(k) for k in keep}
+    now = time.time() if now is None else now
+    experiments = [(ts, path, _folder_size(path)) for ts, path in _experiments(root)]
+    total = sum(size for _, _, size in experiments)
+    removed = []
+    for ts, path, size in experiments:
+        if os.path.abspath(path) in keep or session_active(path, now, active_age):
+            continue
+        too_old = max_age_days is not None and now - ts > max_age_days * 86400
+        too_big = max_bytes is not None and total > max_bytes
+        if not (too_old or too_big):
+            continue
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
+        removed.append(path)
+        _removed.add()
+        log.info("retention: removed %s", path)
+    return removed
+
+
+class Archiver(threading.Thread):
+    """Фоновый поток архивации: сжатие файлов и срок хранения, не задерживая вызывающего.
+
+    archive(paths) - сжать файлы; archive_folder(folder) - всё подходящее
+    в папке; export_csv(paths) - выгрузить записи .bin в .csv рядом (до
+    сжатия папки, если поставить раньше archive_folder); sweep(root, keep) -
+    все папки exp_* под root, кроме keep,
+    и затем срок хранения; папки других идущих сессий (session_active)
+    sweep пропускает. Ошибки пишутся в лог и в archive.errors.
+    """
+
+    def __init__(self, compress_bin=False, max_bytes=None, max_age_days=None, level=6,
+                 active_age=ACTIVE_AGE):
+        super().__init__(daemon=True)
+        self.compress_bin = compress_bin
+        self.max_bytes = max_bytes
+        self.max_age_days = max_age_days
+        self.level = level
+        self.active_age = active_age
+        self._queue = queue.Queue()
+
+    def archive(self, paths):
+        self._queue.put(("files", list(paths)))
+
+    def archive_folder(self, folder):
+        self._queue.put(("folder", folder))
+
+    def export_csv(self, paths):
+        self._queue.put(("export", list(paths)))
+
+    def sweep(self, root, keep=()):
+        self._queue.put(("sweep", root, tuple(keep)))
+
+    def close(self, timeout=None):
+        """Доделать очередь (не дольше timeout секунд) и остановиться."""
+        self._queue.put(None)
+        if self.is_alive():
+            self.join(timeout)
+
+    def run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            try:
+                if item[0] == "files":
+                    self._compress(item[1])
+                elif item[0] == "folder":
+                    self._compress(folder_files(item[1], self.compress_bin))
+                elif item[0] == "export":
+                    self._export(item[1])
+                else:
+                    self._sweep(item[1], item[2])
+            except Exception:
+                _errors.add()
+                log.exception("archiving failed")
+
+    def _compress(self, paths):
+        for path in paths:
+            if not os.path.exists(path):
+                continue
+            try:
+                before, after = compress_file(path, self.level)
+            except (OSError, ValueError) as e:
+                _errors.add()
+                log.warning("failed to compress %s: %s", path, e)
+                continue
+            _files.add()
+            _bytes_in.add(before)
+            _bytes_out.add(after)
+
+    def _export(self, paths):
+        for path in paths:
+            dst = os.path.splitext(path)[0] + ".csv"
+            tmp = dst + ".tmp"
+            try:
+                data = open_samples(path)
+                export_csv(data, tmp, data.experiment_start)
+                os.replace(tmp, dst)
+            except (OSError, ValueError) as e:
+                _errors.add()
+                log.warning("failed to export %s: %s", path, e)
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+
+    def _sweep(self, root, keep):
+        keep_abs = {os.path.abspath(k) for k in keep}
+        for _, folder in _experiments(root):
+            if os.path.abspath(folder) in keep_abs:
+                continue
+            if session_active(folder, active_age=self.active_age):
+                log.info("skipped %s: another session is writing there", folder)
+                continue
+            remove_stale_tmp(folder)
+            self._compress(folder_files(folder, self.compress_bin))
+        apply_retention(root, self.max_bytes, self.max_age_days, keep,
+                        active_age=self.active_age)
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Compress finished experiments and apply a retention policy.")
+    p.add_argument("root", help="data folder with exp_* subfolders")
+    p.add_argument("--bin", action="store_true", help="compress .bin recordings too")
+    p.add_argument("--max-gb", type=float, default=None, help="remove the oldest experiments above this total size")
+    p.add_argument("--max-age-days", type=float, default=None, help="remove experiments older than this")
+    p.add_argument("--keep", action="append", default=[], help="experiment folder to leave untouched")
+    args = p.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    archiver = Archiver(args.bin, int(args.max_gb * 2**30) if args.max_gb else None, args.max_age_days)
+    archiver.start()
+    t0 = time.perf_counter()
+    archiver.sweep(args.root, args.keep)
+    archiver.close()
+    saved = _bytes_in.value - _bytes_out.value
+    print(f"{_files.value} files compressed ({saved / 2**20:.1f} MB saved), "
+          f"{_removed.value} experiments removed, {_errors.value} errors "
+          f"in {time.perf_counter() - t0:.1f} s")
+    return 1 if _errors.value else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
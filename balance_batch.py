@@ -0,0 +1,183 @@
+"""Пакетная обработка папки с экспериментами.
+
+Пример:
+    python balance_batch.py data --out summary.csv --jobs 8
+
+Находит записи во всех exp_*/ под корнем (data_<ts>_<порт>.bin/.csv, локальные
+CSV), разбирает их в пуле процессов и пишет одну сводную таблицу: по
+строке на файл. Результаты кэшируются в <корень>/.balance_batch_cache.json
+по размеру и времени изменения файла, так что при повторном запуске
+обрабатываются только новые и изменённые файлы.
+"""
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from balance_data import FLAG_STABLE, FLAG_VALID, open_samples, read_csv
+
+CACHE_NAME = ".balance_batch_cache.json"
+CACHE_VERSION = 2     # 2: дата старта CSV по папке exp_<ts>, а не по дате изменения
+
+FIELDS = (
+    "file", "experiment", "start", "duration_s", "samples", "valid", "stable_fraction",
+    "stable_regions", "stable_mean", "stable_std", "stable_slope_g_per_h",
+    "gaps", "gap_total_s", "max_gap_s", "error",
+)
+
+
+def _split(name):
+    """Имя -> (основа, расширение) без суффикса архива .gz."""
+    return os.path.splitext(name[:-3] if name.endswith(".gz") else name)
+
+
+def find_recordings(root):
+    """Файлы записей под root (в том числе сжатые .gz); CSV, выгруженный из .bin с тем же именем, пропускается."""
+    found = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        if not os.path.basename(dirpath).startswith("exp_"):
+            continue
+        bins = {_split(n)[0] for n in filenames if _split(n)[1] == ".bin"}
+        for name in sorted(filenames):
+            stem, ext = _split(name)
+            if name.endswith((".cache.bin", ".tmp")) or stem.endswith(".anchors") \
+                    or name.startswith(("rolling_", "stats_")):
+                continue
+            if ext == ".bin" or (ext == ".csv" and stem not in bins):
+                found.append(os.path.join(dirpath, name))
+    return found
+
+
+def _stable_regions(mask):
+    """Число непрерывных участков, где mask истинна."""
+    if not len(mask):
+        return 0
+    m = mask.astype(np.int8)
+    return int(m[0] + np.count_nonzero(np.diff(m) == 1))
+
+
+def summarize(fname, gap=5.0):
+    """Сводка по одной записи (словарь по FIELDS без file/experiment)."""
+    if _split(fname.lower())[1] == ".csv":
+        samples, start = read_csv(fname)
+    else:
+        samples = open_samples(fname)
+        start = samples.experiment_start
+    t = np.asarray(samples.t, dtype=np.float64)
+    v = np.asarray(samples.v, dtype=np.float64)
+    flags = np.asarray(samples.flags)
+    valid = (flags & FLAG_VALID) != 0
+    stable = valid & ((flags & FLAG_STABLE) != 0)
+    row = {
+        "start": start.isoformat(sep=" "),
+        "duration_s": float(t[-1] - t[0]) if len(t) else 0.0,
+        "samples": int(len(t)),
+        "valid": int(valid.sum()),
+        "stable_fraction": float(stable.sum() / valid.sum()) if valid.any() else None,
+        "stable_regions": _stable_regions(stable),
+        "stable_mean": None, "stable_std": None, "stable_slope_g_per_h": None,
+    }
+    if stable.any():
+        ts, vs = t[stable], v[stable]
+        row["stable_mean"] = float(vs.mean())
+        row["stable_std"] = float(vs.std(ddof=1)) if len(vs) > 1 else None
+        x = ts - ts.mean()
+        den = float(x @ x)
+        if den > 0:
+            row["stable_slope_g_per_h"] = float(x @ (vs - vs.mean()) / den * 3600)
+    dt = np.diff(t)
+    big = dt[dt > gap]
+    row["gaps"] = int(len(big))
+    row["gap_total_s"] = float(big.sum())
+    row["max_gap_s"] = float(dt.max()) if len(dt) else 0.0
+    return row
+
+
+def _work(args):
+    fname, gap = args
+    try:
+        return summarize(fname, gap)
+    except Exception as e:      # одна битая запись не должна ронять весь прогон
+        return {"error": f"{type(e).__name__}: {e}"}
+
+
+def _load_cache(path):
+    try:
+        with open(path) as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if cache.get("version") != CACHE_VERSION:
+        return {}
+    return cache.get("files", {})
+
+
+def _save_cache(path, files):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump({"version": CACHE_VERSION, "files": files}, f)
+    os.replace(tmp, path)
+
+
+def run(root, out, jobs=None, gap=5.0, use_cache=True):
+    """Обработать root, записать таблицу в out; вернуть (всего, из кэша, с ошибкой)."""
+    files = find_recordings(root)
+    cache_path = os.path.join(root, CACHE_NAME)
+    cache = _load_cache(cache_path) if use_cache else {}
+    rows, todo, keys = {}, [], {}
+    for fname in files:
+        rel = os.path.relpath(fname, root)
+        st = os.stat(fname)
+        key = [st.st_size, st.st_mtime_ns, gap]
+        keys[rel] = key
+        hit = cache.get(rel)
+        if hit and hit["key"] == key:
+            rows[rel] = hit["summary"]
+        else:
+            todo.append(fname)
+    if todo:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            results = pool.map(_work, [(f, gap) for f in todo], chunksize=max(1, len(todo) // 64))
+            for fname, summary in zip(todo, results):
+                rows[os.path.relpath(fname, root)] = summary
+    # в кэш - только удачные сводки, ошибочные файлы пробуем снова
+    new_cache = {rel: {"key": keys[rel], "summary": s} for rel, s in rows.items() if "error" not in s}
+    try:
+        _save_cache(cache_path, new_cache)
+    except OSError:
+        pass
+    with open(out, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDS, extrasaction="ignore")
+        writer.writeheader()
+        for rel in sorted(rows):
+            experiment = os.path.basename(os.path.dirname(rel))
+            writer.writerow({"file": rel, "experiment": experiment, **rows[rel]})
+    errors = sum(1 for s in rows.values() if "error" in s)
+    return len(files), len(files) - len(todo), errors
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Summarize all recordings under a data folder.")
+    p.add_argument("root", help="data folder with exp_* subfolders")
+    p.add_argument("--out", default=None, help="summary table (default: <root>/summary.csv)")
+    p.add_argument("--jobs", type=int, default=None, help="worker processes (default: CPU count)")
+    p.add_argument("--gap", type=float, default=5.0, help="report pauses longer than N seconds (default 5)")
+    p.add_argument("--no-cache", action="store_true", help="reprocess all files")
+    args = p.parse_args(argv)
+    out = args.out or os.path.join(args.root, "summary.csv")
+    t0 = time.perf_counter()
+    total, cached, errors = run(args.root, out, args.jobs, args.gap, not args.no_cache)
+    print(f"{total} files ({cached} cached, {errors} failed) in {time.perf_counter() - t0:.1f} s -> {out}")
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,235 @@
+"""Замеры производительности на эмуляторе весов (balance_sim).
+
+    python balance_bench.py                 # все замеры
+    python balance_bench.py ingest record   # только выбранные
+    python balance_bench.py gui --rate 200 --seconds 10 --json bench.json
+
+ingest - разбор потока строк (FrameReader + FrameParser), отсчётов/с;
+record - запись StreamRecorder в bin и csv, отсчётов/с;
+gui    - окно MainWindow (offscreen) на эмуляторе: принятые отсчёты/с,
+         задержка от чтения порта до кадра графика, время перерисовки,
+         рост памяти;
+startup - запуск программы в --runs отдельных процессах (холодный импорт
+         каждый раз): медианы времени до показа окна, этапов STARTUP
+         и отложенного построения графика Auto Commands.
+Результаты можно сохранить в JSON и сравнивать между версиями.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import subprocess
+import tempfile
+import statistics
+from datetime import datetime
+
+from balance_sim import BalanceModel, SimulatedSerial
+from balance_serial import FrameParser, FrameReader, read_batch
+from balance_recorder import StreamRecorder
+from balance_clock import SessionClock
+
+
+def _rss_mb():
+    """Текущий размер процесса в памяти, МБ (None, если узнать нельзя)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / 2**20
+    except ImportError:
+        return None
+
+
+def _pct(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def bench_ingest(args):
+    conn = SimulatedSerial(BalanceModel(rate=0, malformed=0.01, seed=1), timeout=0.1)
+    reader = FrameReader(conn)
+    parser = FrameParser()
+    clock = SessionClock()
+    count = 0
+    t0 = time.perf_counter()
+    while time.perf_counter() - t0 < args.seconds:
+        batch, _ = read_batch(reader, parser, clock)
+        count += len(batch)
+    dt = time.perf_counter() - t0
+    return {"ingest_samples_per_s": count / dt}
+
+
+def bench_record(args):
+    n = args.samples
+    batch = [(i * 0.05, 100.0 + i * 1e-4, i % 3 == 0) for i in range(1000)]
+    result = {}
+    folder = tempfile.mkdtemp(prefix="balance_bench_")
+    try:
+        for fmt in ("bin", "csv"):
+            rec = StreamRecorder(folder, f"bench_{fmt}", datetime.now(), fsync=False, fmt=fmt)
+            rec.start()
+            t0 = time.perf_counter()
+            for _ in range(n // len(batch)):
+                rec.put_many(batch)
+            rec.close()
+            dt = time.perf_counter() - t0
+            result[f"record_{fmt}_samples_per_s"] = n / dt
+            result[f"record_{fmt}_bytes_per_sample"] = os.path.getsize(rec.files[0]) / n
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+    return result
+
+
+def bench_gui(args):
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PyQt5.QtWidgets import QApplication
+    from PyQt5.QtCore import QTimer
+    import balance_exe
+
+    app = QApplication.instance() or QApplication([])
+    win = balance_exe.MainWindow()
+    win.base_dir = tempfile.mkdtemp(prefix="balance_bench_")
+    win.show()
+    win.tabs.setCurrentWidget(win.tab_auto)
+    win.spin_fps.setValue(args.fps)
+    model = BalanceModel(rate=args.rate, noise=0.01, drift=-0.001, step_every=30, seed=1)
+    win.add_device("sim", SimulatedSerial(model, timeout=0.2))
+    win.toggle_recording()
+    dev = win.devices["sim"]
+
+    latencies = []
+    frame_ms = []
+    state = {"shown": 0, "frames": 0, "pending": None}
+    prepare = win.render.prepare
+
+    def timed_prepare():
+        prepare()
+        # задержка для отсчётов, попавших в этот кадр: сейчас минус время их чтения
+        now = dev.stream_thread.clock.elapsed()
+        n = len(dev.ring)
+        new = n - state["shown"]
+        state["shown"] = n
+        if new > 0:
+            t, _, _ = dev.ring.segments()[-1]
+            state["pending"] = [now - x for x in t[-new:].tolist()]
+
+    def on_poll():
+        if win.render.frames != state["frames"]:
+            state["frames"] = win.render.frames
+            ms = win.render.last_frame_ms
+            frame_ms.append(ms)
+            if state["pending"]:
+                latencies.extend(x * 1000 + ms for x in state["pending"])
+                state["pending"] = None
+
+    win.render.prepare = timed_prepare
+    poll = QTimer()
+    poll.timeout.connect(on_poll)
+    poll.start(1)
+    rss0 = _rss_mb()
+    QTimer.singleShot(int(args.seconds * 1000), app.quit)
+    t0 = time.perf_counter()
+    app.exec_()
+    dt = time.perf_counter() - t0
+    rss1 = _rss_mb()
+    received = len(dev.ring)
+    poll.stop()
+    win.toggle_recording()
+    dev.recorder.close()
+    win.render.stop()
+    dev.close()
+    shutil.rmtree(win.base_dir, ignore_errors=True)
+    return {
+        "gui_samples_per_s": received / dt,
+        "gui_expected_samples_per_s": args.rate,
+        "gui_latency_ms_median": statistics.median(latencies) if latencies else None,
+        "gui_latency_ms_p95": _pct(latencies, 0.95),
+        "gui_redraw_ms_median": statistics.median(frame_ms) if frame_ms else None,
+        "gui_redraw_ms_max": max(frame_ms) if frame_ms else None,
+        "gui_frames": win.render.frames,
+        "gui_full_redraws": win.render.full_frames,
+        "gui_memory_growth_mb": None if rss0 is None else rss1 - rss0,
+    }
+
+
+# выполняется в отдельном процессе: окно до показа, затем отложенный график
+_STARTUP_CHILD = """
+import json, time
+import balance_exe
+from PyQt5.QtWidgets import QApplication
+app = QApplication([])
+balance_exe.STARTUP.mark("qapp")
+win = balance_exe.MainWindow()
+win.show()
+app.processEvents()
+balance_exe.STARTUP.mark("show")
+t0 = time.perf_counter()
+win._ensure_plot()
+plot_ms = (time.perf_counter() - t0) * 1000
+print(json.dumps({"phases": balance_exe.STARTUP.phases,
+                  "total_ms": balance_exe.STARTUP.total_ms, "plot_ms": plot_ms}))
+"""
+
+
+def bench_startup(args):
+    here = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, QT_QPA_PLATFORM=os.environ.get("QT_QPA_PLATFORM", "offscreen"))
+    process_ms, total_ms, plot_ms, phases = [], [], [], {}
+    for _ in range(args.runs):
+        t0 = time.perf_counter()
+        out = subprocess.run([sys.executable, "-c", _STARTUP_CHILD], cwd=here, env=env,
+                             capture_output=True, text=True, check=True).stdout
+        process_ms.append((time.perf_counter() - t0) * 1000)
+        run = json.loads(out.strip().splitlines()[-1])
+        total_ms.append(run["total_ms"])
+        plot_ms.append(run["plot_ms"])
+        for name, ms in run["phases"]:
+            phases.setdefault(name, []).append(ms)
+    results = {
+        "startup_process_ms_median": statistics.median(process_ms),
+        "startup_to_show_ms_median": statistics.median(total_ms),
+    }
+    for name, values in phases.items():
+        results[f"startup_{name}_ms_median"] = statistics.median(values)
+    results["startup_plot_deferred_ms_median"] = statistics.median(plot_ms)
+    return results
+
+
+BENCHES = {"ingest": bench_ingest, "record": bench_record, "gui": bench_gui, "startup": bench_startup}
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Balance GUI performance benchmarks.")
+    p.add_argument("benches", nargs="*", metavar="bench",
+                   help=f"which benchmarks to run: {', '.join(BENCHES)} (default: all)")
+    p.add_argument("--seconds", type=float, default=5.0, help="duration of timed runs")
+    p.add_argument("--rate", type=float, default=100.0, help="simulated lines per second for gui")
+    p.add_argument("--fps", type=int, default=10, help="plot frame rate for gui")
+    p.add_argument("--samples", type=int, default=500_000, help="samples for record")
+    p.add_argument("--runs", type=int, default=5, help="fresh processes for startup")
+    p.add_argument("--json", help="also write results to this JSON file")
+    args = p.parse_args(argv)
+    unknown = set(args.benches) - set(BENCHES)
+    if unknown:
+        p.error(f"unknown benchmark: {', '.join(sorted(unknown))}")
+
+    results = {}
+    for name in args.benches or list(BENCHES):
+        results.update(BENCHES[name](args))
+    for key, value in results.items():
+        print(f"{key:36s} {value:12.2f}" if isinstance(value, float) else f"{key:36s} {value!s:>12}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,167 @@
+"""Запись данных весов без GUI.
+
+Пример:
+    python balance_cli.py --port COM3 --duration 3600 --out data
+
+Пишет в ту же структуру, что и GUI: <out>/exp_<ts>/data_<ts>_<порт>.bin (или .csv).
+Модуль не импортирует PyQt5 и matplotlib, поэтому запускается быстро и
+работает на машинах без дисплея.
+"""
+import os
+import sys
+import time
+import argparse
+
+import serial
+
+from balance_serial import FrameParser, FrameReader, read_batch
+from balance_recorder import StreamRecorder, port_file_name
+from balance_data import open_samples, export_csv
+from balance_commands import CommandScheduler
+from balance_publish import SamplePublisher
+from balance_clock import RateTracker, SessionClock
+from balance_discover import discover
+from balance_archive import SessionMarker, compress_file, folder_files
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Record balance readings without the GUI.")
+    p.add_argument("--port", required=True,
+                   help="serial port, e.g. COM3 or /dev/ttyUSB0; auto - find the balance (see balance_discover.py)")
+    p.add_argument("--baud", type=int, default=2400, help="baud rate (default 2400, detected with --port auto)")
+    p.add_argument("--duration", type=float, default=None,
+                   help="stop after this many seconds (default: until Ctrl+C)")
+    p.add_argument("--out", default="data", help="save folder (default: data)")
+    p.add_argument("--format", choices=("bin", "csv"), default="bin",
+                   help="recording format (default: bin)")
+    p.add_argument("--no-csv-export", action="store_true",
+                   help="do not export .bin recordings to .csv on exit")
+    p.add_argument("--status", type=float, default=5.0,
+                   help="status line interval in seconds, 0 to disable (default 5)")
+    p.add_argument("--flush", type=float, default=1.0, help="flush interval in seconds (default 1)")
+    p.add_argument("--no-fsync", action="store_true", help="do not fsync on flush")
+    p.add_argument("--rotate-mb", type=float, default=None, help="start a new segment every N MB")
+    p.add_argument("--rotate-hours", type=float, default=None, help="start a new segment every N hours")
+    p.add_argument("--poll", type=float, default=None,
+                   help="send E every N seconds (balances without continuous output)")
+    p.add_argument("--publish", type=int, default=None, metavar="PORT",
+                   help="publish samples to subscribers on this local port (see balance_publish.py)")
+    p.add_argument("--udp", action="store_true", help="publish over UDP instead of TCP")
+    p.add_argument("--archive", action="store_true",
+                   help="gzip the text files of the recording on exit (see balance_archive.py)")
+    return p.parse_args(argv)
+
+
+def _find_port():
+    """--port auto: первые найденные весы -> (порт, скорость) или None."""
+    found = [p for p in discover() if p.ok]
+    if not found:
+        print("No balance found on serial ports", file=sys.stderr)
+        return None
+    if len(found) > 1:
+        print(f"Found {len(found)} balances, using {found[0].port}: "
+              + ", ".join(p.port for p in found), file=sys.stderr)
+    return found[0].port, found[0].baud
+
+
+def record(args):
+    if args.port == "auto":
+        found = _find_port()
+        if found is None:
+            return 1
+        args.port, args.baud = found
+        print(f"Found balance on {args.port} at {args.baud} baud")
+    try:
+        conn = serial.Serial(port=args.port, baudrate=args.baud, timeout=0.5)
+    except serial.SerialException as e:
+        print(f"Failed to connect: {e}", file=sys.stderr)
+        return 1
+    clock = SessionClock()
+    ts = int(clock.start_ts)
+    folder = os.path.join(args.out, f"exp_{ts}")
+    recorder = StreamRecorder(
+        folder, f"data_{ts}_{port_file_name(args.port)}", clock.experiment_start, clock=clock,
+        flush_interval=args.flush, fsync=not args.no_fsync,
+        rotate_bytes=int(args.rotate_mb * 2**20) if args.rotate_mb else None,
+        rotate_seconds=args.rotate_hours * 3600 if args.rotate_hours else None,
+        fmt=args.format,
+    )
+    publisher = None
+    if args.publish is not None:
+        try:
+            publisher = SamplePublisher(port=args.publish, udp=args.udp)
+        except OSError as e:
+            print(f"Failed to publish on port {args.publish}: {e}", file=sys.stderr)
+            conn.close()
+            return 1
+    recorder.start()
+    # метка идущей сессии: sweep в GUI не сожмёт и не удалит эту папку
+    marker = SessionMarker(folder)
+    marker.touch()
+    print(f"Recording {args.port} to {folder} (Ctrl+C to stop)")
+
+    reader = FrameReader(conn)
+    parser = FrameParser()
+    rate = RateTracker(args.port)
+    commands = CommandScheduler(conn.write)
+    commands.start()
+    if args.poll:
+        commands.set_poll(args.poll)
+    count = 0
+    last = None
+    t_start = time.monotonic()
+    next_status = t_start + args.status if args.status else None
+    try:
+        while args.duration is None or time.monotonic() - t_start < args.duration:
+            try:
+                batch, _ = read_batch(reader, parser, clock, commands.on_lines)
+            except serial.SerialException as e:
+                print(f"Serial error: {e}", file=sys.stderr)
+                break
+            marker.touch()
+            if batch:
+                rate.add(batch[0][0], len(batch))
+                recorder.put_many(batch)
+                if publisher is not None:
+                    publisher.publish(args.port, batch, clock.wall_start)
+                count += len(batch)
+                last = batch[-1]
+            if next_status is not None and time.monotonic() >= next_status:
+                next_status += args.status
+                elapsed = time.monotonic() - t_start
+                value = "-" if last is None else f"{last[1]} {'S' if last[2] else ' '}"
+                print(f"[{elapsed:8.1f} s] samples: {count}  rate: {rate.rate:.2f}/s  "
+                      f"missed: {rate.missed}  last: {value}", flush=True)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if publisher is not None:
+            publisher.close()
+        commands.stop()
+        conn.close()
+        recorder.close()
+        marker.remove()
+
+    if recorder.error:
+        print(f"Recording failed: {recorder.error}", file=sys.stderr)
+        return 1
+    if args.format == "bin" and not args.no_csv_export:
+        for fname in recorder.files:
+            data = open_samples(fname)
+            export_csv(data, os.path.splitext(fname)[0] + ".csv", data.experiment_start)
+    if args.archive:
+        for fname in folder_files(folder):
+            try:
+                compress_file(fname)
+            except (OSError, ValueError) as e:
+                print(f"Failed to compress {fname}: {e}", file=sys.stderr)
+    print(f"Saved {count} samples to {folder}")
+    return 0
+
+
+def main(argv=None):
+    return record(parse_args(argv))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
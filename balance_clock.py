@@ -0,0 +1,171 @@
+"""Время сессии: монотонные метки отсчётов и привязка к настенным часам (без зависимостей от Qt).
+
+Метка отсчёта - time.perf_counter() в момент, когда байты пришли из
+порта, минус начало сессии. perf_counter монотонный и общий для всех
+процессов машины (CLOCK_MONOTONIC в Linux, QueryPerformanceCounter в
+Windows), поэтому дочерний процесс чтения пишет сырые метки, а родитель
+пересчитывает их от начала сессии. Перевод часов ОС (NTP, переход на
+летнее время) на метки не влияет; расхождение настенных часов с
+монотонными видно в clock.drift_ms и в опорных точках, которые
+StreamRecorder периодически пишет рядом с записью.
+"""
+import time
+import bisect
+from collections import deque
+from datetime import datetime
+
+from balance_metrics import METRICS
+
+_drift_ms = METRICS.gauge("clock.drift_ms")
+
+
+class SessionClock:
+    """Общий для всех весов отсчёт времени сессии.
+
+    wall_start - настенное время, которому соответствует elapsed = 0
+    (подключение первых весов); от него считают все потоки чтения, и
+    в ходе сессии оно не меняется. Начало эксперимента (Start, ручное
+    время старта) - отдельная отметка set_start(): experiment_start и
+    offset = elapsed в этот момент. Запись вычитает offset из времени
+    отсчётов; generation растёт при каждой новой отметке, и
+    StreamRecorder начинает с неё новый сегмент.
+    """
+
+    def __init__(self, wall_start=None):
+        mono, wall = time.perf_counter(), time.time()
+        self.start_ts = wall if wall_start is None else wall_start.timestamp()
+        self.wall_start = datetime.fromtimestamp(self.start_ts)
+        self.origin = mono - (wall - self.start_ts)
+        self.generation = 0
+        self.experiment_start = self.wall_start
+        self.offset = 0.0
+
+    def set_start(self, wall=None):
+        """Отметить начало эксперимента; wall - datetime (по умолчанию сейчас)."""
+        start_ts = time.time() if wall is None else wall.timestamp()
+        self.experiment_start = datetime.fromtimestamp(start_ts)
+        self.offset = start_ts - self.start_ts
+        self.generation += 1
+
+    @staticmethod
+    def now():
+        """Сырая монотонная метка (с), сравнимая между процессами."""
+        return time.perf_counter()
+
+    def elapsed(self, stamp=None):
+        """Секунды от начала сессии для метки stamp (по умолчанию - сейчас)."""
+        return (time.perf_counter() if stamp is None else stamp) - self.origin
+
+    def anchor(self):
+        """Опорная точка (elapsed, unix_time, drift_ms) и обновление clock.drift_ms.
+
+        drift_ms - насколько настенные часы ушли от монотонных с начала
+        сессии (подвели NTP, перевели вручную, разная частота кварцев).
+        """
+        mono, wall = time.perf_counter(), time.time()
+        elapsed = mono - self.origin
+        drift = (wall - self.start_ts - elapsed) * 1000
+        _drift_ms.set(round(drift, 3))
+        return elapsed, wall, drift
+
+
+class RateTracker:
+    """Частота отсчётов одного порта и пропущенные строки.
+
+    Все строки одного чтения имеют одну метку, поэтому сюда передаются
+    чтения: add(t, n) - n строк в момент t. Номинальный период - медиана
+    интервала на строку по последним history чтениям; если чтение пришло
+    позже чем gap_factor номинальных периодов на строку, недостающие
+    строки считаются пропущенными (rate.<имя>.missed).
+    """
+
+    def __init__(self, name=None, window=10.0, history=64, gap_factor=1.5):
+        self.window = window
+        self.gap_factor = gap_factor
+        self.missed = 0
+        self._reads = deque()           # (t, n) за последние window секунд
+        self._count = 0
+        self._periods = deque(maxlen=history)
+        self._sorted = []
+        self._last = None
+        if name:
+            self._rate = METRICS.gauge(f"rate.{name}.hz")
+            self._nominal = METRICS.gauge(f"rate.{name}.nominal_hz")
+            self._jitter = METRICS.gauge(f"rate.{name}.jitter_ms")
+            self._missed = METRICS.counter(f"rate.{name}.missed")
+        else:
+            self._rate = self._nominal = self._jitter = self._missed = None
+
+    def reset(self):
+        self._reads.clear()
+        self._count = 0
+        self._periods.clear()
+        self._sorted = []
+        self._last = None
+
+    def add(self, t, n=1):
+        last = self._last
+        self._last = t
+        if last is not None and t < last:
+            # метки пошли заново (новая сессия) - считаем с нуля
+            self.reset()
+            self._last = t
+        elif last is not None and t > last:
+            per_line = (t - last) / n
+            nominal = self.period
+            if nominal and per_line > self.gap_factor * nominal:
+                lost = round((t - last) / nominal) - n
+                if lost > 0:
+                    self.missed += lost
+                    if self._missed is not None:
+                        self._missed.add(lost)
+            if len(self._periods) == self._periods.maxlen:
+                self._sorted.pop(bisect.bisect_left(self._sorted, self._periods[0]))
+            self._periods.append(per_line)
+            bisect.insort(self._sorted, per_line)
+        reads = self._reads
+        reads.append((t, n))
+        self._count += n
+        while reads[0][0] < t - self.window:
+            self._count -= reads.popleft()[1]
+        if self._rate is not None:
+            self._rate.set(round(self.rate, 3))
+            nominal = self.period
+            self._nominal.set(round(1 / nominal, 3) if nominal else None)
+            jitter = self.jitter_ms
+            self._jitter.set(None if jitter is None else round(jitter, 3))
+
+    def extend(self, batch):
+        """Пачка (t, value, stable) из нескольких чтений - по группам с одной меткой."""
+        if not batch:
+            return
+        t0, n = batch[0][0], 0
+        for sample in batch:
+            if sample[0] != t0:
+                self.add(t0, n)
+                t0, n = sample[0], 0
+            n += 1
+        self.add(t0, n)
+
+    @property
+    def period(self):
+        """Номинальный интервал между строками (с) или None, пока мало данных."""
+        s = self._sorted
+        return s[len(s) // 2] if len(s) >= 4 else None
+
+    @property
+    def rate(self):
+        """Строк в секунду за последние window секунд."""
+        reads = self._reads
+        if len(reads) < 2:
+            return 0.0
+        span = reads[-1][0] - reads[0][0]
+        return (self._count - reads[0][1]) / span if span > 0 else 0.0
+
+    @property
+    def jitter_ms(self):
+        """Разброс интервала на строку (межквартильный, мс)."""
+        s = self._sorted
+        if len(s) < 4:
+            return None
+        return (s[3 * len(s) // 4] - s[len(s) // 4]) * 1000
@@ -0,0 +1,242 @@
+"""Очередь команд весам и опрос по E (без зависимостей от Qt).
+
+Команды пишет в порт только CommandScheduler - отдельный поток рядом
+с потоком чтения, поэтому GUI никогда не ждёт записи в порт, а команды
+из разных мест не перемешиваются. Каждая команда помечается временем
+постановки в очередь и отправки; если от команды ждут ответа, поток
+чтения передаёт сюда прочитанные строки (on_lines) и первая подходящая
+строка считается ответом.
+
+Режим опроса (set_poll) посылает E с заданным периодом для весов без
+непрерывного вывода. Моменты отправки считаются от одной опорной точки
+(anchor + k * period), поэтому ошибки таймера не накапливаются; если
+поток опоздал больше чем на период, пропущенные опросы не догоняются,
+а считаются в commands.poll_missed.
+"""
+import re
+import time
+import queue
+import logging
+import threading
+from collections import deque
+
+from balance_metrics import METRICS
+
+log = logging.getLogger(__name__)
+
+_sent = METRICS.counter("commands.sent")
+_timeouts = METRICS.counter("commands.timeouts")
+_errors = METRICS.counter("commands.errors")
+_reply_ms = METRICS.histogram("commands.reply_ms")
+_polls = METRICS.counter("commands.polls")
+_poll_missed = METRICS.counter("commands.poll_missed")
+_poll_late_ms = METRICS.histogram("commands.poll_late_ms")
+
+# какой строкой весы отвечают на команду (регулярное выражение);
+# у остальных команд ответа нет - они завершаются отправкой
+REPLIES = {
+    "E": r"\d",         # печать: строка с массой
+    "C": r"CAL",        # калибровка
+}
+
+
+class Command:
+    """Одна команда весам и её судьба.
+
+    Время - time.monotonic(); status: queued, sent (ответа не ждут или
+    ещё не пришёл), done, timeout, error.
+    """
+
+    def __init__(self, text, expect=None, timeout=2.0, id=0, poll=False):
+        self.id = id
+        self.text = text
+        self.expect = expect
+        self.timeout = timeout
+        self.poll = poll
+        self.queued_at = time.monotonic()
+        self.sent_at = None
+        self.reply_at = None
+        self.reply = None
+        self.status = "queued"
+        self.error = None
+
+    @property
+    def reply_ms(self):
+        if self.reply_at is None or self.sent_at is None:
+            return None
+        return (self.reply_at - self.sent_at) * 1000
+
+    def __repr__(self):
+        return f"Command({self.id}, {self.text!r}, {self.status})"
+
+
+def default_expect(text):
+    """Шаблон ответа на команду по умолчанию (см. REPLIES)."""
+    return REPLIES.get(text.upper())
+
+
+class CommandScheduler(threading.Thread):
+    """Поток, через который идут все записи в один порт.
+
+    write - функция записи байтов (serial.Serial.write);
+    on_done(command) - вызывается из этого потока или потока чтения,
+    когда команда получила ответ, ушла без ответа, истекла или упала.
+    Для команд опроса on_done не вызывается - их слишком много, они
+    идут только в метрики.
+    """
+
+    def __init__(self, write, on_done=None, poll_command="E"):
+        super().__init__(daemon=True)
+        self.write = write
+        self.on_done = on_done
+        self.poll_command = poll_command
+        self._queue = queue.SimpleQueue()
+        self._waiting = deque()         # отправленные команды, ждущие ответа
+        self._lock = threading.Lock()
+        self._next_id = 1
+        self._period = None
+        self._anchor = None
+        self._tick = 0
+        self._running = True
+
+    # ─── вызывается из любого потока ────────────────────────────────────
+    def submit(self, text, expect="default", timeout=2.0):
+        """Поставить команду в очередь и сразу вернуть её (без ожидания)."""
+        if expect == "default":
+            expect = default_expect(text)
+        with self._lock:
+            cmd = Command(text, expect, timeout, id=self._next_id)
+            self._next_id += 1
+        self.put(cmd)
+        return cmd
+
+    def put(self, cmd):
+        """Поставить в очередь готовую Command (например, пришедшую из другого процесса)."""
+        self._queue.put(cmd)
+
+    def set_poll(self, period):
+        """Опрашивать весы командой E каждые period секунд; None - выключить."""
+        self._queue.put(("poll", period))
+
+    @property
+    def poll_period(self):
+        return self._period
+
+    def stop(self):
+        self._running = False
+        self._queue.put(None)
+        if self.is_alive():
+            self.join(timeout=2)
+
+    # ─── вызывается потоком чтения ──────────────────────────────────────
+    def on_lines(self, lines, now=None):
+        """Сопоставить прочитанные строки командам, ждущим ответа (по порядку отправки)."""
+        if not self._waiting:
+            return
+        now = time.monotonic() if now is None else now
+        done = []
+        with self._lock:
+            for text in lines:
+                for cmd in self._waiting:
+                    if cmd.sent_at <= now and re.search(cmd.expect, text):
+                        cmd.reply, cmd.reply_at, cmd.status = text, now, "done"
+                        self._waiting.remove(cmd)
+                        done.append(cmd)
+                        break
+                if not self._waiting:
+                    break
+        for cmd in done:
+            _reply_ms.record(cmd.reply_ms)
+            self._finish(cmd)
+
+    # ─── поток записи ───────────────────────────────────────────────────
+    def run(self):
+        while self._running:
+            try:
+                item = self._queue.get(timeout=self._wait_time())
+            except queue.Empty:
+                item = False
+            if item is None:
+                break
+            if isinstance(item, tuple):
+                self._set_period(item[1])
+            elif item:
+                self._send(item)
+            self._poll_due()
+            self._expire()
+
+    def _wait_time(self):
+        now = time.monotonic()
+        waits = [0.5]
+        if self._period:
+            waits.append(self._anchor + self._tick * self._period - now)
+        with self._lock:
+            waits.extend(c.sent_at + c.timeout - now for c in self._waiting)
+        return max(0.0, min(waits))
+
+    def _set_period(self, period):
+        self._period = period if period and period > 0 else None
+        self._anchor = time.monotonic()
+        self._tick = 0
+
+    def _poll_due(self):
+        if not self._period:
+            return
+        now = time.monotonic()
+        due = self._anchor + self._tick * self._period
+        if now < due:
+            return
+        # пропущенные моменты не догоняем - следующий по сетке anchor + k*period
+        behind = int((now - due) / self._period)
+        if behind:
+            _poll_missed.add(behind)
+        self._tick += behind + 1
+        _poll_late_ms.record((now - (due + behind * self._period)) * 1000)
+        _polls.add()
+        with self._lock:
+            cmd = Command(self.poll_command, default_expect(self.poll_command),
+                          timeout=max(self._period, 1.0), id=self._next_id, poll=True)
+            self._next_id += 1
+        self._send(cmd)
+
+    def _send(self, cmd):
+        # в ожидающие - до записи: ответ может прочитаться раньше, чем write вернётся
+        cmd.sent_at = time.monotonic()
+        cmd.status = "sent"
+        if cmd.expect:
+            with self._lock:
+                self._waiting.append(cmd)
+        try:
+            self.write(f"{cmd.text}\r".encode("ascii"))
+        except Exception as e:
+            _errors.add()
+            with self._lock:
+                if cmd in self._waiting:
+                    self._waiting.remove(cmd)
+            cmd.status, cmd.error = "error", str(e)
+            log.warning("command %r failed: %s", cmd.text, e)
+            self._finish(cmd)
+            return
+        _sent.add()
+        if not cmd.expect:
+            self._finish(cmd)
+
+    def _expire(self):
+        now = time.monotonic()
+        expired = []
+        with self._lock:
+            # у команд разные таймауты: просроченные не только в голове очереди
+            for cmd in [c for c in self._waiting if now - c.sent_at >= c.timeout]:
+                self._waiting.remove(cmd)
+                cmd.status = "timeout"
+                expired.append(cmd)
+        for cmd in expired:
+            _timeouts.add()
+            self._finish(cmd)
+
+    def _finish(self, cmd):
+        if self.on_done is not None and not cmd.poll:
+            try:
+                self.on_done(cmd)
+            except Exception:
+                log.exception("command callback failed")
@@ -0,0 +1,611 @@
+"""Структуры данных для отсчётов весов (без зависимостей от Qt)."""
+import io
+import os
+import gzip
+import struct
+import warnings
+from datetime import datetime, timedelta
+
+import numpy as np
+
+
+class SampleRing:
+    """Кольцевой буфер фиксированной ёмкости: время, значение, флаг стабильности.
+
+    Память выделяется один раз, добавление - O(1); при заполнении самые
+    старые отсчёты перезаписываются.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = int(capacity)
+        self.t = np.empty(self.capacity, dtype=np.float64)
+        self.v = np.empty(self.capacity, dtype=np.float64)
+        self.stable = np.empty(self.capacity, dtype=np.bool_)
+        self._head = 0      # куда пишем следующий отсчёт
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def clear(self):
+        self._head = 0
+        self._size = 0
+
+    def append(self, t, value, stable):
+        i = self._head
+        self.t[i] = t
+        self.v[i] = np.nan if value is None else value
+        self.stable[i] = stable
+        self._head = (i + 1) % self.capacity
+        if self._size < self.capacity:
+            self._size += 1
+
+    def extend(self, t, values, stable):
+        """Добавить пачку отсчётов (массивы одинаковой длины)."""
+        t = np.asarray(t, dtype=np.float64)
+        values = np.asarray(values, dtype=np.float64)
+        stable = np.asarray(stable, dtype=np.bool_)
+        n = len(t)
+        if n >= self.capacity:
+            t, values, stable = t[-self.capacity:], values[-self.capacity:], stable[-self.capacity:]
+            n = self.capacity
+        first = min(n, self.capacity - self._head)
+        for dst, src in ((self.t, t), (self.v, values), (self.stable, stable)):
+            dst[self._head:self._head + first] = src[:first]
+            dst[:n - first] = src[first:]
+        self._head = (self._head + n) % self.capacity
+        self._size = min(self._size + n, self.capacity)
+
+    def last_time(self):
+        if not self._size:
+            return None
+        return float(self.t[self._head - 1])
+
+    def segments(self):
+        """Участки (t, v, stable) в хронологическом порядке - представления без копий."""
+        if self._size < self.capacity or self._head == 0:
+            start = (self._head - self._size) % self.capacity
+            end = start + self._size
+            return [(self.t[start:end], self.v[start:end], self.stable[start:end])]
+        h = self._head
+        return [
+            (self.t[h:], self.v[h:], self.stable[h:]),
+            (self.t[:h], self.v[:h], self.stable[:h]),
+        ]
+
+    def arrays(self):
+        """Копии (t, v, stable) в хронологическом порядке."""
+        segs = self.segments()
+        return tuple(np.concatenate([s[k] for s in segs]) for k in range(3))
+
+    def value_range(self):
+        """(min, max) значений без учёта NaN или None, если данных нет."""
+        lo = hi = None
+        for _, v, _ in self.segments():
+            if len(v) and not np.all(np.isnan(v)):
+                a, b = float(np.nanmin(v)), float(np.nanmax(v))
+                lo = a if lo is None else min(lo, a)
+                hi = b if hi is None else max(hi, b)
+        return None if lo is None else (lo, hi)
+
+    def window(self, t0, t1):
+        """Отсчёты с временем в [t0, t1] как пара массивов (t, v)."""
+        ts, vs = [], []
+        for t, v, _ in self.segments():
+            i0 = np.searchsorted(t, t0, side="left")
+            i1 = np.searchsorted(t, t1, side="right")
+            if i1 > i0:
+                ts.append(t[i0:i1])
+                vs.append(v[i0:i1])
+        if not ts:
+            return np.empty(0), np.empty(0)
+        if len(ts) == 1:
+            return ts[0], vs[0]
+        return np.concatenate(ts), np.concatenate(vs)
+
+    def decimated(self, t0, t1, columns):
+        """Видимый участок [t0, t1], прореженный decimate_minmax без копии всего буфера."""
+        ts, vs = [], []
+        for t, v, _ in self.segments():
+            i0 = np.searchsorted(t, t0, side="left")
+            i1 = np.searchsorted(t, t1, side="right")
+            if i1 > i0:
+                dt, dv = decimate_minmax(t[i0:i1], v[i0:i1], t0, t1, columns)
+                ts.append(dt)
+                vs.append(dv)
+        if not ts:
+            return np.empty(0), np.empty(0)
+        return np.concatenate(ts), np.concatenate(vs)
+
+
+def decimate_minmax(t, v, t0, t1, columns):
+    """Прореживание для отображения: min и max на каждый столбец пикселей.
+
+    Возвращает не более 2*columns точек; если данных меньше, они
+    возвращаются как есть. t должно быть отсортировано.
+    """
+    n = len(t)
+    columns = max(1, int(columns))
+    if n <= 2 * columns or t1 <= t0:
+        return t, v
+    edges = np.linspace(t0, t1, columns + 1)
+    starts = np.unique(np.searchsorted(t, edges[:-1], side="left"))
+    starts = starts[starts < n]
+    lo = np.fmin.reduceat(v, starts)
+    hi = np.fmax.reduceat(v, starts)
+    x = t[starts]
+    out_t = np.repeat(x, 2)
+    out_v = np.empty(2 * len(starts))
+    out_v[0::2] = lo
+    out_v[1::2] = hi
+    return out_t, out_v
+
+
+# ─── Компактное хранение и двоичный формат ──────────────────────────────
+#
+# Файл .bin: заголовок HEADER_SIZE байт (сигнатура, версия, размер
+# заголовка, время старта эксперимента как unix-время), затем записи
+# RECORD_DTYPE по 13 байт. Записи только дописываются, так что файл
+# можно читать, пока он пишется, а оборванный хвост просто отбрасывается.
+
+MAGIC = b"BALSMP\x00\x00"
+FORMAT_VERSION = 1
+HEADER_SIZE = 32
+_HEADER = struct.Struct("<8sHHd")
+RECORD_DTYPE = np.dtype([("t", "<f8"), ("v", "<f4"), ("flags", "u1")])
+FLAG_STABLE = 1
+FLAG_VALID = 2      # значение распознано (в CSV пустое поле, если нет)
+
+
+def pack_flags(stable, valid):
+    return (np.asarray(stable, dtype=np.uint8) * FLAG_STABLE
+            | np.asarray(valid, dtype=np.uint8) * FLAG_VALID)
+
+
+def pack_records(samples):
+    """Список (elapsed, value|None, stable) -> массив записей RECORD_DTYPE."""
+    rec = np.empty(len(samples), dtype=RECORD_DTYPE)
+    if not len(samples):
+        return rec
+    t, v, s = zip(*samples)
+    rec["t"] = t
+    values = np.array(v, dtype=np.float64)     # None -> nan
+    rec["v"] = values
+    rec["flags"] = pack_flags(s, ~np.isnan(values))
+    return rec
+
+
+def write_header(f, experiment_start):
+    f.write(_HEADER.pack(MAGIC, FORMAT_VERSION, HEADER_SIZE,
+                         experiment_start.timestamp()).ljust(HEADER_SIZE, b"\0"))
+
+
+class SampleStore:
+    """Растущее колоночное хранилище отсчётов в памяти.
+
+    Время - float64, значение - float32, флаги stable/valid упакованы в
+    один байт: 13 байт на отсчёт вместо ~100 у кортежа в списке.
+    """
+
+    def __init__(self, capacity=4096):
+        self._t = np.empty(capacity, dtype=np.float64)
+        self._v = np.empty(capacity, dtype=np.float32)
+        self._flags = np.empty(capacity, dtype=np.uint8)
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def clear(self):
+        self._size = 0
+
+    def drop_head(self, n):
+        """Выбросить первые n отсчётов; лишняя ёмкость (больше 4x) освобождается."""
+        n = min(n, self._size)
+        if n <= 0:
+            return
+        size = self._size - n
+        cap = len(self._t)
+        if cap > 4096 and cap > 4 * size:
+            cap = max(4096, 2 * size)
+        for name in ("_t", "_v", "_flags"):
+            old = getattr(self, name)
+            new = old if cap == len(old) else np.empty(cap, dtype=old.dtype)
+            new[:size] = old[n:self._size]
+            setattr(self, name, new)
+        self._size = size
+
+    def _reserve(self, n):
+        if n <= len(self._t):
+            return
+        cap = max(n, 2 * len(self._t))
+        for name in ("_t", "_v", "_flags"):
+            old = getattr(self, name)
+            new = np.empty(cap, dtype=old.dtype)
+            new[:self._size] = old[:self._size]
+            setattr(self, name, new)
+
+    def append(self, t, value, stable):
+        i = self._size
+        self._reserve(i + 1)
+        self._t[i] = t
+        if value is None:
+            self._v[i] = np.nan
+            self._flags[i] = FLAG_STABLE if stable else 0
+        else:
+            self._v[i] = value
+            self._flags[i] = (FLAG_STABLE if stable else 0) | FLAG_VALID
+        self._size = i + 1
+
+    def extend(self, t, values, stable):
+        values = np.asarray(values, dtype=np.float64)
+        n = len(values)
+        i = self._size
+        self._reserve(i + n)
+        self._t[i:i + n] = t
+        self._v[i:i + n] = values
+        self._flags[i:i + n] = pack_flags(stable, ~np.isnan(values))
+        self._size = i + n
+
+    @property
+    def t(self):
+        return self._t[:self._size]
+
+    @property
+    def v(self):
+        return self._v[:self._size]
+
+    @property
+    def flags(self):
+        return self._flags[:self._size]
+
+    @property
+    def stable(self):
+        return (self.flags & FLAG_STABLE).astype(bool)
+
+    @property
+    def valid(self):
+        return (self.flags & FLAG_VALID).astype(bool)
+
+    def records(self, start=0, stop=None):
+        """Отсчёты [start:stop] как массив записей RECORD_DTYPE."""
+        stop = self._size if stop is None else min(stop, self._size)
+        rec = np.empty(max(0, stop - start), dtype=RECORD_DTYPE)
+        rec["t"] = self._t[start:stop]
+        rec["v"] = self._v[start:stop]
+        rec["flags"] = self._flags[start:stop]
+        return rec
+
+    def save(self, fname, experiment_start):
+        """Записать хранилище в двоичный файл."""
+        with open(fname, "wb") as f:
+            write_header(f, experiment_start)
+            self.records().tofile(f)
+
+
+class SegmentStore:
+    """Общее хранилище отсчётов с именованными участками поверх него.
+
+    Участок - только индекс начала в store; при остановке он становится
+    срезом [start, stop) того же хранилища, без копии данных. Отсчёты
+    копятся, только пока открыт хоть один участок; compact() отбрасывает
+    всё до начала самого раннего открытого участка.
+    """
+
+    def __init__(self):
+        self.store = SampleStore()
+        self.base = 0       # сквозной номер отсчёта store[0]
+        self.open = {}      # имя участка -> сквозной номер первого отсчёта
+
+    def __len__(self):
+        return len(self.store)
+
+    @property
+    def end(self):
+        return self.base + len(self.store)
+
+    def start(self, name):
+        self.open[name] = self.end
+
+    def extend(self, t, values, stable):
+        if self.open:
+            self.store.extend(t, values, stable)
+
+    def first(self):
+        """Индекс в store начала самого раннего открытого участка (None, если их нет)."""
+        if not self.open:
+            return None
+        return min(self.open.values()) - self.base
+
+    def stop(self, name):
+        """Закрыть участок; вернуть его границы (start, stop) как индексы в store.
+
+        Границы действительны до вызова compact().
+        """
+        return self.open.pop(name) - self.base, len(self.store)
+
+    def compact(self):
+        """Освободить отсчёты до начала самого раннего открытого участка (все - если их нет).
+
+        Участки, перекрывающиеся без перерыва, так не держат всю сессию в памяти.
+        """
+        if not self.open:
+            self.base = self.end
+            self.store.clear()
+            return
+        n = self.first()
+        if n > 0:
+            self.store.drop_head(n)
+            self.base += n
+
+
+def open_binary(fname):
+    """Открыть файл на чтение; сжатый архивом (.gz) - прозрачно распаковывая."""
+    if fname.lower().endswith(".gz"):
+        return gzip.open(fname, "rb")
+    return open(fname, "rb")
+
+
+def _read_header(fname):
+    """Заголовок двоичного файла -> (время старта, размер заголовка)."""
+    with open_binary(fname) as f:
+        head = f.read(HEADER_SIZE)
+    if len(head) < _HEADER.size:
+        raise ValueError(f"{fname}: file is too short")
+    magic, version, header_size, start = _HEADER.unpack_from(head)
+    if magic != MAGIC:
+        raise ValueError(f"{fname}: not a balance sample file")
+    if version > FORMAT_VERSION:
+        raise ValueError(f"{fname}: unsupported format version {version}")
+    return datetime.fromtimestamp(start), header_size
+
+
+class SampleFile:
+    """Двоичный файл отсчётов, отображённый в память (только чтение).
+
+    Сжатый архивом .bin.gz в память не отображается, а читается целиком.
+    """
+
+    def __init__(self, fname):
+        self.fname = fname
+        self.experiment_start, header_size = _read_header(fname)
+        if fname.lower().endswith(".gz"):
+            with gzip.open(fname, "rb") as f:
+                f.seek(header_size)
+                data = f.read()
+            n = len(data) // RECORD_DTYPE.itemsize
+            self.records = np.frombuffer(data, dtype=RECORD_DTYPE, count=n)
+            return
+        n = (os.path.getsize(fname) - header_size) // RECORD_DTYPE.itemsize
+        if n > 0:
+            self.records = np.memmap(fname, dtype=RECORD_DTYPE, mode="r",
+                                     offset=header_size, shape=(n,))
+        else:
+            self.records = np.empty(0, dtype=RECORD_DTYPE)
+
+    def __len__(self):
+        return len(self.records)
+
+    @property
+    def t(self):
+        return self.records["t"]
+
+    @property
+    def v(self):
+        return self.records["v"]
+
+    @property
+    def flags(self):
+        return self.records["flags"]
+
+    @property
+    def stable(self):
+        return (self.flags & FLAG_STABLE).astype(bool)
+
+    @property
+    def valid(self):
+        return (self.flags & FLAG_VALID).astype(bool)
+
+
+def open_samples(fname):
+    return SampleFile(fname)
+
+
+def export_csv(samples, fname, experiment_start, header=False, start=0, stop=None,
+               chunk=100_000):
+    """Выгрузить отсчёты (SampleStore или SampleFile) в CSV прежнего формата.
+
+    Первая строка - время старта, затем (при header=True) заголовок
+    столбцов и строки elapsed, value, stable; нераспознанное значение -
+    пустое поле.
+    """
+    stop = len(samples) if stop is None else min(stop, len(samples))
+    with open(fname, "w", newline="") as f:
+        f.write(experiment_start.strftime("%H:%M:%S.%f") + "\r\n")
+        if header:
+            f.write("elapsed_sec,value,stable\r\n")
+        for i in range(start, stop, chunk):
+            j = min(i + chunk, stop)
+            t = samples.t[i:j].tolist()
+            # float32 печатаем по 7 значащим цифрам, без хвоста 0.1000000015
+            v = samples.v[i:j].astype(np.float64).tolist()
+            flags = samples.flags[i:j]
+            stable = (flags & FLAG_STABLE).astype(bool).tolist()
+            rows = ["%.6f,%.7g,%s\r\n" % row for row in zip(t, v, stable)]
+            for k in np.flatnonzero((flags & FLAG_VALID) == 0).tolist():
+                rows[k] = "%.6f,,%s\r\n" % (t[k], stable[k])
+            f.write("".join(rows))
+
+
+def _parse_csv_rows(text):
+    """Строки «elapsed,value,stable» -> (t, v, stable); пустое значение - nan."""
+    s = (text.replace("\r", "").replace(",True\n", ",1\n").replace(",False\n", ",0\n")
+         .replace(",,", ",nan,"))
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")     # пустой кусок
+            a = np.loadtxt(io.StringIO(s), delimiter=",", ndmin=2)
+        if a.size and a.shape[1] == 3:
+            return a[:, 0], a[:, 1], a[:, 2] != 0
+        if not a.size:
+            return np.empty(0), np.empty(0), np.empty(0, dtype=bool)
+    except ValueError:
+        pass
+    # медленный путь: построчно, пропуская испорченные строки
+    t, v, st = [], [], []
+    for line in s.splitlines():
+        parts = line.split(",")
+        if len(parts) < 3:
+            continue
+        try:
+            t.append(float(parts[0]))
+            v.append(float(parts[1]) if parts[1] else np.nan)
+        except ValueError:
+            continue
+        st.append(parts[2].strip() in ("1", "True"))
+    return np.array(t), np.array(v), np.array(st, dtype=bool)
+
+
+# насколько ручное время старта может быть раньше подключения (имени папки)
+_EARLY_START = 12 * 3600
+
+
+def _folder_time(fname):
+    """Время подключения из имени папки exp_<ts> или None."""
+    folder = os.path.basename(os.path.dirname(os.path.abspath(fname)))
+    if not folder.startswith("exp_"):
+        return None
+    try:
+        return float(folder[4:])
+    except ValueError:
+        return None
+
+
+def _last_elapsed(fname):
+    """elapsed_sec последней строки CSV или None."""
+    tail = b""
+    with open_binary(fname) as f:
+        if not fname.lower().endswith(".gz"):
+            f.seek(max(0, os.path.getsize(fname) - 4096))
+        while True:
+            data = f.read(1 << 20)
+            if not data:
+                break
+            tail = (tail + data)[-4096:]
+    for line in reversed(tail.split(b"\n")):
+        try:
+            return float(line.split(b",", 1)[0])
+        except ValueError:
+            continue
+    return None
+
+
+def _start_date(fname, t):
+    """Дата к времени старта t (datetime.time) из первой строки CSV.
+
+    Папка exp_<ts> - момент подключения: старт - первое такое время после
+    него (ручной старт может быть раньше, до _EARLY_START). Без папки -
+    ближайшее такое время к «дата изменения минус длительность записи».
+    По самой дате изменения нельзя: запись через полночь получила бы дату
+    конца, копия файла - дату копирования.
+    """
+    ref = _folder_time(fname)
+    if ref is not None:
+        ref -= _EARLY_START
+    else:
+        ref = os.path.getmtime(fname) - (_last_elapsed(fname) or 0.0) - _EARLY_START
+    day = datetime.fromtimestamp(ref).date()
+    start = datetime.combine(day, t)
+    if start.timestamp() < ref:
+        start = datetime.combine(day + timedelta(days=1), t)
+    return start
+
+
+class CsvReader:
+    """Чтение CSV программы (время старта, затем elapsed,value,stable) кусками.
+
+    Итерация даёт массивы (t, v, stable) по chunk байт текста, так что
+    многодневный файл не загружается в память целиком. В CSV есть только
+    время старта, дата восстанавливается (см. _start_date). Сжатый архивом
+    .csv.gz читается так же.
+    """
+
+    def __init__(self, fname, chunk=8 << 20):
+        self.fname = fname
+        self.chunk = chunk
+        with open_binary(fname) as f:
+            first = f.readline()
+        try:
+            t = datetime.strptime(first.decode("ascii", errors="ignore").strip(), "%H:%M:%S.%f").time()
+        except ValueError:
+            raise ValueError(f"{fname}: first line is not a start time")
+        self._offset = len(first)
+        self.position = 0       # прочитано байт текста (для индикатора хода)
+        self.experiment_start = _start_date(fname, t)
+
+    def __iter__(self):
+        with open_binary(self.fname) as f:
+            f.seek(self._offset)
+            self.position = self._offset
+            rest = b""
+            first = True
+            while True:
+                data = f.read(self.chunk)
+                self.position += len(data)
+                buf = rest + data
+                if data:
+                    end = buf.rfind(b"\n") + 1
+                    buf, rest = buf[:end], buf[end:]
+                elif buf and not buf.endswith(b"\n"):
+                    buf += b"\n"
+                if buf:
+                    text = buf.decode("ascii", errors="ignore")
+                    if first and text.startswith("elapsed_sec"):
+                        text = text.split("\n", 1)[1]
+                    first = False
+                    yield _parse_csv_rows(text)
+                if not data:
+                    break
+
+
+class BinReader:
+    """Чтение двоичного файла отсчётов кусками по chunk записей, как CsvReader.
+
+    Итерация даёт (t, v, stable); нераспознанное значение - nan. В отличие
+    от SampleFile, сжатый .bin.gz тоже читается по частям, а не целиком.
+    """
+
+    def __init__(self, fname, chunk=1 << 20):
+        self.fname = fname
+        self.chunk = chunk
+        self.experiment_start, self._offset = _read_header(fname)
+
+    def __iter__(self):
+        size = RECORD_DTYPE.itemsize
+        with open_binary(self.fname) as f:
+            f.seek(self._offset)
+            while True:
+                data = f.read(self.chunk * size)
+                n = len(data) // size      # недописанная последняя запись пропускается
+                if not n:
+                    break
+                rec = np.frombuffer(data, dtype=RECORD_DTYPE, count=n)
+                v = rec["v"].astype(np.float64)
+                v[(rec["flags"] & FLAG_VALID) == 0] = np.nan
+                yield rec["t"], v, (rec["flags"] & FLAG_STABLE) != 0
+
+
+def open_reader(fname):
+    """CsvReader или BinReader по расширению файла (.gz - сжатые архивом)."""
+    if fname.lower().endswith((".csv", ".csv.gz")):
+        return CsvReader(fname)
+    return BinReader(fname)
+
+
+def read_csv(fname):
+    """CSV программы целиком в SampleStore -> (store, experiment_start)."""
+    reader = CsvReader(fname)
+    store = SampleStore()
+    for t, v, stable in reader:
+        store.extend(t, v, stable)
+    return store, reader.experiment_start
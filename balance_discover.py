@@ -0,0 +1,217 @@
+"""Поиск весов на последовательных портах и подбор скорости (без зависимостей от Qt).
+
+Пример:
+    python balance_discover.py
+    python balance_discover.py --bauds 2400,9600 --no-query
+
+Все порты проверяются одновременно (пул потоков): на каждой скорости из
+списка порт слушается listen секунд, и если пришли строки в формате весов
+(FRAME_PATTERN), порт и скорость найдены. Весы без непрерывного вывода
+молчат - тогда им посылается E (query=False отключает запись в чужие
+порты). Удачная скорость запоминается в CACHE_FILE по серийному номеру
+адаптера и в следующий раз пробуется первой, так что знакомые весы
+находятся за одно прослушивание.
+"""
+import os
+import re
+import sys
+import json
+import time
+import logging
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+import serial
+import serial.tools.list_ports
+
+from balance_serial import FrameParser
+
+log = logging.getLogger(__name__)
+
+BAUD_RATES = (2400, 9600, 4800, 1200, 19200)
+CACHE_FILE = os.path.join(os.path.expanduser("~"), ".balance_ports.json")
+CACHE_VERSION = 1
+# строка весов: знак, число, единица, признак стабильности - "+  100.000 g S"
+FRAME_PATTERN = r"^[+-]?\s*\d+(?:\.\d+)?\s*(?:[a-zA-Z%]{1,3})?(?:\s+\S)?$"
+
+_frame_re = re.compile(FRAME_PATTERN)
+_parser = FrameParser()
+
+
+class Probe:
+    """Результат проверки одного порта; baud - None, если весы не найдены."""
+
+    def __init__(self, port, key, description=""):
+        self.port = port
+        self.key = key
+        self.description = description
+        self.baud = None
+        self.frames = 0
+        self.sample = None      # последняя распознанная строка
+        self.error = None
+        self.elapsed = 0.0
+
+    @property
+    def ok(self):
+        return self.baud is not None
+
+    def __repr__(self):
+        return f"Probe({self.port!r}, baud={self.baud}, frames={self.frames})"
+
+
+def is_frame(text):
+    """Похожа ли строка на вывод весов."""
+    return bool(_frame_re.match(text)) and _parser.parse(text)[0] is not None
+
+
+def device_key(info):
+    """Ключ адаптера для кэша: серийный номер, иначе VID:PID и место, иначе имя порта."""
+    if getattr(info, "serial_number", None):
+        return f"sn:{info.serial_number}"
+    if getattr(info, "vid", None) is not None:
+        return f"usb:{info.vid:04x}:{info.pid:04x}:{info.location or info.device}"
+    return f"port:{info.device}"
+
+
+def candidate_ports(skip=()):
+    """Порты системы (ListPortInfo), кроме skip."""
+    return [p for p in serial.tools.list_ports.comports() if p.device not in skip]
+
+
+def _listen(conn, seconds, enough):
+    """Слушать порт до seconds секунд -> (строки, распознанные строки, получено байт).
+
+    Прослушивание кончается раньше, как только распознано enough строк.
+    """
+    buf = bytearray()
+    lines, frames = [], []
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline and len(frames) < enough:
+        chunk = conn.read(max(conn.in_waiting, 1))
+        buf += chunk
+        if b"\n" in chunk:
+            lines = [s for s in (raw.decode("ascii", errors="ignore").strip()
+                                 for raw in buf.split(b"\n")[:-1]) if s]
+            frames = [s for s in lines if is_frame(s)]
+    return lines, frames, len(buf)
+
+
+def _try_baud(port, baud, listen, query, min_frames, opener):
+    """Проверить одну скорость -> (распознанных строк, последняя из них) или (0, None)."""
+    conn = opener(port=port, baudrate=baud, timeout=0.1)
+    try:
+        conn.reset_input_buffer()
+        lines, frames, got = _listen(conn, listen, min_frames)
+        if not got and query:
+            # молчит - возможно, весы без непрерывного вывода: просим одну строку
+            conn.write(b"E\r")
+            lines, frames, _ = _listen(conn, listen, 1)
+            min_frames = 1
+        if len(frames) >= min_frames and 2 * len(frames) >= len(lines):
+            return len(frames), frames[-1]
+        return 0, None
+    finally:
+        conn.close()
+
+
+def probe_port(port, bauds=BAUD_RATES, key=None, description="", listen=1.2, query=True,
+               min_frames=2, opener=serial.Serial):
+    """Проверить порт на скоростях bauds по очереди до первой подходящей."""
+    probe = Probe(port, key or f"port:{port}", description)
+    t0 = time.monotonic()
+    for baud in bauds:
+        try:
+            frames, sample = _try_baud(port, baud, listen, query, min_frames, opener)
+        except (OSError, serial.SerialException) as e:
+            # занят другой программой или нет прав - на других скоростях будет то же
+            probe.error = str(e)
+            break
+        if frames:
+            probe.baud, probe.frames, probe.sample = baud, frames, sample
+            break
+    probe.elapsed = time.monotonic() - t0
+    return probe
+
+
+def load_cache(path=CACHE_FILE):
+    try:
+        with open(path) as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if cache.get("version") != CACHE_VERSION:
+        return {}
+    return cache.get("devices", {})
+
+
+def save_cache(devices, path=CACHE_FILE):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump({"version": CACHE_VERSION, "devices": devices}, f, indent=1)
+    os.replace(tmp, path)
+
+
+def _order(bauds, first):
+    return ([first] if first else []) + [b for b in bauds if b != first]
+
+
+def discover(ports=None, bauds=BAUD_RATES, jobs=8, listen=1.2, query=True,
+             cache_file=CACHE_FILE, skip=()):
+    """Проверить порты параллельно -> список Probe (по порядку портов).
+
+    ports - список ListPortInfo или имён портов (по умолчанию все, кроме
+    skip); jobs - сколько портов проверяется одновременно; cache_file=None
+    - без кэша.
+    """
+    if ports is None:
+        ports = candidate_ports(skip)
+    cache = load_cache(cache_file) if cache_file else {}
+    tasks = []
+    for info in ports:
+        if isinstance(info, str):
+            port, key, description = info, f"port:{info}", ""
+        else:
+            port, key, description = info.device, device_key(info), info.description or ""
+        tasks.append((port, _order(bauds, cache.get(key, {}).get("baud")), key, description))
+    if not tasks:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, min(jobs, len(tasks)))) as pool:
+        probes = list(pool.map(
+            lambda task: probe_port(task[0], task[1], task[2], task[3], listen, query), tasks))
+    found = {p.key: {"port": p.port, "baud": p.baud, "seen": int(time.time())} for p in probes if p.ok}
+    if cache_file and found:
+        cache.update(found)
+        try:
+            save_cache(cache, cache_file)
+        except OSError as e:
+            log.warning("failed to save port cache: %s", e)
+    return probes
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Find balances on serial ports and detect their baud rate.")
+    p.add_argument("ports", nargs="*", help="ports to probe (default: all)")
+    p.add_argument("--bauds", default=",".join(map(str, BAUD_RATES)),
+                   help="comma-separated baud rates to try (default %(default)s)")
+    p.add_argument("--jobs", type=int, default=8, help="ports probed at once (default 8)")
+    p.add_argument("--listen", type=float, default=1.2, help="seconds to listen per baud rate (default 1.2)")
+    p.add_argument("--no-query", action="store_true", help="never send E to silent ports")
+    p.add_argument("--no-cache", action="store_true", help="do not read or update " + CACHE_FILE)
+    args = p.parse_args(argv)
+    bauds = [int(b) for b in args.bauds.split(",") if b.strip()]
+    t0 = time.perf_counter()
+    probes = discover(args.ports or None, bauds, args.jobs, args.listen, not args.no_query,
+                      None if args.no_cache else CACHE_FILE)
+    for probe in probes:
+        if probe.ok:
+            status = f"{probe.baud} baud, {probe.frames} frames, e.g. {probe.sample!r}"
+        else:
+            status = probe.error or "no balance"
+        print(f"{probe.port:<16} {status}  ({probe.elapsed:.1f} s)  {probe.description}")
+    found = sum(p.ok for p in probes)
+    print(f"{found} of {len(probes)} ports in {time.perf_counter() - t0:.1f} s")
+    return 0 if found else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,60 +1,431 @@
+import time
+_import_start = time.perf_counter()     # для замера запуска (STARTUP)
 import sys
 import os
 import serial
 import serial.tools.list_ports
 import re
-import csv
+import logging
+import multiprocessing
 from datetime import datetime
+
+from balance_metrics import METRICS, PhaseTimer, StatsFile, format_snapshot
+
+# этапы запуска: startup.<этап>_ms на вкладке Diagnostics и в balance_bench.py startup
+STARTUP = PhaseTimer("startup", _import_start)
+STARTUP.mark("import_base")
+
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QWidget,
     QTabWidget, QVBoxLayout, QHBoxLayout,
     QLabel, QComboBox, QLineEdit, QPushButton,
-    QMessageBox, QSizePolicy, QGroupBox,
+    QMessageBox, QSizePolicy, QGroupBox, QSpinBox, QCheckBox, QPlainTextEdit,
+    QFileDialog, QProgressBar,
 )
-from PyQt5.QtCore import Qt, QTimer, QThread, pyqtSignal
-from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
-from matplotlib.figure import Figure
+from PyQt5.QtCore import Qt, QTimer, QThread, QObject, pyqtSignal
+STARTUP.mark("import_qt")
+
+from balance_data import SampleRing, SegmentStore, decimate_minmax, export_csv
+from balance_recorder import StreamRecorder, port_file_name
+from balance_serial import FrameParser, FrameReader, ReadRetry, read_batch
+from balance_shm import AcquisitionProcess
+from balance_stats import RollingStats, StatsLog
+from balance_commands import CommandScheduler
+from balance_viewer import Recording
+from balance_publish import SamplePublisher
+from balance_clock import RateTracker, SessionClock
+from balance_discover import BAUD_RATES, discover, load_cache
+from balance_archive import Archiver, SessionMarker
+from balance_merge import METHODS, merge_files
+STARTUP.mark("import_app")
+
+
+log = logging.getLogger(__name__)
+
+AUTO_CAPACITY = 2_000_000     # сколько отсчётов хранит график
+# политика записи на диск (см. StreamRecorder)
+RECORD_FLUSH_INTERVAL = 1.0   # с; 0 - сбрасывать после каждой пачки
+RECORD_FSYNC = True
+RECORD_ROTATE_BYTES = None    # например 100 * 2**20 - новый сегмент каждые 100 МБ
+RECORD_ROTATE_SECONDS = None  # например 24 * 3600 - новый сегмент раз в сутки
+RECORD_FORMAT = "bin"         # "bin" - компактный двоичный, "csv" - текст
+RECORD_EXPORT_CSV = False     # при выходе выгрузить .bin в .csv прежнего формата (в фоне, до сжатия)
+ACQUISITION_PROCESS = False   # по умолчанию читать порт в отдельном процессе
+SHARED_RING_CAPACITY = 1 << 20  # отсчётов в общей памяти на одни весы
+STATS_INTERVAL = 10           # с; как часто писать метрики в stats_<ts>.jsonl
+ROLLING_DRIFT_WINDOW = 600    # с; окно для дрейфа (г/ч)
+ROLLING_STABLE_STD = 0.002    # г; программная стабильность: СКО в окне меньше этого
+ROLLING_STABLE_RATE = 0.0005  # г/с; ... и |скорость| меньше этой
+PUBLISH_HOST = "127.0.0.1"    # раздача отсчётов (balance_publish); "0.0.0.0" - для всей сети
+PUBLISH_PORT = 5025
+DEFAULT_BAUD = 2400           # скорость порта, если поиск весов её не определил
+# архивация завершённых экспериментов (см. balance_archive)
+ARCHIVE_ENABLED = True        # сжимать CSV закрытых сессий и локальных записей в .gz
+ARCHIVE_COMPRESS_BIN = False  # сжимать и .bin (тогда Viewer распаковывает их в кэш)
+ARCHIVE_MAX_BYTES = None      # например 50 * 2**30 - удалять старые exp_* сверх 50 ГБ
+ARCHIVE_MAX_AGE_DAYS = None   # например 365 - удалять exp_* старше года
+ARCHIVE_EXIT_WAIT = 30        # с; сколько при выходе ждать архивацию (остальное - при следующей сессии)
 
+_serial_errors = METRICS.counter("serial.errors")
+_emitted = METRICS.counter("gui.batches_emitted")
+_handled = METRICS.counter("gui.batches_handled")
+_queue_depth = METRICS.gauge("gui.signal_queue")
+_gui_samples = METRICS.counter("gui.samples")
+_batch_ms = METRICS.histogram("gui.handle_batch_ms")
+_delay_ms = METRICS.histogram("gui.read_to_handle_ms")
+_frame_ms = METRICS.histogram("render.frame_ms")
+_full_frames = METRICS.counter("render.full")
+_blit_frames = METRICS.counter("render.blit")
+
+
+def _matplotlib():
+    """Импорт matplotlib при первой надобности: (Figure, FigureCanvas, NavigationToolbar).
+
+    matplotlib - самая долгая часть запуска, а график нужен не всем:
+    окно открывается без него, а вкладки с графиками строят его сами.
+    """
+    if "matplotlib.backends.backend_qt5agg" not in sys.modules:
+        with STARTUP.phase("import_matplotlib"):
+            import matplotlib.backends.backend_qt5agg
+            import matplotlib.figure
+    from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg, NavigationToolbar2QT
+    from matplotlib.figure import Figure
+    return Figure, FigureCanvasQTAgg, NavigationToolbar2QT
 
 
 class StreamThread(QThread):
-    """Поток постоянного чтения из порта."""
-    new_data = pyqtSignal(float, float, bool)  # (elapsed_sec, value, stable)
+    """Поток постоянного чтения из порта.
+
+    Порт вычитывается крупными кусками (FrameReader), а все строки,
+    пришедшие за одно чтение, уходят в GUI одним сигналом. Время
+    отсчётов - по монотонным часам сессии (clock), в момент чтения.
+    """
+    new_batch = pyqtSignal(str, object)  # (устройство, список (elapsed_sec, value|None, stable))
+    command_done = pyqtSignal(str, object)  # (устройство, Command)
+    read_error = pyqtSignal(str, object)    # (устройство, текст ошибки или None - снова читается)
 
-    def __init__(self, serial_conn, experiment_start):
+    def __init__(self, serial_conn, clock, parser=None, device=""):
         super().__init__()
         self.serial_conn = serial_conn
-        self.experiment_start = experiment_start
+        self.device = device
+        self.clock = clock
+        self.parser = parser or FrameParser()
+        self.reader = FrameReader(serial_conn)
+        self.rate = RateTracker(device)     # частота и пропуски строк
+        # команды пишет отдельный поток рядом с этим, а не GUI
+        self.commands = CommandScheduler(serial_conn.write,
+                                         on_done=lambda cmd: self.command_done.emit(self.device, cmd))
+        self.recorder = None    # StreamRecorder, пока идёт запись
+        self.publisher = None   # SamplePublisher, если включена раздача
+        self.last_raw = None
         self._running = True
 
     def run(self):
+        self.commands.start()
+        retry = ReadRetry()
         while self._running:
             try:
-                raw = self.serial_conn.readline()             # блокирует, ждёт новой строки
-                text = raw.decode('ascii', errors='ignore').strip()
-                if not text:
+                # ждёт данные не дольше таймаута порта
+                batch, raw = read_batch(self.reader, self.parser, self.clock,
+                                        self.commands.on_lines)
+                if not batch:
                     continue
-                self.last_raw = text
-                # парсим число
-                m = re.search(r"([\d.]+)", text)
-                val = float(m.group(1)) if m else None
-                stable = False
-                if len(text) >= 13 and text[12].upper() == 'S':
-                    stable = True
-                # время от старта
-                elapsed = (datetime.now() - self.experiment_start).total_seconds()
+                self.last_raw = raw
+                self.rate.add(batch[0][0], len(batch))
+                # на диск - напрямую из этого потока, мимо GUI
+                recorder = self.recorder
+                if recorder is not None:
+                    recorder.put_many(batch)
+                # подписчикам - тоже отсюда; publish() не ждёт сеть
+                publisher = self.publisher
+                if publisher is not None:
+                    publisher.publish(self.device, batch, self.clock.wall_start)
                 # сигналим GUI
-                self.new_data.emit(elapsed, val, stable)
-            except Exception:
-                # при ошибке просто продолжаем
-                continue
+                _emitted.add()
+                self.new_batch.emit(self.device, batch)
+                if retry.ok():
+                    log.info("%s: reading again", self.device)
+                    self.read_error.emit(self.device, None)
+            except Exception as e:
+                # при ошибке повторяем с растущей паузой, а порт, который не
+                # читается READ_GIVE_UP с (весы отключили), бросаем
+                _serial_errors.add()
+                event, delay = retry.failed()
+                if event == "error":
+                    log.warning("%s: read error: %s", self.device, e)
+                    self.read_error.emit(self.device, str(e))
+                elif event == "stopped":
+                    log.warning("%s: stopped reading: %s", self.device, e)
+                    self.read_error.emit(self.device, f"stopped reading: {e}")
+                    break
+                # паузу - кусками, чтобы stop() не ждал её целиком
+                resume = time.monotonic() + delay
+                while self._running and time.monotonic() < resume:
+                    self.msleep(50)
 
     def stop(self):
         self._running = False
         self.wait()  # дождаться завершения
+        self.commands.stop()
+
+
+class ProcessStream(QObject):
+    """Приёмник отсчётов от AcquisitionProcess - замена StreamThread.
+
+    Порт читает дочерний процесс; здесь по таймеру GUI из общей памяти
+    забирается всё накопившееся. Если GUI был занят, данные просто ждут
+    в кольце, а не в буфере порта.
+    """
+    new_batch = pyqtSignal(str, object)
+    command_done = pyqtSignal(str, object)
+    dropped_changed = pyqtSignal(int)
+    read_error = pyqtSignal(str, object)    # (устройство, текст ошибки или None - снова читается)
+
+    def __init__(self, proc, clock, device="", interval_ms=50, max_batch=100_000):
+        super().__init__()
+        self.proc = proc
+        self.commands = proc        # submit/set_poll - очередь команд в дочернем процессе
+        self.device = device
+        self.clock = clock
+        self.rate = RateTracker(device)
+        self.max_batch = max_batch
+        self.recorder = None
+        self.publisher = None
+        self.last_raw = None
+        self._dropped = 0
+        self.timer = QTimer()
+        self.timer.setInterval(interval_ms)
+        self.timer.timeout.connect(self.poll)
+
+    def start(self):
+        self.timer.start()
+
+    def poll(self):
+        for cmd in self.proc.done_commands():
+            self.command_done.emit(self.device, cmd)
+        for kind, text in self.proc.status_messages():
+            if kind == "stopped":
+                self.timer.stop()
+                text = f"stopped reading: {text}"
+            self.read_error.emit(self.device, text)
+        # дочерний процесс пишет сырые метки perf_counter - считаем от начала сессии
+        batch = self.proc.read_new(self.max_batch, self.clock.origin)
+        if self.proc.dropped != self._dropped:
+            self._dropped = self.proc.dropped
+            self.dropped_changed.emit(self._dropped)
+        if not batch:
+            return
+        self.last_raw = self.proc.raw()
+        self.rate.extend(batch)
+        recorder = self.recorder
+        if recorder is not None:
+            recorder.put_many(batch)
+        publisher = self.publisher
+        if publisher is not None:
+            publisher.publish(self.device, batch, self.clock.wall_start)
+        _emitted.add()
+        self.new_batch.emit(self.device, batch)
+
+    def stop(self):
+        self.timer.stop()
+        if self.proc.is_open:
+            self.poll()
+
+
+class DiscoveryThread(QThread):
+    """Поиск весов на свободных портах (balance_discover) в фоне, чтобы GUI не ждал."""
+    finished_probes = pyqtSignal(object)   # список Probe
+
+    def __init__(self, skip=()):
+        super().__init__()
+        self.skip = set(skip)
+
+    def run(self):
+        try:
+            probes = discover(skip=self.skip)
+        except Exception as e:
+            log.warning("port discovery failed: %s", e)
+            probes = []
+        self.finished_probes.emit(probes)
+
+
+class RecordingLoader(QThread):
+    """Открытие записей для Viewer в фоне: разбор CSV в кэш и пирамида min/max."""
+    progress = pyqtSignal(str, int)     # (что делается, процент или -1 - неизвестно)
+    finished_load = pyqtSignal(object, object, float)   # записи, [(файл, ошибка)], секунды
+
+    def __init__(self, files):
+        super().__init__()
+        self.files = files
+        self._last = None
+
+    def run(self):
+        t0 = time.perf_counter()
+        recordings, errors = [], []
+        for i, fname in enumerate(self.files):
+            prefix = f"{os.path.basename(fname)} ({i + 1}/{len(self.files)})"
+            self._report(f"Opening {prefix}", 0)
+
+            def progress(stage, fraction, prefix=prefix):
+                self._report(f"Opening {prefix}: {stage}", -1 if fraction is None else int(fraction * 100))
+            try:
+                recordings.append(Recording(fname, progress))
+            except (OSError, ValueError) as e:
+                errors.append((fname, str(e)))
+        self.finished_load.emit(recordings, errors, time.perf_counter() - t0)
+
+    def _report(self, text, percent):
+        # сигнал - только когда что-то изменилось, а не на каждый кусок
+        if (text, percent) != self._last:
+            self._last = (text, percent)
+            self.progress.emit(text, percent)
+
+
+class MergeThread(QThread):
+    """Выравнивание записей по времени (balance_merge) в фоне."""
+    finished_merge = pyqtSignal(object, object)    # (строк, столбцы) или None, текст ошибки
+
+    def __init__(self, files, out, step, method):
+        super().__init__()
+        self.files, self.out, self.step, self.method = files, out, step, method
+
+    def run(self):
+        try:
+            result, error = merge_files(self.files, self.out, step=self.step, method=self.method), None
+        except (OSError, ValueError) as e:
+            result, error = None, str(e)
+        self.finished_merge.emit(result, error)
+
+
+class BalanceDevice:
+    """Одни подключённые весы: порт, поток чтения, данные графика и записи."""
+
+    def __init__(self, name, serial_conn, stream_thread, line):
+        self.name = name
+        self.serial_conn = serial_conn
+        self.stream_thread = stream_thread
+        self.line = line
+        self.ring = SampleRing(AUTO_CAPACITY)
+        self.local = SegmentStore()       # локальные записи - участки этого хранилища
+        self.recorder = None
+        self.stats = RollingStats(drift_window=ROLLING_DRIFT_WINDOW,
+                                  stable_std=ROLLING_STABLE_STD, stable_rate=ROLLING_STABLE_RATE)
+        self.mean_ring = SampleRing(AUTO_CAPACITY // 10)  # скользящее среднее - точка на пачку
+        self.stats_log = None
+        self.read_error = None            # последняя ошибка чтения порта, пока не прошла
+
+    def close_stats_log(self):
+        if self.stats_log:
+            self.stats_log.close()
+            self.stats_log = None
+
+    def close(self):
+        self.stream_thread.stop()
+        # процесс чтения мог уже завершиться сам, но память и очереди
+        # за ним всё равно нужно освободить
+        if isinstance(self.serial_conn, AcquisitionProcess) or self.serial_conn.is_open:
+            self.serial_conn.close()
+
+
+class RenderScheduler:
+    """Перерисовка графика с фиксированной частотой кадров.
+
+    Данные копятся между кадрами, по таймеру вызывается prepare(), который
+    обновляет линии и пределы осей. Если пределы не изменились, линии
+    дорисовываются поверх сохранённого фона (blitting), иначе - полная
+    перерисовка холста. Холст подключается attach(), когда график
+    построен; до этого запросы кадров только запоминаются.
+    """
 
+    def __init__(self, prepare, fps=10):
+        self.canvas = None
+        self.ax = None
+        self.artists = []
+        self.prepare = prepare
+        self._background = None
+        self._limits = None
+        self._dirty = False
+        self._invalid = True
+        self.frames = 0             # счётчики для диагностики и balance_bench.py
+        self.full_frames = 0
+        self.last_frame_ms = None
+        self.timer = QTimer()
+        self.timer.timeout.connect(self._on_tick)
+        self.set_fps(fps)
+        self.timer.start()
 
+    def attach(self, canvas, ax, artists):
+        self.canvas = canvas
+        self.ax = ax
+        for artist in artists:
+            self.add_artist(artist)
+        # любая полная перерисовка (в т.ч. при ресайзе) обновляет фон
+        self.canvas.mpl_connect("draw_event", self._on_draw)
 
+    def set_fps(self, fps):
+        self.fps = max(1, int(fps))
+        self.timer.setInterval(int(1000 / self.fps))
+
+    def request(self):
+        """Пометить, что появились новые данные."""
+        self._dirty = True
+
+    def invalidate(self):
+        """Запросить полную перерисовку в следующем кадре."""
+        self._invalid = True
+        self._dirty = True
+
+    def add_artist(self, artist):
+        artist.set_animated(True)
+        self.artists.append(artist)
+        self.invalidate()
+
+    def remove_artist(self, artist):
+        self.artists.remove(artist)
+        self.invalidate()
+
+    def stop(self):
+        self.timer.stop()
+
+    def _on_draw(self, event):
+        self._background = self.canvas.copy_from_bbox(self.ax.bbox)
+        self._draw_artists()
+
+    def _draw_artists(self):
+        for artist in self.artists:
+            self.ax.draw_artist(artist)
+
+    def _on_tick(self):
+        if not self._dirty or self.canvas is None:
+            return
+        if not self.canvas.isVisible():
+            # вкладка скрыта - нарисуем целиком, когда её покажут
+            self._invalid = True
+            return
+        t0 = time.perf_counter()
+        self._dirty = False
+        self.prepare()
+        limits = (self.ax.get_xlim(), self.ax.get_ylim())
+        full = self._invalid or self._background is None or limits != self._limits
+        if full:
+            self._invalid = False
+            self._limits = limits
+            self.canvas.draw()
+        else:
+            self.canvas.restore_region(self._background)
+            self._draw_artists()
+            self.canvas.blit(self.ax.bbox)
+        dt = (time.perf_counter() - t0) * 1000
+        self.last_frame_ms = dt
+        self.frames += 1
+        self.full_frames += full
+        _frame_ms.record(dt)
+        (_full_frames if full else _blit_frames).add()
+        budget = 1000 / self.fps
+        log.debug("frame %s: %.1f ms", "full" if full else "blit", dt)
+        if dt > budget:
+            log.warning("frame %s took %.1f ms (budget %.1f ms)",
+                        "full" if full else "blit", dt, budget)
 
 
 class MainWindow(QMainWindow):
@@ -63,22 +434,19 @@ class MainWindow(QMainWindow):
         self.setWindowTitle("Balance GUI")
         self.resize(800, 600)
 
-        self.serial_conn = None # Переменная для последовательного соединения
-        self.stream_thread = None
-        self.experiment_start = None    #время начала эксперимента
+        self.devices = {}                 # порт -> BalanceDevice
+        self.clock = None                 # SessionClock: время сессии и начало эксперимента
         self.connection_time = None
         self.recording = False
-        self.collected_data = []          # список (delta_ms, value, stable_flag)
-        self.auto_x = []
-        self.auto_y = []
-        self.auto_timer = QTimer()
-        self.auto_timer.timeout.connect(self._on_auto_tick)
-        self.local_recording = False
-        self.local_experiment_start = None
-        self.local_buffer = []
-        self.local_x = []
-        self.local_y = []
+        self.closed_recorders = []        # записи отключённых весов
+        self._failed_recorders = set()    # упавшие записи, о которых уже сообщено
+        self.publisher = None             # SamplePublisher, пока включена раздача
+        self.archiver = None              # Archiver, фоновое сжатие закрытых записей
+        self.session_marker = None        # SessionMarker: папку сессии не трогают другие сессии
+        self.local_segments = set()       # имена идущих локальных записей (участки - в dev.local)
         self.auto_name_counter = 0
+        self._y_lo = None   # текущий диапазон данных по Y
+        self._y_hi = None
 
         # Основной виджет: вкладки
         self.tabs = QTabWidget()
@@ -94,19 +462,30 @@ class MainWindow(QMainWindow):
         self.tabs.addTab(self.tab_commands, "Commands")
         self._init_commands_tab()
 
-        # Вкладка 3: Auto Commands
-        self.fig_auto = Figure(figsize=(5,3))
-        self.ax_auto = self.fig_auto.add_subplot(111)
-        self.line_auto, = self.ax_auto.plot(self.auto_x, self.auto_y, 'b-', lw=1, label="All data")
-        self.line_local, = self.ax_auto.plot(self.local_x, self.local_y, 'r.', markersize=4, label="Local recording")
+        # Вкладка 3: Auto Commands; сам график - при первом показе или первых данных
+        self.fig_auto = self.ax_auto = self.canvas_auto = None
+        self.line_local = self.line_mean = None
         self.tab_auto = QWidget()
         self.tabs.addTab(self.tab_auto, "Auto Commands")
         self._init_auto_tab()
+        self.render = RenderScheduler(self._prepare_frame, fps=self.spin_fps.value())
+
+        # Вкладка 4: Diagnostics
+        self.tab_diag = QWidget()
+        self.tabs.addTab(self.tab_diag, "Diagnostics")
+        self._init_diag_tab()
+
+        # Вкладка 5: просмотр сохранённых записей
+        self.tab_view = QWidget()
+        self.tabs.addTab(self.tab_view, "Viewer")
+        self._init_view_tab()
+        self.tabs.currentChanged.connect(self._on_tab_changed)
 
         if getattr(sys, 'frozen', False):
             self.base_dir = os.path.dirname(sys.executable)
         else:
             self.base_dir = os.getcwd()
+        STARTUP.mark("window")
 
     def _init_com_tab(self):
         layout = QVBoxLayout()
@@ -117,12 +496,46 @@ class MainWindow(QMainWindow):
         btn_refresh = QPushButton("Refresh")
         btn_refresh.clicked.connect(self.populate_ports)
         h_layout.addWidget(btn_refresh)
+        h_layout.addWidget(QLabel("Baud:"))
+        self.combo_baud = QComboBox()
+        self.combo_baud.addItems([str(b) for b in sorted(BAUD_RATES)])
+        self.combo_baud.setCurrentText(str(DEFAULT_BAUD))
+        h_layout.addWidget(self.combo_baud)
         layout.addLayout(h_layout)
+        self.btn_discover = QPushButton("Find balances")
+        self.btn_discover.setToolTip("Probe all free ports at once, detect the baud rate and connect")
+        self.btn_discover.clicked.connect(self.find_balances)
+        layout.addWidget(self.btn_discover)
+        self.discovery = None
         self.btn_connect = QPushButton("Connect")
         self.btn_connect.clicked.connect(self.connect_port)
         layout.addWidget(self.btn_connect)
+        self.btn_disconnect = QPushButton("Disconnect")
+        self.btn_disconnect.clicked.connect(self.disconnect_port)
+        layout.addWidget(self.btn_disconnect)
+        self.chk_process = QCheckBox("Read port in a separate process")
+        self.chk_process.setChecked(ACQUISITION_PROCESS)
+        layout.addWidget(self.chk_process)
         self.lbl_status = QLabel("Not connected")
         layout.addWidget(self.lbl_status)
+        h_active = QHBoxLayout()
+        h_active.addWidget(QLabel("Commands go to:"))
+        self.combo_active = QComboBox()
+        self.combo_active.currentTextChanged.connect(lambda _: self.render.invalidate())
+        h_active.addWidget(self.combo_active)
+        layout.addLayout(h_active)
+        h_publish = QHBoxLayout()
+        self.chk_publish = QCheckBox("Publish samples on port")
+        self.chk_publish.toggled.connect(self.toggle_publish)
+        h_publish.addWidget(self.chk_publish)
+        self.input_publish_port = QLineEdit(str(PUBLISH_PORT))
+        self.input_publish_port.setMaximumWidth(60)
+        h_publish.addWidget(self.input_publish_port)
+        self.combo_publish = QComboBox()
+        self.combo_publish.addItems(["TCP", "UDP"])
+        h_publish.addWidget(self.combo_publish)
+        h_publish.addStretch()
+        layout.addLayout(h_publish)
         save_layout = QHBoxLayout()
         save_layout.addWidget(QLabel("Save folder (relative):"))
         self.input_rel_path = QLineEdit("data")
@@ -143,6 +556,7 @@ class MainWindow(QMainWindow):
         self.btn_onoff.clicked.connect(self.toggle_onoff)
         layout.addWidget(self.btn_onoff)
         self.tab_com.setLayout(layout)
+        self.combo_ports.currentTextChanged.connect(self._on_port_selected)
         self.populate_ports()
 
     def _init_commands_tab(self):
@@ -198,7 +612,13 @@ class MainWindow(QMainWindow):
         hold_layout.addWidget(btn_h_tare)
         hold_group.setLayout(hold_layout)
         layout.addWidget(hold_group)
-        layout.addStretch()
+
+        # ─── Журнал команд: отправка, ответ и время ответа ────────────────
+        layout.addWidget(QLabel("Command log:"))
+        self.output_view = QPlainTextEdit()
+        self.output_view.setReadOnly(True)
+        self.output_view.setMaximumBlockCount(1000)
+        layout.addWidget(self.output_view)
 
         self.tab_commands.setLayout(layout)
 
@@ -214,6 +634,17 @@ class MainWindow(QMainWindow):
         self.start_button = QPushButton(f"Start")
         self.start_button.clicked.connect(self.toggle_recording)
         left_panel.addWidget(self.start_button)
+        # опрос командой E - для весов без непрерывного вывода
+        poll_row = QHBoxLayout()
+        self.chk_poll = QCheckBox("Poll (E) every")
+        self.chk_poll.toggled.connect(lambda _: self._apply_poll())
+        poll_row.addWidget(self.chk_poll)
+        self.input_poll = QLineEdit("1.0")
+        self.input_poll.setMaximumWidth(50)
+        self.input_poll.returnPressed.connect(self._apply_poll)
+        poll_row.addWidget(self.input_poll)
+        poll_row.addWidget(QLabel("s"))
+        left_panel.addLayout(poll_row)
         left_panel.addStretch()
 
         self.input_filename = QLineEdit()
@@ -222,8 +653,12 @@ class MainWindow(QMainWindow):
         self.btn_extra_start = QPushButton("Local start")
         self.btn_extra_start.clicked.connect(self.extra_start)
         left_panel.addWidget(self.btn_extra_start)
+        self.combo_segments = QComboBox()
+        self.combo_segments.setToolTip("Local recordings in progress")
+        left_panel.addWidget(self.combo_segments)
         self.btn_extra_stop = QPushButton("Stop & Save")
         self.btn_extra_stop.clicked.connect(self.extra_stop_and_save)
+        self.btn_extra_stop.setEnabled(False)
         left_panel.addWidget(self.btn_extra_stop)
         left_panel.addStretch()
 
@@ -263,21 +698,315 @@ class MainWindow(QMainWindow):
         ctrl.addWidget(self.input_ymax)
         self.btn_autoscale_y = QPushButton("Autoscale Y")
         ctrl.addWidget(self.btn_autoscale_y)
+        ctrl.addWidget(QLabel("FPS:"))
+        self.spin_fps = QSpinBox()
+        self.spin_fps.setRange(1, 60)
+        self.spin_fps.setValue(10)
+        self.spin_fps.valueChanged.connect(lambda v: self.render.set_fps(v))
+        ctrl.addWidget(self.spin_fps)
         right_panel.addLayout(ctrl)
+
+        # скользящая статистика активных весов
+        stats_ctrl = QHBoxLayout()
+        stats_ctrl.addWidget(QLabel("Stats window (s):"))
+        self.input_stats_window = QLineEdit("60")
+        self.input_stats_window.setMaximumWidth(60)
+        self.input_stats_window.returnPressed.connect(self._reset_rolling_stats)
+        stats_ctrl.addWidget(self.input_stats_window)
+        stats_ctrl.addWidget(QLabel("Rate window (s):"))
+        self.input_rate_window = QLineEdit("10")
+        self.input_rate_window.setMaximumWidth(60)
+        self.input_rate_window.returnPressed.connect(self._reset_rolling_stats)
+        stats_ctrl.addWidget(self.input_rate_window)
+        self.chk_mean_trace = QCheckBox("Mean trace")
+        self.chk_mean_trace.toggled.connect(lambda _: self.render.invalidate())
+        stats_ctrl.addWidget(self.chk_mean_trace)
+        self.chk_save_stats = QCheckBox("Save stats")
+        stats_ctrl.addWidget(self.chk_save_stats)
+        stats_ctrl.addStretch()
+        right_panel.addLayout(stats_ctrl)
+        self.lbl_stats = QLabel("Mean: -   Std: -   Rate: -   Drift: -")
+        right_panel.addWidget(self.lbl_stats)
         self.input_window.returnPressed.connect(self._update_x_axis)
         self.input_ymin.returnPressed.connect(self._update_y_axis)
         self.input_ymax.returnPressed.connect(self._update_y_axis)
         self.btn_reset_x.clicked.connect(self._reset_x_axis)
         self.btn_autoscale_y.clicked.connect(self._reset_y_axis)
 
-        self.canvas_auto = FigureCanvas(self.fig_auto)
-        right_panel.addWidget(self.canvas_auto)
+        self.plot_area = QVBoxLayout()     # сюда _ensure_plot() положит холст
+        right_panel.addLayout(self.plot_area, 1)
 
         main_layout.addLayout(left_panel, 1)
         main_layout.addLayout(right_panel, 3)
         self.tab_auto.setLayout(main_layout)
 
+    def _init_diag_tab(self):
+        layout = QVBoxLayout()
+        self.diag_view = QPlainTextEdit()
+        self.diag_view.setReadOnly(True)
+        self.diag_view.setStyleSheet("font-family: monospace;")
+        layout.addWidget(self.diag_view)
+        self.chk_stats_file = QCheckBox(f"Write stats to file every {STATS_INTERVAL} s")
+        layout.addWidget(self.chk_stats_file)
+        self.tab_diag.setLayout(layout)
+        self._diag_prev = None
+        self._diag_prev_time = None
+        self._stats_last = time.monotonic()
+        self.diag_timer = QTimer()
+        self.diag_timer.timeout.connect(self._refresh_diagnostics)
+        self.diag_timer.start(1000)
+
+    def _check_recorders(self):
+        """Сообщить об упавшей записи сразу, а не при выходе."""
+        failed = [d for d in self.devices.values() if d.recorder and d.recorder.error]
+        if not failed:
+            return
+        self._update_status()       # счётчик потерянных отсчётов в строке состояния
+        new = [d for d in failed if d.recorder not in self._failed_recorders]
+        self._failed_recorders.update(d.recorder for d in new)
+        for dev in new:
+            QMessageBox.critical(self, "Error", f"Recording from {dev.name} failed: {dev.recorder.error}\n"
+                                 "New samples are not saved until recording is restarted.")
+
+    def _refresh_diagnostics(self):
+        """Раз в секунду: обновить панель (если видна) и при необходимости файл метрик."""
+        # сигналы, отправленные потоками чтения, но ещё не обработанные GUI
+        _queue_depth.set(_emitted.value - _handled.value)
+        self._check_recorders()
+        if self.session_marker is not None:
+            self.session_marker.touch()     # раз в минуту; папка могла появиться только что
+        now = time.monotonic()
+        write_file = self.chk_stats_file.isChecked() and now - self._stats_last >= STATS_INTERVAL
+        if not write_file and not self.tab_diag.isVisible():
+            return
+        if self.clock is not None:
+            self.clock.anchor()     # обновить clock.drift_ms
+        snap = METRICS.snapshot()
+        for name, dev in self.devices.items():
+            if isinstance(dev.serial_conn, AcquisitionProcess):
+                snap[f"shm.{name}.dropped"] = dev.serial_conn.dropped
+        if self.tab_diag.isVisible():
+            dt = now - self._diag_prev_time if self._diag_prev_time else None
+            self.diag_view.setPlainText(format_snapshot(snap, self._diag_prev, dt))
+            self._diag_prev, self._diag_prev_time = snap, now
+        if write_file:
+            self._stats_last = now
+            base = getattr(self, "save_base", os.path.join(self.base_dir, "data"))
+            folder = os.path.join(base, f"exp_{self.connection_ts}") if hasattr(self, "connection_ts") else base
+            try:
+                os.makedirs(folder, exist_ok=True)
+                StatsFile(os.path.join(folder, f"stats_{getattr(self, 'connection_ts', 0)}.jsonl")).write(snap)
+            except OSError as e:
+                log.warning("failed to write stats: %s", e)
+
+    def _init_view_tab(self):
+        layout = QVBoxLayout()
+        top = QHBoxLayout()
+        self.btn_open = QPushButton("Open experiment...")
+        self.btn_open.clicked.connect(self.open_experiment)
+        top.addWidget(self.btn_open)
+        self.lbl_view = QLabel("No recording opened")
+        top.addWidget(self.lbl_view, 1)
+        self.view_progress = QProgressBar()
+        self.view_progress.setFixedWidth(120)
+        self.view_progress.hide()
+        top.addWidget(self.view_progress)
+        self.view_loader = None
+        # выгрузка открытых записей одной таблицей на общей сетке времени
+        top.addWidget(QLabel("Step, s:"))
+        self.input_merge_step = QLineEdit()
+        self.input_merge_step.setPlaceholderText("every sample")
+        self.input_merge_step.setFixedWidth(90)
+        top.addWidget(self.input_merge_step)
+        self.combo_merge_method = QComboBox()
+        self.combo_merge_method.addItems(METHODS)
+        top.addWidget(self.combo_merge_method)
+        self.btn_export_aligned = QPushButton("Export aligned...")
+        self.btn_export_aligned.clicked.connect(self.export_aligned)
+        top.addWidget(self.btn_export_aligned)
+        self.merge_thread = None
+        layout.addLayout(top)
+        self.fig_view = self.ax_view = self.canvas_view = None   # см. _ensure_view_plot()
+        self.view_layout = layout
+        self.tab_view.setLayout(layout)
+        self.view_recordings = []     # (Recording, линия)
+        # после панорамирования/масштаба линии пересобираются под новое окно
+        self.view_timer = QTimer()
+        self.view_timer.setSingleShot(True)
+        self.view_timer.setInterval(30)
+        self.view_timer.timeout.connect(self._refine_view)
+
+    def _ensure_view_plot(self):
+        """Построить график вкладки Viewer (и импортировать matplotlib) при первой надобности."""
+        if self.canvas_view is not None:
+            return
+        Figure, FigureCanvas, NavigationToolbar = _matplotlib()
+        with STARTUP.phase("view_plot"):
+            self.fig_view = Figure(figsize=(5, 3))
+            self.ax_view = self.fig_view.add_subplot(111)
+            self.ax_view.set_xlabel("Elapsed, s")
+            self.canvas_view = FigureCanvas(self.fig_view)
+            self.view_layout.addWidget(NavigationToolbar(self.canvas_view, self.tab_view))
+            self.view_layout.addWidget(self.canvas_view)
+            self.ax_view.callbacks.connect("xlim_changed", lambda _: self.view_timer.start())
+
+    def _ensure_plot(self):
+        """Построить график вкладки Auto Commands при первом показе или первых данных."""
+        if self.canvas_auto is not None:
+            return
+        Figure, FigureCanvas, _ = _matplotlib()
+        with STARTUP.phase("auto_plot"):
+            self.fig_auto = Figure(figsize=(5, 3))
+            self.ax_auto = self.fig_auto.add_subplot(111)
+            self.line_local, = self.ax_auto.plot([], [], 'r.', markersize=4, label="Local recording")
+            self.line_mean, = self.ax_auto.plot([], [], 'k--', lw=1, label="Rolling mean")
+            self.canvas_auto = FigureCanvas(self.fig_auto)
+            self.plot_area.addWidget(self.canvas_auto)
+            self.render.attach(self.canvas_auto, self.ax_auto, (self.line_local, self.line_mean))
+            for i, dev in enumerate(self.devices.values()):
+                self._add_line(dev, first=i == 0)
+        self._update_y_axis(redraw=False)
+        self._update_x_axis()
+
+    def _add_line(self, dev, first):
+        line, = self.ax_auto.plot([], [], 'b-' if first else '-', lw=1, label=dev.name)
+        dev.line = line
+        self.render.add_artist(line)
+        if sum(d.line is not None for d in self.devices.values()) > 1:
+            self.ax_auto.legend(loc="upper left")
+
+    def _on_tab_changed(self, index):
+        tab = self.tabs.widget(index)
+        if tab is self.tab_auto:
+            self._ensure_plot()
+        elif tab is self.tab_view:
+            self._ensure_view_plot()
+
+    def open_experiment(self):
+        """Открыть сохранённые записи (.bin или .csv) для просмотра.
+
+        Файлы не читаются целиком: на экран идёт обзор из пирамиды min/max,
+        который уточняется до отдельных отсчётов при увеличении.
+        """
+        folder = os.path.join(self.base_dir, self.input_rel_path.text().strip() or ".")
+        files, _ = QFileDialog.getOpenFileNames(
+            self, "Open experiment", folder, "Recordings (*.bin *.csv *.bin.gz *.csv.gz);;All files (*)")
+        if files:
+            self.show_recordings(files)
+
+    def export_aligned(self):
+        """Выгрузить открытые записи одной CSV-таблицей на общей сетке времени."""
+        if self.merge_thread is not None:
+            return
+        if not self.view_recordings:
+            QMessageBox.warning(self, "Warning", "Open one or more recordings first.")
+            return
+        txt = self.input_merge_step.text().strip()
+        try:
+            step = float(txt) if txt else None
+        except ValueError:
+            QMessageBox.warning(self, "Warning", "Step must be a number of seconds.")
+            return
+        if step is not None and step <= 0:
+            QMessageBox.warning(self, "Warning", "Step must be positive.")
+            return
+        files = [rec.fname for rec, _ in self.view_recordings]
+        out, _ = QFileDialog.getSaveFileName(
+            self, "Export aligned", os.path.join(os.path.dirname(files[0]), "aligned.csv"), "CSV (*.csv)")
+        if not out:
+            return
+        self.btn_export_aligned.setEnabled(False)
+        self.btn_export_aligned.setText("Exporting...")
+        self.merge_thread = MergeThread(files, out, step, self.combo_merge_method.currentText())
+        self.merge_thread.finished_merge.connect(self._on_merge_done)
+        self.merge_thread.start()
+
+    def _on_merge_done(self, result, error):
+        out = self.merge_thread.out
+        self.merge_thread.wait()
+        self.merge_thread = None
+        self.btn_export_aligned.setEnabled(True)
+        self.btn_export_aligned.setText("Export aligned...")
+        if error:
+            QMessageBox.critical(self, "Error", f"Не удалось выгрузить записи: {error}")
+        elif not result[0]:
+            QMessageBox.warning(self, "Export aligned", "The recordings do not overlap in time.")
+        else:
+            dropped = f" {result[2]} samples with timestamps going backwards were dropped." if result[2] else ""
+            QMessageBox.information(self, "Export aligned", f"{result[0]} rows saved to {out}.{dropped}")
+
+    def show_recordings(self, files):
+        """Открыть записи в фоне (первый раз CSV разбирается и строится пирамида), затем показать."""
+        if self.view_loader is not None:
+            return
+        self._ensure_view_plot()
+        self._view_text = self.lbl_view.text()     # вернуть, если ничего не откроется
+        self.btn_open.setEnabled(False)
+        self.view_progress.setValue(0)
+        self.view_progress.show()
+        self.view_loader = RecordingLoader(files)
+        self.view_loader.progress.connect(self._on_view_progress)
+        self.view_loader.finished_load.connect(self._on_recordings_loaded)
+        self.view_loader.start()
+
+    def _on_view_progress(self, text, percent):
+        self.lbl_view.setText(text)
+        if percent < 0:
+            self.view_progress.setRange(0, 0)   # бегущая полоса - размер неизвестен
+        else:
+            self.view_progress.setRange(0, 100)
+            self.view_progress.setValue(percent)
+
+    def _on_recordings_loaded(self, recordings, errors, load_s):
+        self.view_loader.wait()
+        self.view_loader = None
+        self.btn_open.setEnabled(True)
+        self.view_progress.hide()
+        for fname, error in errors:
+            QMessageBox.critical(self, "Error", f"Не удалось открыть «{fname}»: {error}")
+        if not recordings:
+            self.lbl_view.setText(self._view_text)
+            return
+        for _, line in self.view_recordings:
+            line.remove()
+        self.view_recordings = []
+        x_lo = y_lo = None
+        for rec in recordings:
+            style = 'b-' if not self.view_recordings else '-'
+            line, = self.ax_view.plot([], [], style, lw=1, label=os.path.basename(rec.fname))
+            self.view_recordings.append((rec, line))
+            tr, vr = rec.time_range(), rec.value_range()
+            if tr:
+                x_lo, x_hi = (tr if x_lo is None else (min(x_lo, tr[0]), max(x_hi, tr[1])))
+            if vr:
+                y_lo, y_hi = (vr if y_lo is None else (min(y_lo, vr[0]), max(y_hi, vr[1])))
+        if len(recordings) > 1:
+            self.ax_view.legend(loc="upper left")
+        elif self.ax_view.get_legend():
+            self.ax_view.get_legend().remove()
+        if y_lo is not None:
+            margin = (y_hi - y_lo) * 0.05 or 0.1
+            self.ax_view.set_ylim(y_lo - margin, y_hi + margin)
+        if x_lo is not None:
+            self.ax_view.set_xlim(x_lo, x_hi if x_hi > x_lo else x_lo + 1)
+        self._refine_view()
+        n = sum(len(rec) for rec in recordings)
+        span = (x_hi - x_lo) / 3600 if x_lo is not None else 0
+        self.lbl_view.setText(
+            f"{', '.join(os.path.basename(rec.fname) for rec in recordings)}: {n} samples, "
+            f"{span:.1f} h, opened in {load_s:.2f} s")
+
+    def _refine_view(self):
+        """Линии просмотра для текущего окна: обзор или отсчёты, ~2 точки на пиксель."""
+        x0, x1 = self.ax_view.get_xlim()
+        columns = int(self.ax_view.bbox.width) or 1
+        for rec, line in self.view_recordings:
+            line.set_data(*rec.query(x0, x1, columns))
+        self.canvas_view.draw_idle()
+
     def populate_ports(self):
+        # скорости, найденные раньше поиском весов, - чтобы подставить их при выборе порта
+        self._known_bauds = {d.get("port"): d.get("baud") for d in load_cache().values()}
         self.combo_ports.clear()
         ports = serial.tools.list_ports.comports()
         if ports:
@@ -286,78 +1015,247 @@ class MainWindow(QMainWindow):
         else:
             self.combo_ports.addItem("No ports found")
 
+    @property
+    def active_device(self):
+        """Весы, на которые идут команды и чей вывод показан на графике."""
+        return self.devices.get(self.combo_active.currentText())
+
+    @property
+    def serial_conn(self):
+        dev = self.active_device
+        return dev.serial_conn if dev else None
+
+    def _on_port_selected(self, port):
+        baud = self._known_bauds.get(port)
+        if baud:
+            self.combo_baud.setCurrentText(str(baud))
+
+    def find_balances(self):
+        """Найти весы на всех свободных портах и подключить найденные."""
+        if self.discovery is not None:
+            return
+        self.btn_discover.setEnabled(False)
+        self.btn_discover.setText("Searching...")
+        self.discovery = DiscoveryThread(skip=self.devices)
+        self.discovery.finished_probes.connect(self._on_balances_found)
+        self.discovery.start()
+
+    def _on_balances_found(self, probes):
+        self.discovery.wait()
+        self.discovery = None
+        self.btn_discover.setEnabled(True)
+        self.btn_discover.setText("Find balances")
+        self.populate_ports()
+        found = [p for p in probes if p.ok]
+        if not found:
+            QMessageBox.information(self, "Find balances", f"No balances found on {len(probes)} free ports.")
+            return
+        for probe in found:
+            self.combo_ports.setCurrentText(probe.port)
+            self.combo_baud.setCurrentText(str(probe.baud))
+            self._open_port(probe.port, probe.baud)
+
     def connect_port(self):
+        """Подключить выбранный порт в дополнение к уже подключённым."""
         selected = self.combo_ports.currentText()
         if selected in ("", "No ports found"):
             QMessageBox.warning(self, "Warning", "No valid port selected.")
             return
+        self._open_port(selected, int(self.combo_baud.currentText()))
+
+    def _open_port(self, selected, baud):
+        if selected in self.devices:
+            # повторное подключение того же порта
+            self._remove_device(selected)
+        # первые весы открывают сессию: общая папка и общий отсчёт времени
+        new_session = not self.devices
+        clock = SessionClock() if new_session else self.clock
         try:
-            if self.serial_conn and self.serial_conn.is_open:
-                self.serial_conn.close()
-            self.serial_conn = serial.Serial(port=selected, baudrate=2400, timeout=1)
-            self.lbl_status.setText(f"Connected to {selected}")
+            if self.chk_process.isChecked():
+                serial_conn = AcquisitionProcess(selected, baud, capacity=SHARED_RING_CAPACITY)
+                serial_conn.start()
+            else:
+                serial_conn = serial.Serial(port=selected, baudrate=baud, timeout=1)
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"Failed to connect: {e}")
+            self._update_status()
+            return
+        self.add_device(selected, serial_conn, clock)
+
+    def add_device(self, name, serial_conn, clock=None):
+        """Начать чтение уже открытого порта (serial.Serial или AcquisitionProcess)."""
+        if name in self.devices:
+            self._remove_device(name)
+        if not self.devices:
+            # первые весы открывают сессию: общая папка и общий отсчёт времени
             self.connectiont = datetime.now()
-            self.experiment_start = datetime.now()
+            self.clock = clock or SessionClock()
             rel = self.input_rel_path.text().strip() or "."
             base = os.path.join(self.base_dir, rel)
             self.save_base = base
-            self.connection_ts = int(self.experiment_start.timestamp())
-            self.collected_data.clear()
-            self.last_data = None
-            self.stream_thread = StreamThread(self.serial_conn, self.experiment_start)
-            self.stream_thread.new_data.connect(self.handle_new_data)
-            self.stream_thread.start()
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"Failed to connect: {e}")
+            self.connection_ts = int(self.clock.start_ts)
+            self.session_marker = SessionMarker(os.path.join(base, f"exp_{self.connection_ts}"))
+            # прошлые сессии уже закрыты - доархивировать их и применить срок хранения
+            self._archive("sweep", base, self._open_folders())
+        self.last_data = None
+        if isinstance(serial_conn, AcquisitionProcess):
+            stream_thread = ProcessStream(serial_conn, self.clock, device=name)
+            stream_thread.dropped_changed.connect(lambda _: self._update_status())
+        else:
+            stream_thread = StreamThread(serial_conn, self.clock, device=name)
+        stream_thread.read_error.connect(self._on_read_error)
+        dev = BalanceDevice(name, serial_conn, stream_thread, None)
+        stats_w, rate_w = self._rolling_windows()
+        dev.stats.reset(stats_window=stats_w, rate_window=rate_w)
+        self.devices[name] = dev
+        if self.ax_auto is not None:
+            self._add_line(dev, first=len(self.devices) == 1)
+        if self.recording:
+            self._start_recorder(dev)
+        stream_thread.publisher = self.publisher
+        stream_thread.new_batch.connect(self.handle_new_batch)
+        stream_thread.command_done.connect(self._on_command_done)
+        stream_thread.start()
+        if self.chk_poll.isChecked():
+            self._apply_poll([dev])
+        self.combo_active.addItem(name)
+        self._update_status()
+
+    def disconnect_port(self):
+        """Отключить выбранный порт; записанное им остаётся на диске."""
+        selected = self.combo_ports.currentText()
+        if selected not in self.devices:
+            QMessageBox.warning(self, "Warning", f"{selected} is not connected.")
+            return
+        self._remove_device(selected)
+        self._update_status()
+
+    def _remove_device(self, name):
+        dev = self.devices.pop(name)
+        dev.close()
+        dev.close_stats_log()
+        if dev.recorder:
+            dev.recorder.close()
+            self.closed_recorders.append(dev.recorder)
+        if dev.line is not None:
+            self.render.remove_artist(dev.line)
+            dev.line.remove()
+        self.combo_active.removeItem(self.combo_active.findText(name))
+
+    def _on_read_error(self, device, text):
+        dev = self.devices.get(device)
+        if dev is None:
+            return
+        dev.read_error = text
+        self._update_status()
+        if text and text.startswith("stopped"):
+            QMessageBox.warning(self, "Warning", f"{device}: {text}. Reconnect the balance.")
+
+    def _update_status(self):
+        if self.devices:
+            names = []
+            for name, dev in self.devices.items():
+                if isinstance(dev.serial_conn, AcquisitionProcess):
+                    # сколько отсчётов GUI не успел забрать из общей памяти
+                    name += f" (dropped: {dev.serial_conn.dropped})"
+                if dev.read_error:
+                    name += f" ({dev.read_error})"
+                if dev.recorder and dev.recorder.error:
+                    name += f" (recording failed, {dev.recorder.dropped} samples lost)"
+                names.append(name)
+            self.lbl_status.setText(f"Connected to {', '.join(names)}")
+        else:
             self.lbl_status.setText("Not connected")
 
+    def toggle_publish(self, checked):
+        """Раздача отсчётов всех весов подписчикам по TCP/UDP (см. balance_publish.py)."""
+        if self.publisher:
+            for dev in self.devices.values():
+                dev.stream_thread.publisher = None
+            self.publisher.close()
+            self.publisher = None
+        if checked:
+            try:
+                port = int(self.input_publish_port.text())
+                self.publisher = SamplePublisher(PUBLISH_HOST, port,
+                                                 udp=self.combo_publish.currentText() == "UDP")
+            except (ValueError, OSError) as e:
+                QMessageBox.critical(self, "Error", f"Failed to start publishing: {e}")
+                self.chk_publish.setChecked(False)
+                return
+            for dev in self.devices.values():
+                dev.stream_thread.publisher = self.publisher
+        self.input_publish_port.setEnabled(not checked)
+        self.combo_publish.setEnabled(not checked)
+
     def send_command(self):
         cmd = self.input_cmd.text().strip()
+        self.input_cmd.clear()
         if not re.fullmatch(r"[TtCcEeMmOo]", cmd):
             QMessageBox.warning(self, "Invalid", "Command must be one of T,C,E,M,O (case-sensitive)")
-            self.input_cmd.clear()
             return
-        if not self.serial_conn or not self.serial_conn.is_open:
-            QMessageBox.warning(self, "Not connected", "Please connect to a COM port first.")
-            self.input_cmd.clear()
-            return
-        try:
-            self.serial_conn.write((cmd + "\r").encode('ascii'))
-        except Exception as e:
-            self.output_view.setText(f"Error: {e}")
-        finally:
-            self.input_cmd.clear()
-    
+        self._send_manual(cmd)
+
     def _send_manual(self, cmd: str):
-        """Универсальный метод отправки команд одной буквой."""
-        if not hasattr(self, "serial_conn") or not self.serial_conn or not self.serial_conn.is_open:
+        """Универсальный метод отправки команд одной буквой.
+
+        Команда только ставится в очередь весов (CommandScheduler) - GUI не
+        ждёт порт; результат и ответ приходят в _on_command_done.
+        """
+        dev = self.active_device
+        if dev is None or not dev.serial_conn.is_open:
             QMessageBox.warning(self, "Not connected", "Please connect to a COM port first.")
-            return
-        try:
-            self.serial_conn.write(f"{cmd}\r".encode('ascii'))
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"Failed to send command {cmd}: {e}")
+            return None
+        command = dev.stream_thread.commands.submit(cmd)
+        self._log_command(dev.name, f"> {cmd}")
+        return command
+
+    def _on_command_done(self, device, cmd):
+        if cmd.status == "done":
+            text = f"< {cmd.text}: {cmd.reply}  ({cmd.reply_ms:.0f} ms)"
+        elif cmd.status == "sent":
+            text = f"  {cmd.text}: sent"
+        elif cmd.status == "timeout":
+            text = f"! {cmd.text}: no reply in {cmd.timeout:g} s"
+        else:
+            text = f"! {cmd.text}: {cmd.error}"
+        self._log_command(device, text)
+
+    def _log_command(self, device, text):
+        self.output_view.appendPlainText(f"{datetime.now():%H:%M:%S.%f}"[:-3] + f"  {device}  {text}")
 
     def toggle_onoff(self):
-        if not self.serial_conn or not self.serial_conn.is_open:
-            QMessageBox.warning(self, "Not connected", "Please connect to a COM port first.")
-            self.input_cmd.clear()
-            return
-        try:
-            self.serial_conn.write(("O\r").encode('ascii'))
-        except Exception as e:
-            self.output_view.setText(f"Error: {e}")
+        self._send_manual("O")
+
+    def _apply_poll(self, devices=None):
+        """Режим опроса: E с постоянным периодом для весов без непрерывного вывода."""
+        period = None
+        if self.chk_poll.isChecked():
+            try:
+                period = float(self.input_poll.text())
+                if period <= 0:
+                    raise ValueError
+            except ValueError:
+                QMessageBox.warning(self, "Invalid", "Poll interval must be a positive number of seconds.")
+                self.chk_poll.setChecked(False)
+                return
+        for dev in devices or self.devices.values():
+            dev.stream_thread.commands.set_poll(period)
 
     def set_manual_start(self):
+        """Начало эксперимента вручную: идущие записи продолжаются новым сегментом с ним в заголовке."""
         text = self.input_start_time.text().strip()
         try:
             t = datetime.strptime(text, "%H:%M:%S")
         except ValueError:
             QMessageBox.warning(self, "Invalid time", "Enter time as HH:MM:SS")
             return
+        if self.clock is None:
+            QMessageBox.warning(self, "Not connected", "Please connect to a COM port first.")
+            return
         # подставляем дату сегодня, но время – из поля
         now = datetime.now()
-        self.experiment_start = datetime.combine(now.date(), t.time())
+        self.clock.set_start(datetime.combine(now.date(), t.time()))
 
     def toggle_recording(self):
         # Переключаем флаг
@@ -366,138 +1264,277 @@ class MainWindow(QMainWindow):
         self.start_button.setText("Stop" if self.recording else "Start")
         # Сброс графика/данных, если нужно
         if self.recording:
-            self.auto_x.clear()
-            self.auto_y.clear()
-            self.collected_data.clear()
-            self.experiment_start = datetime.now()
+            self._y_lo = self._y_hi = None
+            if self.clock is not None:
+                self.clock.set_start()
+            for rec in self.closed_recorders:
+                rec.close(discard=True)
+            self.closed_recorders.clear()
+            for dev in self.devices.values():
+                dev.ring.clear()
+                self._start_recorder(dev)
+            self._reset_rolling_stats()
+        else:
+            # данные остаются на диске до выхода, как раньше в памяти
+            for dev in self.devices.values():
+                dev.stream_thread.recorder = None
+                dev.close_stats_log()
 
-    def _on_auto_tick(self):
-        # Вызывается QTimer в режиме serial
-        if self.recording:
-            self._collect_auto_data()
-    
-    def handle_new_data(self, elapsed, value, stable):
-        """Обновляет график и поле вывода при любом поступлении данных."""
+    def _start_recorder(self, dev):
+        """Новая запись весов на диск; предыдущая (если была) заменяется.
+
+        В имени файла всегда порт: data_<ts>_COM3.bin, data_<ts>_COM4.bin, ...
+        (время у всех общее) - имя не зависит от того, сколько весов
+        подключено. Если весы переподключили во время записи, прежний файл
+        остаётся, а запись продолжается в следующем сегменте (_001, ...).
+        """
+        if dev.recorder:
+            dev.recorder.close(discard=True)
+            dev.recorder = None
+        folder = os.path.join(self.save_base, f"exp_{self.connection_ts}")
+        name = f"data_{self.connection_ts}_{port_file_name(dev.name)}"
+        try:
+            dev.recorder = StreamRecorder(
+                folder, name, self.clock.experiment_start,
+                flush_interval=RECORD_FLUSH_INTERVAL, fsync=RECORD_FSYNC,
+                rotate_bytes=RECORD_ROTATE_BYTES, rotate_seconds=RECORD_ROTATE_SECONDS,
+                fmt=RECORD_FORMAT, clock=self.clock,
+            )
+        except OSError as e:
+            QMessageBox.critical(self, "Error", f"Failed to start recording: {e}")
+            return
+        dev.recorder.start()
+        dev.stream_thread.recorder = dev.recorder
+        dev.close_stats_log()
+        if self.chk_save_stats.isChecked():
+            # скользящая статистика - рядом с данными: rolling_<ts>_<порт>[_001].csv,
+            # по первому сегменту записи, чтобы переподключение не затёрло прежнюю
+            first = os.path.splitext(os.path.basename(dev.recorder.files[0]))[0]
+            fname = os.path.join(folder, first.replace("data_", "rolling_", 1) + ".csv")
+            try:
+                # время в строках - от начала сессии
+                dev.stats_log = StatsLog(fname, self.clock.wall_start,
+                                         flush_interval=RECORD_FLUSH_INTERVAL, fsync=RECORD_FSYNC)
+            except OSError as e:
+                QMessageBox.critical(self, "Error", f"Не удалось сохранить «{fname}»: {e}")
+
+    def handle_new_batch(self, device, batch):
+        """Копит данные; график перерисовывается по таймеру RenderScheduler."""
+        _handled.add()
+        dev = self.devices.get(device)
+        if not batch or dev is None:
+            return
+        # локальные записи идут и без Start: отсчёты нужны, пока открыт участок
+        if dev.local.open:
+            dev.local.extend(*zip(*batch))
         if not self.recording:
             return
-        
-        raw = self.stream_thread.last_raw
-        self.auto_output.setText(raw)
-        if len(self.auto_x) >= 50000:
-            self.auto_x.pop(0); self.auto_y.pop(0)
-        self.auto_x.append(elapsed)
-        self.auto_y.append(value or 0.0)
-        self.line_auto.set_data(self.auto_x, self.auto_y)
-
-        if self.local_recording:
-            self.local_x.append(elapsed)
-            self.local_y.append(value or 0.0)
-            self.local_buffer.append((elapsed, value, stable))
-            self.line_local.set_data(self.local_x, self.local_y)
-        
-        self._update_y_axis()
-        self._update_x_axis(latest_elapsed=elapsed)
-        
-        self.canvas_auto.draw()
-        # сохраняем в память
-        self.collected_data.append((elapsed, value, stable))
+        t0 = time.perf_counter()
+        _delay_ms.record((dev.stream_thread.clock.elapsed() - batch[-1][0]) * 1000)
+
+        t, values, stable = zip(*batch)
+        y = [v or 0.0 for v in values]
+        if len(batch) == 1:
+            dev.ring.append(t[0], y[0], stable[0])
+        else:
+            dev.ring.extend(t, y, stable)
+        lo, hi = min(y), max(y)
+        if self._y_lo is None:
+            self._y_lo, self._y_hi = lo, hi
+        else:
+            self._y_lo = min(self._y_lo, lo)
+            self._y_hi = max(self._y_hi, hi)
+
+        dev.stats.extend(batch)
+        row = dev.stats.snapshot()
+        if row[1] is not None:
+            dev.mean_ring.append(row[0], row[1], row[5])
+        if dev.stats_log:
+            dev.stats_log.write(row)
+
+        if self.canvas_auto is None:
+            self._ensure_plot()     # первые данные - пора строить график
+        self.render.request()
+        _gui_samples.add(len(batch))
+        _batch_ms.record((time.perf_counter() - t0) * 1000)
+
+    def _latest_elapsed(self):
+        times = [t for t in (d.ring.last_time() for d in self.devices.values()) if t is not None]
+        return max(times) if times else None
+
+    def _prepare_frame(self):
+        """Вызывается раз в кадр: обновляет линии, пределы осей и вывод."""
+        active = self.active_device
+        if active and active.stream_thread.last_raw is not None:
+            self.auto_output.setText(active.stream_thread.last_raw)
+        self._update_y_axis(redraw=False)
+        self._update_x_axis(redraw=False)
+        # на экран идёт только видимый участок, прореженный по ширине холста
+        x0, x1 = self.ax_auto.get_xlim()
+        columns = int(self.ax_auto.bbox.width) or 1
+        for dev in self.devices.values():
+            dev.line.set_data(*dev.ring.decimated(x0, x1, columns))
+        first = active.local.first() if active else None
+        if first is not None and first < len(active.local):
+            # все открытые участки заканчиваются «сейчас»: рисуем их объединение
+            store = active.local.store
+            self.line_local.set_data(*decimate_minmax(store.t[first:], store.v[first:], x0, x1, columns))
+        else:
+            self.line_local.set_data([], [])
+        if active and self.chk_mean_trace.isChecked():
+            self.line_mean.set_data(*active.mean_ring.decimated(x0, x1, columns))
+        else:
+            self.line_mean.set_data([], [])
+        self._show_rolling_stats(active)
+
+    def _show_rolling_stats(self, dev):
+        if dev is None:
+            return
+        _, mean, std, rate, drift, stable = dev.stats.snapshot()
+
+        def f(x, spec):
+            return "-" if x is None else format(x, spec)
+        self.lbl_stats.setText(
+            f"Mean: {f(mean, '.4f')} g   Std: {f(std, '.4f')} g   "
+            f"Rate: {f(rate, '+.4f')} g/min   Drift: {f(drift, '+.3f')} g/h   "
+            f"{'STABLE' if stable else 'unstable'}"
+        )
+
+    def _rolling_windows(self):
+        """Окна статистики из полей ввода (по умолчанию 60 и 10 с)."""
+        try:
+            stats_w = float(self.input_stats_window.text())
+            rate_w = float(self.input_rate_window.text())
+        except ValueError:
+            return 60.0, 10.0
+        return stats_w, rate_w
+
+    def _reset_rolling_stats(self):
+        stats_w, rate_w = self._rolling_windows()
+        for dev in self.devices.values():
+            dev.stats.reset(stats_window=stats_w, rate_window=rate_w)
+            dev.mean_ring.clear()
+        self.render.invalidate()
 
     def extra_start(self):
-        """Начать собирать в дополнительный буфер."""
-        self.local_buffer.clear()
-        self.local_x.clear()
-        self.local_y.clear()
-        self.line_local.set_data(self.local_x, self.local_y)
-        self.canvas_auto.draw()
-        # Перезаписываем флаг, если используете его для авто-режима
-        self.local_recording = True
-        self.local_experiment_start = datetime.now()
-        self.btn_extra_start.setEnabled(False)
-        self.btn_extra_stop.setEnabled(True)
-    
-    def extra_stop_and_save(self):
-        """Остановить сбор и сохранить весь дополнительный буфер в CSV."""
-        self.local_recording = False
+        """Начать локальную запись: именованный участок в хранилище каждых весов.
 
-        # Определяем имя файла
+        Можно открыть несколько записей одновременно, в том числе
+        перекрывающихся; данные при этом не копируются.
+        """
         name = self.input_filename.text().strip()
         if not name:
             name = f"balance{self.auto_name_counter}"
             self.auto_name_counter += 1
+        if name in self.local_segments:
+            QMessageBox.warning(self, "Local recording", f"Local recording «{name}» is already running.")
+            return
+        if not self.devices:
+            QMessageBox.warning(self, "Not connected", "Please connect to a COM port first.")
+            return
+        self.local_segments.add(name)
+        for dev in self.devices.values():
+            dev.local.start(name)
+        self.combo_segments.addItem(name)
+        self.combo_segments.setCurrentText(name)
+        self.btn_extra_stop.setEnabled(True)
+        self.input_filename.clear()
+        self.render.request()
+
+    def extra_stop_and_save(self):
+        """Остановить выбранную локальную запись и сохранить её участок в CSV."""
+        name = self.combo_segments.currentText()
+        if name not in self.local_segments:
+            return
+        self.local_segments.discard(name)
+        self.combo_segments.removeItem(self.combo_segments.currentIndex())
+        self.btn_extra_stop.setEnabled(bool(self.local_segments))
+
         folder = os.path.join(self.save_base, f"exp_{self.connection_ts}")
-        os.makedirs(folder, exist_ok=True)
-        fname = os.path.join(folder, name + ".csv")
+        # при нескольких весах - по файлу на каждые, с портом в имени
+        files = {}
+        for dev in self.devices.values():
+            if name not in dev.local.open:
+                continue
+            suffix = "_" + port_file_name(dev.name) if len(self.devices) > 1 else ""
+            files[os.path.join(folder, name + suffix + ".csv")] = (dev.local, *dev.local.stop(name))
+        if not files:
+            QMessageBox.warning(self, "Local recording", f"No data for «{name}»: the balance was disconnected.")
+            return
+        fname = ", ".join(files)
 
-        # Пишем CSV
+        # Пишем CSV: срез общего хранилища, без промежуточных копий
         try:
-            with open(fname, "w", newline="") as f:
-                writer = csv.writer(f)
-                writer.writerow([self.local_experiment_start.strftime("%H:%M:%S.%f")])
-                # заголовок
-                writer.writerow(["elapsed_sec", "value", "stable"])
-                # сами данные
-                for elapsed, val, stable in self.local_buffer:
-                    writer.writerow([elapsed, val, stable])
-                self.btn_extra_start.setEnabled(True)
-                self.btn_extra_stop.setEnabled(False)
+            os.makedirs(folder, exist_ok=True)
+            for path, (local, start, stop) in files.items():
+                # время участка - от начала сессии, его и пишем в заголовок
+                export_csv(local.store, path, self.clock.wall_start, header=True, start=start, stop=stop)
         except Exception as e:
             QMessageBox.critical(self, "Error", f"Не удалось сохранить «{fname}»: {e}")
         else:
             QMessageBox.information(self, "Saved", f"Доп. данные сохранены в {fname}")
-            # чистим поле, если нужно
-            self.input_filename.clear()
+            self._archive("archive", list(files))
+        finally:
+            for local, _, _ in files.values():
+                local.compact()
+            self.render.request()
 
     def send_tare(self):
         """Посылает команду T (tare) на прибор."""
-        if not self.serial_conn or not self.serial_conn.is_open:
-            QMessageBox.warning(self, "Not connected", "Please connect to a COM port first.")
-            return
-        try:
-            # Tare
-            self.serial_conn.write("T\r".encode('ascii'))
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"Failed to send Tare command:\n{e}")
+        self._send_manual("T")
 
     def send_calibrate(self):
-        if not self.serial_conn or not self.serial_conn.is_open:
-            QMessageBox.warning(self, "Not connected", "Please connect to a COM port first.")
-            return
-        try:
-            self.serial_conn.write("C\r".encode('ascii'))
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"Failed to send Calibrate command:\n{e}")
+        self._send_manual("C")
+
+    def _update_x_axis(self, latest_elapsed: float = None, redraw: bool = True):
+        """Перерисовать только X-ось в соответствии с input_window.
 
-    def _update_x_axis(self, latest_elapsed: float = None):
-        """Перерисовать только X-ось в соответствии с input_window."""
-        if latest_elapsed is None and self.auto_x:
-            latest_elapsed = self.auto_x[-1]
+        Пределы сдвигаются скачками с запасом, чтобы полная перерисовка
+        холста нужна была не в каждом кадре.
+        """
+        if latest_elapsed is None:
+            latest_elapsed = self._latest_elapsed()
+        if latest_elapsed is None or self.ax_auto is None:
+            return
+        x0, x1 = self.ax_auto.get_xlim()
         txt = self.input_window.text().strip()
         if txt:
             try:
                 w = float(txt)
-                start = max(0, latest_elapsed - w)
-                self.ax_auto.set_xlim(start, latest_elapsed)
             except ValueError:
-                pass
+                return
+            if redraw or not (x0 <= latest_elapsed <= x1) or x1 - x0 > w * 1.1 + 1e-9:
+                # окно уезжает на 10% вперёд
+                end = latest_elapsed + w * 0.1
+                self.ax_auto.set_xlim(max(0, end - w * 1.1), end)
         else:
-            if self.auto_x:
-                self.ax_auto.set_xlim(0, max(self.auto_x))
+            if redraw or x0 != 0 or latest_elapsed > x1:
+                self.ax_auto.set_xlim(0, max(latest_elapsed * 1.1, 1.0))
+        if redraw:
+            self.render.invalidate()
 
-    def _update_y_axis(self):
+    def _update_y_axis(self, redraw: bool = True):
         """Перерисовать только Y-ось в соответствии с input_ymin/input_ymax."""
+        if self.ax_auto is None:
+            return
         ymin_txt = self.input_ymin.text().strip()
         ymax_txt = self.input_ymax.text().strip()
         if ymin_txt and ymax_txt:
             try:
                 y0 = float(ymin_txt)
                 y1 = float(ymax_txt)
-                self.ax_auto.set_ylim(y0, y1)
+                if (y0, y1) != tuple(self.ax_auto.get_ylim()):
+                    self.ax_auto.set_ylim(y0, y1)
             except ValueError:
                 pass
-        else:
-            self.ax_auto.relim()
-            self.ax_auto.set_autoscaley_on(True)
-            self.ax_auto.autoscale_view()
+        elif self._y_lo is not None:
+            # автоподбор: расширяем с запасом, только если данные вышли за пределы
+            y0, y1 = self.ax_auto.get_ylim()
+            if redraw or self._y_lo < y0 or self._y_hi > y1:
+                pad = (self._y_hi - self._y_lo) * 0.05 or abs(self._y_hi) * 0.05 or 1.0
+                self.ax_auto.set_ylim(self._y_lo - pad, self._y_hi + pad)
+        if redraw:
+            self.render.invalidate()
 
     def _reset_x_axis(self):
         """Сбросить настройку X-оси (window) на полный диапазон от 0 до текущего."""
@@ -508,6 +1545,12 @@ class MainWindow(QMainWindow):
         """Сбросить Y-ось в автоподбор."""
         self.input_ymin.clear()
         self.input_ymax.clear()
+        self._y_lo = self._y_hi = None
+        for dev in self.devices.values():
+            rng = dev.ring.value_range()
+            if rng:
+                self._y_lo = rng[0] if self._y_lo is None else min(self._y_lo, rng[0])
+                self._y_hi = rng[1] if self._y_hi is None else max(self._y_hi, rng[1])
         self._update_y_axis()
 
     def closeEvent(self, event):
@@ -515,33 +1558,80 @@ class MainWindow(QMainWindow):
             self, "Save Data?", "Save all data before exit?", 
             QMessageBox.Yes | QMessageBox.No, QMessageBox.Yes
         )
+        self.render.stop()
+        self.diag_timer.stop()
+        if self.discovery is not None:
+            self.discovery.wait()
+        if self.merge_thread is not None:
+            self.merge_thread.wait()
+        if self.view_loader is not None:
+            self.view_loader.wait()
+        for dev in self.devices.values():
+            dev.close()
+            dev.close_stats_log()
+        if self.publisher:
+            self.publisher.close()
+        # данные уже на диске: остаётся дописать очередь или удалить файлы
         if reply == QMessageBox.Yes:
             self._save_experiment_data()
-        if self.stream_thread:
-            self.stream_thread.stop()
+            for folder in self._open_folders():
+                self._archive("archive_folder", folder)
+        else:
+            for rec in self._all_recorders():
+                rec.close(discard=True)
+        if self.archiver is not None:
+            self.archiver.close(ARCHIVE_EXIT_WAIT)
+        if self.session_marker is not None:
+            self.session_marker.remove()
         event.accept()
 
-    def _save_experiment_data(self):
-        if not self.experiment_start or not hasattr(self, "save_base"):
+    def _archive(self, method, *args):
+        """Передать работу фоновому Archiver (создаётся при первом вызове)."""
+        if not ARCHIVE_ENABLED:
             return
-        folder = os.path.join(self.save_base, f"exp_{self.connection_ts}")
-        os.makedirs(folder, exist_ok=True)
-        fname = os.path.join(folder, f"data_{self.connection_ts}.csv")
-        with open(fname, 'w', newline='') as f:
-            writer = csv.writer(f)
-            # 1) время старта: абсолютное и точное
-            writer.writerow([
-                self.experiment_start.strftime("%H:%M:%S.%f")
-            ])
-            # 2) данные: delta_ms, value, stable
-            for delta, val, stable in self.collected_data:
-                writer.writerow([delta, val, stable])
+        getattr(self._background(), method)(*args)
+
+    def _background(self):
+        """Фоновый Archiver (создаётся при первом вызове)."""
+        if self.archiver is None:
+            self.archiver = Archiver(ARCHIVE_COMPRESS_BIN, ARCHIVE_MAX_BYTES, ARCHIVE_MAX_AGE_DAYS)
+            self.archiver.start()
+        return self.archiver
+
+    def _open_folders(self):
+        """Папки, куда ещё пишет (или может писать) эта сессия, - их архивация не трогает."""
+        folders = {os.path.dirname(f) for rec in self._all_recorders() for f in rec.files}
+        if hasattr(self, "connection_ts"):
+            folders.add(os.path.join(self.save_base, f"exp_{self.connection_ts}"))
+        return folders
+
+    def _all_recorders(self):
+        return self.closed_recorders + [d.recorder for d in self.devices.values() if d.recorder]
+
+    def _save_experiment_data(self):
+        """Закрыть запись: всё уже на диске, дописывается только хвост очереди."""
+        for recorder in self._all_recorders():
+            recorder.close()
+            if recorder.error:
+                QMessageBox.critical(self, "Error", f"Recording failed: {recorder.error}")
+            if recorder.fmt == "bin" and RECORD_EXPORT_CSV:
+                # выгрузка - в потоке архивации, раньше сжатия папки
+                self._background().export_csv(recorder.files)
 
 
 
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()    # для дочерних процессов в exe PyInstaller
+    logging.basicConfig(level=os.environ.get("BALANCE_LOG", "WARNING").upper())
     app = QApplication(sys.argv)
+    STARTUP.mark("qapp")
     mw = MainWindow()
     mw.show()
+    STARTUP.mark("show")
+
+    def _started():
+        STARTUP.mark("first_event")
+        log.info("startup: %s", STARTUP.summary())
+    QTimer.singleShot(0, _started)
     sys.exit(app.exec_())
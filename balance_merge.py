@@ -0,0 +1,310 @@
+"""Выравнивание нескольких записей по общей сетке времени (без зависимостей от Qt).
+
+Пример:
+    python balance_merge.py data/exp_1/data_1.bin scale2=other/data_7.csv --step 0.5 --out merged.csv
+    python balance_merge.py a.bin b.csv.gz --method last --max-gap 2 --out merged.csv
+
+Записи программы (.bin и .csv, в том числе сжатые .gz) читаются кусками и
+сливаются по времени (k-путевое слияние): у каждого источника в памяти
+только текущий кусок и соседи точек сетки, поэтому длина файлов не
+ограничена. Время по умолчанию настенное (время старта записи + elapsed):
+записи с разных весов и из разных exp_<ts> совпадают по часам;
+align="start" отсчитывает каждую запись от её собственного старта.
+
+Сетка - через каждые step секунд или, без step, все моменты отсчётов всех
+записей. Значение записи в точке сетки:
+    linear  - линейно между соседними отсчётами;
+    nearest - ближайший отсчёт;
+    last    - последний отсчёт не позже точки.
+Вне записи и там, где нужный отсчёт дальше max_gap секунд, значения нет
+(пустое поле). Нераспознанные отсчёты пропускаются, со stable_only - и
+нестабильные.
+"""
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+from balance_data import open_reader
+
+METHODS = ("linear", "nearest", "last")
+
+
+def resample(t, v, grid, method="linear", max_gap=None):
+    """Значения отсчётов (t, v) в моменты grid -> массив float64, nan - нет значения.
+
+    t - по неубыванию (из нескольких отсчётов с одним временем берётся
+    последний). Все точки считаются разом, без цикла по ним.
+    """
+    t = np.asarray(t, dtype=np.float64)
+    v = np.asarray(v, dtype=np.float64)
+    grid = np.asarray(grid, dtype=np.float64)
+    out = np.full(len(grid), np.nan)
+    if not len(t) or not len(grid):
+        return out
+    right = np.searchsorted(t, grid, side="right")      # первый отсчёт позже точки
+    ok = (right > 0) & (grid <= t[-1])
+    left = np.maximum(right - 1, 0)                     # последний не позже точки
+    right = np.minimum(right, len(t) - 1)
+    t0, t1 = t[left], t[right]
+    if method == "last":
+        value, gap = v[left], grid - t0
+    elif method == "nearest":
+        use_right = t1 - grid < grid - t0
+        value = np.where(use_right, v[right], v[left])
+        gap = np.where(use_right, t1 - grid, grid - t0)
+    elif method == "linear":
+        span = t1 - t0
+        w = np.divide(grid - t0, span, out=np.zeros(len(grid)), where=span > 0)
+        value = v[left] + w * (v[right] - v[left])
+        gap = np.where(grid == t0, 0.0, span)            # точно на отсчёте - всегда есть
+    else:
+        raise ValueError(f"unknown method {method!r}, expected one of {', '.join(METHODS)}")
+    if max_gap is not None:
+        ok &= gap <= max_gap
+    out[ok] = value[ok]
+    return out
+
+
+def _stem(fname):
+    name = os.path.basename(fname)
+    if name.lower().endswith(".gz"):
+        name = name[:-3]
+    return os.path.splitext(name)[0]
+
+
+class Source:
+    """Одна запись в слиянии: имя столбца и буфер отсчётов в общем времени.
+
+    read() добавляет в буфер следующий кусок файла; fill() читает, пока
+    буфер не перекроет точки сетки, и выбрасывает отсчёты, которые ни для
+    одной из них не соседние; trim() - всё, что уже не понадобится.
+    """
+
+    def __init__(self, fname, name=None, align="wall", stable_only=False):
+        if align not in ("wall", "start"):
+            raise ValueError(f"unknown align {align!r}, expected 'wall' or 'start'")
+        self.fname = fname
+        self.name = name or _stem(fname)
+        self.reader = open_reader(fname)
+        self.experiment_start = self.reader.experiment_start
+        self.offset = self.experiment_start.timestamp() if align == "wall" else 0.0
+        self.stable_only = stable_only
+        self.t = np.empty(0)
+        self.v = np.empty(0)
+        self.eof = False
+        self.last = -np.inf     # время последнего прочитанного отсчёта
+        self.backwards = 0      # выброшено отсчётов со временем назад
+        self._chunks = iter(self.reader)
+
+    def read(self):
+        """Дочитать кусок с хотя бы одним отсчётом; False - файл кончился."""
+        for t, v, stable in self._chunks:
+            keep = ~np.isnan(v)
+            if self.stable_only:
+                keep &= stable
+            t, v = t[keep] + self.offset, v[keep]
+            # время назад (старые CSV по часам ОС: перевод часов, NTP) - отсчёты
+            # раньше уже прочитанных выбрасываются и считаются, а не ломают слияние
+            latest = np.maximum.accumulate(np.concatenate(([self.last], t)))[:-1]
+            ordered = t >= latest
+            if not ordered.all():
+                self.backwards += int(len(t) - np.count_nonzero(ordered))
+                t, v = t[ordered], v[ordered]
+            if not len(t):
+                continue
+            self.last = float(t[-1])
+            self.t = np.concatenate((self.t, t))
+            self.v = np.concatenate((self.v, v))
+            return True
+        self.eof = True
+        return False
+
+    def fill(self, grid):
+        """Читать, пока буфер не зайдёт за конец grid (или файл не кончится)."""
+        while not self.eof and (not len(self.t) or self.t[-1] <= grid[-1]):
+            if self.read():
+                self._compact(grid)
+
+    def _compact(self, grid):
+        t = self.t
+        cut = np.searchsorted(t, grid[-1], side="right")    # дальше - для следующих точек
+        right = np.searchsorted(t, grid, side="right")
+        idx = np.concatenate((right - 1, right))
+        keep = np.zeros(len(t), dtype=bool)
+        keep[idx[(idx >= 0) & (idx < cut)]] = True
+        keep[cut:] = True
+        if not keep.all():
+            self.t, self.v = t[keep], self.v[keep]
+
+    def trim(self, before):
+        """Выбросить отсчёты раньше последнего, что не позже before."""
+        i = np.searchsorted(self.t, before, side="right") - 1
+        if i > 0:
+            self.t, self.v = self.t[i:], self.v[i:]
+
+
+def _end(sources, span):
+    """Последнее время сетки, если его уже можно знать, иначе None."""
+    ended = [s.last for s in sources if s.eof]
+    if span == "common" and ended:
+        return min(ended)
+    if len(ended) == len(sources):
+        return max(ended)
+    return None
+
+
+def merge(sources, step=None, method="linear", max_gap=None, span="common", block=1 << 16):
+    """Слить записи по времени -> генератор кусков (время, значения[n, k]).
+
+    sources - список Source; step=None - точки сетки во все моменты
+    отсчётов всех записей, иначе через step секунд от начала. span="common"
+    - только пока идут все записи, "all" - от самой ранней до самой
+    поздней. block - точек сетки в одном куске.
+    """
+    if method not in METHODS:
+        raise ValueError(f"unknown method {method!r}, expected one of {', '.join(METHODS)}")
+    if span not in ("common", "all"):
+        raise ValueError(f"unknown span {span!r}, expected 'common' or 'all'")
+    if step is not None and step <= 0:
+        raise ValueError("step must be positive")
+    for s in sources:
+        s.read()
+    firsts = [s.t[0] for s in sources if len(s.t)]
+    if not firsts or (span == "common" and len(firsts) < len(sources)):
+        return iter(())
+    begin = max(firsts) if span == "common" else min(firsts)
+    if step is None:
+        return _merge_samples(sources, begin, method, max_gap, span)
+    return _merge_grid(sources, begin, step, method, max_gap, span, block)
+
+
+def _values(sources, grid, method, max_gap):
+    return np.column_stack([resample(s.t, s.v, grid, method, max_gap) for s in sources])
+
+
+def _merge_grid(sources, begin, step, method, max_gap, span, block):
+    k = 0
+    while True:
+        # точки считаются от начала, а не накоплением шага - без дрейфа
+        grid = begin + step * np.arange(k, k + block, dtype=np.float64)
+        for s in sources:
+            s.fill(grid)
+        end = _end(sources, span)
+        final = end is not None and end <= grid[-1]
+        if final:
+            grid = grid[grid <= end]
+        if len(grid):
+            yield grid, _values(sources, grid, method, max_gap)
+        if final:
+            return
+        k += block
+        for s in sources:
+            s.trim(begin + step * k)
+
+
+def _merge_samples(sources, begin, method, max_gap, span):
+    prev = np.nextafter(begin, -np.inf)     # всё, что не позже, уже выдано
+    while True:
+        for s in sources:
+            while not s.eof and (not len(s.t) or s.t[-1] <= prev):
+                s.read()
+        # дальше самого короткого буфера ещё неизвестно, чьи отсчёты будут
+        open_ends = [s.t[-1] for s in sources if not s.eof]
+        upto = min(open_ends) if open_ends else np.inf
+        end = _end(sources, span)
+        final = end is not None and end <= upto
+        if final:
+            upto = end
+        times = np.unique(np.concatenate([s.t[(s.t > prev) & (s.t <= upto)] for s in sources]))
+        if len(times):
+            yield times, _values(sources, times, method, max_gap)
+        if final:
+            return
+        prev = upto
+        for s in sources:
+            s.trim(prev)
+
+
+def write_csv(blocks, fname, names, origin=None, unix_time=True):
+    """Записать куски merge() в CSV -> число строк.
+
+    Столбцы: elapsed_sec (от origin, по умолчанию - от первой точки),
+    unix_time (при unix_time=True) и по одному на запись; нет значения -
+    пустое поле, как в CSV программы.
+    """
+    fmt = ",".join(["%.6f"] * (2 if unix_time else 1) + ["%.7g"] * len(names)) + "\r\n"
+    rows = 0
+    with open(fname, "w", newline="") as f:
+        f.write(",".join(["elapsed_sec"] + (["unix_time"] if unix_time else []) + list(names)) + "\r\n")
+        for t, values in blocks:
+            if origin is None:
+                origin = float(t[0])
+            table = np.column_stack([t - origin] + ([t] if unix_time else []) + [values]).tolist()
+            f.write("".join(fmt % tuple(row) for row in table).replace("nan", ""))
+            rows += len(t)
+    return rows
+
+
+def merge_files(files, out, names=None, step=None, method="linear", max_gap=None,
+                span="common", align="wall", stable_only=False):
+    """Выровнять записи files и сохранить таблицу в out -> (строк, имена столбцов, выброшено).
+
+    names - имена столбцов (по умолчанию имена файлов без расширения;
+    совпадающие получают суффикс _2, _3...). Выброшено - отсчётов со
+    временем раньше уже прочитанных (см. Source.read).
+    """
+    names = list(names) if names else [None] * len(files)
+    sources = [Source(f, n, align, stable_only) for f, n in zip(files, names)]
+    seen = {}
+    for s in sources:
+        seen[s.name] = seen.get(s.name, 0) + 1
+        if seen[s.name] > 1:
+            s.name = f"{s.name}_{seen[s.name]}"
+    columns = [s.name for s in sources]
+    rows = write_csv(merge(sources, step, method, max_gap, span), out, columns,
+                     unix_time=align == "wall")
+    return rows, columns, sum(s.backwards for s in sources)
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Align recordings on a common time grid and write one CSV table.")
+    p.add_argument("files", nargs="+", metavar="[name=]file",
+                   help="recordings (.bin/.csv, optionally .gz); name= sets the column name")
+    p.add_argument("--out", required=True, help="output CSV")
+    p.add_argument("--step", type=float, default=None,
+                   help="grid step in seconds (default: every sample time of every recording)")
+    p.add_argument("--method", choices=METHODS, default="linear", help="value at a grid point (default linear)")
+    p.add_argument("--max-gap", type=float, default=None,
+                   help="leave the value empty if the sample used is farther than this (s)")
+    p.add_argument("--span", choices=("common", "all"), default="common",
+                   help="common: only while all recordings run; all: from the first start to the last end")
+    p.add_argument("--align", choices=("wall", "start"), default="wall",
+                   help="wall: by clock time; start: each recording from its own start")
+    p.add_argument("--stable-only", action="store_true", help="use stable samples only")
+    args = p.parse_args(argv)
+    files, names = [], []
+    for arg in args.files:
+        name, sep, fname = arg.partition("=")
+        if not sep or os.path.exists(arg):
+            name, fname = None, arg
+        files.append(fname)
+        names.append(name)
+    t0 = time.perf_counter()
+    try:
+        rows, columns, backwards = merge_files(files, args.out, names, args.step, args.method, args.max_gap,
+                                    args.span, args.align, args.stable_only)
+    except (OSError, ValueError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+    print(f"{rows} rows x {len(columns)} recordings ({', '.join(columns)}) -> {args.out} "
+          f"in {time.perf_counter() - t0:.1f} s")
+    if backwards:
+        print(f"{backwards} samples with timestamps going backwards were dropped")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
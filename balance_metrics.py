@@ -0,0 +1,185 @@
+"""Счётчики и гистограммы задержек для горячих участков (без зависимостей от Qt).
+
+Все метрики живут в общем реестре METRICS; модули берут нужные объекты
+один раз при импорте, так что в горячем пути остаётся только сложение.
+"""
+import json
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+
+
+class Counter:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def add(self, n=1):
+        self.value += n
+
+    def snapshot(self):
+        return self.value
+
+
+class Gauge:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = None
+
+    def set(self, value):
+        self.value = value
+
+    def snapshot(self):
+        return self.value
+
+
+class Histogram:
+    """Гистограмма по фиксированным границам (мс); перцентили - по границам корзин."""
+
+    BOUNDS = (0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, ms):
+        self.counts[bisect_left(self.BOUNDS, ms)] += 1
+        self.count += 1
+        self.total += ms
+        if ms > self.max:
+            self.max = ms
+
+    def percentile(self, q):
+        if not self.count:
+            return None
+        need = q * self.count
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= need:
+                return self.BOUNDS[i] if i < len(self.BOUNDS) else self.max
+        return self.max
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else None,
+            "p50": self.percentile(0.5),
+            "p95": self.percentile(0.95),
+            "max": self.max if self.count else None,
+        }
+
+
+class Metrics:
+    """Реестр метрик по именам вида "раздел.метрика"."""
+
+    def __init__(self):
+        self._items = {}
+        self._lock = threading.Lock()
+
+    def _get(self, name, cls):
+        with self._lock:
+            item = self._items.get(name)
+            if item is None:
+                item = self._items[name] = cls()
+            return item
+
+    def counter(self, name):
+        return self._get(name, Counter)
+
+    def gauge(self, name):
+        return self._get(name, Gauge)
+
+    def histogram(self, name):
+        return self._get(name, Histogram)
+
+    def snapshot(self):
+        with self._lock:
+            items = sorted(self._items.items())
+        return {name: item.snapshot() for name, item in items}
+
+    def counter_names(self):
+        with self._lock:
+            return {name for name, item in self._items.items() if isinstance(item, Counter)}
+
+
+METRICS = Metrics()
+
+
+class PhaseTimer:
+    """Длительность этапов запуска программы: gauges <prefix>.<этап>_ms.
+
+    mark(name) закрывает этап, начатый предыдущей отметкой (или в start);
+    phase(name) - отдельный замер вне этой цепочки (ленивая загрузка).
+    """
+
+    def __init__(self, prefix="startup", start=None):
+        self.prefix = prefix
+        self.start = time.perf_counter() if start is None else start
+        self._last = self.start
+        self.phases = []        # [(этап, мс)] в порядке замеров
+
+    def mark(self, name):
+        now = time.perf_counter()
+        self._record(name, (now - self._last) * 1000)
+        self._last = now
+
+    @contextmanager
+    def phase(self, name):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._record(name, (time.perf_counter() - t0) * 1000)
+
+    def _record(self, name, ms):
+        self.phases.append((name, ms))
+        METRICS.gauge(f"{self.prefix}.{name}_ms").set(round(ms, 1))
+
+    @property
+    def total_ms(self):
+        """От start до последней отметки mark()."""
+        return (self._last - self.start) * 1000
+
+    def summary(self):
+        return ", ".join(f"{name} {ms:.0f} ms" for name, ms in self.phases)
+
+
+def _fmt(x):
+    if x is None:
+        return "-"
+    if isinstance(x, float):
+        return f"{x:.2f}"
+    return str(x)
+
+
+def format_snapshot(snap, prev=None, dt=None, counters=None):
+    """Текст для панели диагностики; для счётчиков добавляется скорость в секунду."""
+    if counters is None:
+        counters = METRICS.counter_names()
+    lines = []
+    for name, value in snap.items():
+        if isinstance(value, dict):
+            lines.append(f"{name:28s} n={value['count']}  mean={_fmt(value['mean'])}  "
+                         f"p50<={_fmt(value['p50'])}  p95<={_fmt(value['p95'])}  max={_fmt(value['max'])} ms")
+        elif name in counters and prev and dt and isinstance(prev.get(name), int):
+            lines.append(f"{name:28s} {value}  ({(value - prev[name]) / dt:.1f}/s)")
+        else:
+            lines.append(f"{name:28s} {_fmt(value)}")
+    return "\n".join(lines)
+
+
+class StatsFile:
+    """Периодический снимок метрик в файл: одна строка JSON на снимок."""
+
+    def __init__(self, fname):
+        self.fname = fname
+
+    def write(self, snap):
+        with open(self.fname, "a") as f:
+            f.write(json.dumps({"time": time.time(), **snap}) + "\n")
@@ -0,0 +1,424 @@
+"""Раздача отсчётов другим программам по локальной сети (без зависимостей от Qt).
+
+    python balance_publish.py subscribe --port 5025          # печатать отсчёты
+    python balance_publish.py subscribe --port 5025 --udp
+    python balance_publish.py selftest                       # проверка на loopback
+
+Кадр - заголовок _FRAME (сигнатура, версия, длина имени весов, число
+отсчётов, номер первого отсчёта, время старта эксперимента как
+unix-время), имя весов и отсчёты в формате RECORD_DTYPE (13 байт, как в
+.bin). По TCP перед кадром идёт его длина (uint32), по UDP один кадр -
+одна датаграмма; подписчик UDP шлёт "SUB" на порт издателя и повторяет
+это не реже раза в UDP_EXPIRE секунд. По номеру первого отсчёта
+подписчик видит пропуски.
+
+publish() только кодирует пачку один раз и кладёт её в очереди клиентов
+без ожидания. Очередь каждого клиента ограничена: если клиент не успевает,
+новые кадры для него выбрасываются (slow="drop") или он отключается
+(slow="disconnect"). Поток чтения порта никогда не ждёт подписчиков.
+"""
+import sys
+import time
+import queue
+import socket
+import struct
+import argparse
+import threading
+from datetime import datetime
+
+import numpy as np
+
+from balance_data import RECORD_DTYPE, FLAG_STABLE, FLAG_VALID, pack_records
+from balance_metrics import METRICS
+
+_frames = METRICS.counter("publish.frames")
+_dropped = METRICS.counter("publish.dropped_frames")
+_disconnects = METRICS.counter("publish.disconnects")
+_clients = METRICS.gauge("publish.clients")
+
+MAGIC = b"BALP"
+VERSION = 1
+_FRAME = struct.Struct("<4sBBIQd")
+_LEN = struct.Struct("<I")
+UDP_PAYLOAD = 1400          # байт на датаграмму, чтобы не было фрагментации
+UDP_EXPIRE = 30.0           # с; подписчик UDP без продления забывается
+
+
+def encode_frame(device, seq, start_ts, records):
+    name = device.encode("utf-8")[:255]
+    return _FRAME.pack(MAGIC, VERSION, len(name), len(records), seq, start_ts) + name + records.tobytes()
+
+
+def decode_frame(data):
+    """Кадр -> (весы, номер первого отсчёта, время старта (unix), массив RECORD_DTYPE)."""
+    magic, version, name_len, count, seq, start_ts = _FRAME.unpack_from(data)
+    if magic != MAGIC or version > VERSION:
+        raise ValueError("not a balance sample frame")
+    off = _FRAME.size
+    device = bytes(data[off:off + name_len]).decode("utf-8", errors="replace")
+    off += name_len
+    records = np.frombuffer(data, dtype=RECORD_DTYPE, count=count, offset=off)
+    return device, seq, start_ts, records
+
+
+class _TcpClient:
+    """Подписчик TCP: своя ограниченная очередь и свой поток отправки."""
+
+    def __init__(self, sock, addr, max_frames, send_timeout, send_buffer=None):
+        self.sock = sock
+        if send_buffer:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, send_buffer)
+        self.addr = addr
+        self.queue = queue.Queue(max_frames)
+        self.dropped = 0
+        self.closed = False
+        sock.settimeout(send_timeout)   # совсем зависший клиент отключится по таймауту
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def offer(self, frame):
+        """Положить кадр без ожидания; False, если очередь полна."""
+        try:
+            self.queue.put_nowait(frame)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def _run(self):
+        try:
+            while True:
+                frame = self.queue.get()
+                if frame is None:
+                    break
+                self.sock.sendall(_LEN.pack(len(frame)) + frame)
+        except OSError:
+            pass
+        finally:
+            self.close()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+        try:
+            self.queue.put_nowait(None)
+        except queue.Full:
+            pass
+
+
+class SamplePublisher:
+    """Раздача пачек отсчётов подписчикам по TCP или UDP.
+
+    host/port - где слушать (port=0 - любой свободный, см. self.port);
+    max_frames - очередь на клиента в кадрах; slow - "drop" или
+    "disconnect" для клиента, у которого очередь переполнена;
+    send_buffer - размер буфера отправки сокета клиента в байтах (None -
+    как у ОС; меньше - медленный клиент раньше упирается в очередь).
+    """
+
+    def __init__(self, host="127.0.0.1", port=5025, udp=False, max_frames=256,
+                 slow="drop", send_timeout=10.0, send_buffer=None):
+        if slow not in ("drop", "disconnect"):
+            raise ValueError(f"unknown slow client policy: {slow!r}")
+        self.udp = udp
+        self.max_frames = max_frames
+        self.slow = slow
+        self.send_timeout = send_timeout
+        self.send_buffer = send_buffer
+        self._seq = {}
+        self._clients = []          # TCP: _TcpClient; UDP: адреса в _subscribers
+        self._subscribers = {}      # UDP: адрес -> время последнего "SUB"
+        self._lock = threading.Lock()
+        self._running = True
+        if udp:
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.sock.bind((host, port))
+            self._out = queue.Queue(max_frames)
+            threading.Thread(target=self._udp_listen, daemon=True).start()
+            threading.Thread(target=self._udp_send, daemon=True).start()
+        else:
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self.sock.bind((host, port))
+            self.sock.listen()
+            threading.Thread(target=self._accept, daemon=True).start()
+        self.port = self.sock.getsockname()[1]
+
+    @property
+    def client_count(self):
+        with self._lock:
+            return len(self._subscribers) if self.udp else len(self._clients)
+
+    # ─── вызывается потоком чтения ──────────────────────────────────────
+    def publish(self, device, batch, experiment_start):
+        """Раздать пачку (elapsed, value|None, stable); никогда не ждёт сеть."""
+        seq = self._seq.get(device, 0)
+        self._seq[device] = seq + len(batch)
+        if not self.client_count or not batch:
+            return
+        records = pack_records(batch)
+        start_ts = experiment_start.timestamp()
+        if self.udp:
+            per = max(1, (UDP_PAYLOAD - _FRAME.size - len(device.encode("utf-8"))) // RECORD_DTYPE.itemsize)
+            for i in range(0, len(records), per):
+                try:
+                    self._out.put_nowait(encode_frame(device, seq + i, start_ts, records[i:i + per]))
+                    _frames.add()
+                except queue.Full:
+                    _dropped.add()
+            return
+        frame = encode_frame(device, seq, start_ts, records)
+        _frames.add()
+        with self._lock:
+            clients = list(self._clients)
+        for client in clients:
+            if client.closed:
+                self._forget(client)
+            elif not client.offer(frame):
+                _dropped.add()
+                if self.slow == "disconnect":
+                    client.close()
+                    self._forget(client)
+
+    def _forget(self, client):
+        with self._lock:
+            if client in self._clients:
+                self._clients.remove(client)
+                _disconnects.add()
+                _clients.set(len(self._clients))
+
+    # ─── TCP ────────────────────────────────────────────────────────────
+    def _accept(self):
+        while self._running:
+            try:
+                sock, addr = self.sock.accept()
+            except OSError:
+                break
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            client = _TcpClient(sock, addr, self.max_frames, self.send_timeout, self.send_buffer)
+            with self._lock:
+                self._clients.append(client)
+                _clients.set(len(self._clients))
+
+    # ─── UDP ────────────────────────────────────────────────────────────
+    def _udp_listen(self):
+        while self._running:
+            try:
+                data, addr = self.sock.recvfrom(64)
+            except OSError:
+                break
+            if data.strip() == b"SUB":
+                with self._lock:
+                    self._subscribers[addr] = time.monotonic()
+                    _clients.set(len(self._subscribers))
+
+    def _udp_send(self):
+        while self._running:
+            frame = self._out.get()
+            if frame is None:
+                break
+            now = time.monotonic()
+            with self._lock:
+                for addr, seen in list(self._subscribers.items()):
+                    if now - seen > UDP_EXPIRE:
+                        del self._subscribers[addr]
+                        _disconnects.add()
+                addrs = list(self._subscribers)
+                _clients.set(len(addrs))
+            for addr in addrs:
+                try:
+                    self.sock.sendto(frame, addr)
+                except OSError:
+                    pass    # UDP: потеря датаграммы - забота подписчика
+
+    def close(self):
+        self._running = False
+        with self._lock:
+            clients, self._clients = self._clients, []
+        for client in clients:
+            client.close()
+        if self.udp:
+            try:
+                self._out.put_nowait(None)
+            except queue.Full:
+                pass
+        self.sock.close()
+
+
+# ─── подписчик ──────────────────────────────────────────────────────────
+
+class Subscriber:
+    """Клиент издателя: итерация даёт (весы, номер первого отсчёта, время старта, записи)."""
+
+    def __init__(self, host="127.0.0.1", port=5025, udp=False, timeout=None):
+        self.udp = udp
+        self.addr = (host, port)
+        self.missed = 0             # отсчётов пропущено (по номерам)
+        self._next = {}
+        if udp:
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.sock.settimeout(timeout if timeout is not None else UDP_EXPIRE / 3)
+            self._timeout = timeout
+            self._subscribe()
+        else:
+            self.sock = socket.create_connection(self.addr, timeout=10)
+            self.sock.settimeout(timeout)
+            self._buf = bytearray()
+
+    def _subscribe(self):
+        self.sock.sendto(b"SUB", self.addr)
+        self._renewed = time.monotonic()
+
+    def _recv_exact(self, n):
+        while len(self._buf) < n:
+            chunk = self.sock.recv(max(65536, n - len(self._buf)))
+            if not chunk:
+                raise EOFError("publisher closed the connection")
+            self._buf += chunk
+        data = bytes(self._buf[:n])
+        del self._buf[:n]
+        return data
+
+    def recv(self):
+        if self.udp:
+            while True:
+                if time.monotonic() - self._renewed > UDP_EXPIRE / 3:
+                    self._subscribe()
+                try:
+                    data, _ = self.sock.recvfrom(65536)
+                    break
+                except socket.timeout:
+                    if self._timeout is not None:
+                        raise
+        else:
+            (n,) = _LEN.unpack(self._recv_exact(_LEN.size))
+            data = self._recv_exact(n)
+        frame = decode_frame(data)
+        device, seq, _, records = frame
+        expected = self._next.get(device, seq)
+        if seq > expected:
+            self.missed += seq - expected
+        self._next[device] = seq + len(records)
+        return frame
+
+    def __iter__(self):
+        while True:
+            try:
+                yield self.recv()
+            except EOFError:
+                return
+
+    def close(self):
+        self.sock.close()
+
+
+def _print_samples(args):
+    sub = Subscriber(args.host, args.port, udp=args.udp)
+    print("device,time,elapsed_sec,value,stable", flush=True)
+    try:
+        for device, _, start_ts, rec in sub:
+            valid = (rec["flags"] & FLAG_VALID) != 0
+            stable = (rec["flags"] & FLAG_STABLE) != 0
+            lines = []
+            for t, v, ok, st in zip(rec["t"].tolist(), rec["v"].tolist(), valid.tolist(), stable.tolist()):
+                stamp = datetime.fromtimestamp(start_ts + t).strftime("%H:%M:%S.%f")
+                lines.append(f"{device},{stamp},{t:.6f},{f'{v:.7g}' if ok else ''},{st}")
+            print("\n".join(lines), flush=True)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if sub.missed:
+            print(f"missed {sub.missed} samples", file=sys.stderr)
+        sub.close()
+    return 0
+
+
+# ─── проверка на loopback ───────────────────────────────────────────────
+
+def selftest(udp=False, batches=4000, batch_size=25):
+    """Издатель и два подписчика на 127.0.0.1: быстрый получает всё, медленный не тормозит издателя.
+
+    Возвращает словарь с результатами; ok - True, если проверка прошла.
+    """
+    pub = SamplePublisher(port=0, udp=udp, slow="disconnect", send_buffer=16384)
+    fast = Subscriber(port=pub.port, udp=udp, timeout=5)
+    slow = None
+    if not udp:
+        # медленный подписчик: подключён, но ничего не читает
+        slow = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        slow.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+        slow.connect(("127.0.0.1", pub.port))
+    deadline = time.monotonic() + 5
+    while pub.client_count < (1 if udp else 2) and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    received = []
+
+    def reader():
+        try:
+            while sum(len(r) for r in received) < batches * batch_size:
+                received.append(fast.recv()[3])
+        except (OSError, EOFError, ValueError):
+            pass
+
+    th = threading.Thread(target=reader, daemon=True)
+    th.start()
+    start = datetime.now()
+    worst = 0.0
+    for i in range(batches):
+        batch = [(i * 0.1 + k * 1e-3, 100.0 + k, k % 2 == 0) for k in range(batch_size)]
+        t0 = time.perf_counter()
+        pub.publish("selftest", batch, start)
+        worst = max(worst, time.perf_counter() - t0)
+        # ~2000 пачек/с - на порядки больше, чем дают весы, но не бесконечный поток
+        time.sleep(0.0005)
+    th.join(timeout=10)
+    got = sum(len(r) for r in received)
+    result = {
+        "protocol": "udp" if udp else "tcp",
+        "published": batches * batch_size,
+        "received_fast": got,
+        "missed_fast": fast.missed,
+        "max_publish_ms": worst * 1000,
+        "clients_left": pub.client_count,
+    }
+    in_order = all(np.all(np.diff(r["t"]) >= 0) for r in received)
+    if udp:
+        # UDP без гарантий доставки: достаточно, что дошло большинство и по порядку
+        result["ok"] = in_order and got >= 0.5 * batches * batch_size and worst < 0.05
+    else:
+        result["ok"] = (in_order and got == batches * batch_size and fast.missed == 0
+                        and pub.client_count == 1 and worst < 0.05)
+    fast.close()
+    if slow is not None:
+        slow.close()
+    pub.close()
+    return result
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Subscribe to live balance samples, or test the publisher.")
+    sub = p.add_subparsers(dest="cmd", required=True)
+    s = sub.add_parser("subscribe", help="print samples from a running publisher as CSV")
+    s.add_argument("--host", default="127.0.0.1")
+    s.add_argument("--port", type=int, default=5025)
+    s.add_argument("--udp", action="store_true", help="use UDP instead of TCP")
+    t = sub.add_parser("selftest", help="publish to loopback subscribers and check delivery")
+    t.add_argument("--udp", action="store_true")
+    args = p.parse_args(argv)
+    if args.cmd == "subscribe":
+        return _print_samples(args)
+    result = selftest(udp=args.udp)
+    for key, value in result.items():
+        print(f"{key:16s} {value:.2f}" if isinstance(value, float) else f"{key:16s} {value}")
+    print("PASS" if result["ok"] else "FAIL")
+    return 0 if result["ok"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,242 @@
+"""Фоновая запись отсчётов на диск по мере поступления."""
+import os
+import re
+import csv
+import time
+import queue
+import logging
+import threading
+from datetime import datetime
+
+from balance_data import write_header, pack_records
+from balance_metrics import METRICS
+
+_samples = METRICS.counter("recorder.samples")
+_write_ms = METRICS.histogram("recorder.write_ms")
+_backlog = METRICS.gauge("recorder.queue")
+_errors = METRICS.counter("recorder.errors")
+_dropped = METRICS.counter("recorder.dropped")
+
+log = logging.getLogger(__name__)
+
+
+def port_file_name(port):
+    """Имя порта для имени файла: /dev/ttyUSB0 -> ttyUSB0, COM3 -> COM3."""
+    return re.sub(r"[^\w.-]", "_", os.path.basename(port))
+
+
+class StreamRecorder(threading.Thread):
+    """Поток, дописывающий отсчёты на диск пачками.
+
+    Отсчёты приходят через очередь (put() можно вызывать из потока чтения
+    порта), поэтому запись не тормозит ни чтение, ни GUI. fmt="csv" -
+    прежний формат (строка со временем старта, затем строки elapsed,
+    value, stable), fmt="bin" - двоичный формат balance_data.
+
+    flush_interval - как часто (с) сбрасывать буфер в ОС, 0 - после каждой пачки;
+    fsync - дополнительно вызывать os.fsync при сбросе;
+    rotate_bytes / rotate_seconds - начинать новый сегмент
+    <name>_001.csv, <name>_002.csv, ... по размеру или по времени.
+    (расширение .bin для двоичного формата). Уже существующие файлы не
+    перезаписываются: сегмент берёт следующий свободный номер.
+
+    clock (SessionClock) - в заголовок идёт его начало эксперимента, а из
+    времени отсчётов вычитается clock.offset, так что время в файле
+    считается от заголовка; новая отметка начала (set_start) начинает
+    новый сегмент. Кроме того, рядом с каждым сегментом в
+    <сегмент>.anchors.csv раз в anchor_interval секунд пишутся опорные
+    точки: elapsed, настенное время и уход настенных часов от монотонных.
+
+    Если запись упала (диск заполнен, файл удалён), ошибка - в error, а
+    дальнейшие put() не копятся в очереди: отсчёты выбрасываются и
+    считаются в dropped (и recorder.dropped).
+    """
+
+    def __init__(self, folder, name, experiment_start, flush_interval=1.0,
+                 fsync=True, rotate_bytes=None, rotate_seconds=None, batch_size=1000,
+                 fmt="csv", clock=None, anchor_interval=60.0):
+        super().__init__(daemon=True)
+        if fmt not in ("csv", "bin"):
+            raise ValueError(f"Unknown recording format: {fmt}")
+        self.fmt = fmt
+        self.folder = folder
+        self.name = name
+        self.experiment_start = experiment_start
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.rotate_bytes = rotate_bytes
+        self.rotate_seconds = rotate_seconds
+        self.batch_size = batch_size
+        self.clock = clock
+        self.anchor_interval = anchor_interval
+        self.files = []          # все созданные сегменты
+        self.written = 0
+        self.error = None
+        self.dropped = 0
+        self._queue = queue.SimpleQueue()
+        self._stop_mark = object()
+        self._file = None
+        self._writer = None
+        os.makedirs(folder, exist_ok=True)
+        self._open_segment()
+
+    def put(self, elapsed, value, stable):
+        self.put_many([(elapsed, value, stable)])
+
+    def put_many(self, samples):
+        """Пачка отсчётов одним элементом очереди."""
+        if self.error is not None:
+            # писать некому - не копим в памяти
+            self.dropped += len(samples)
+            _dropped.add(len(samples))
+            return
+        self._queue.put(samples)
+
+    def close(self, discard=False):
+        """Дописать очередь и закрыть файл; discard=True удаляет записанное."""
+        if self.is_alive():
+            self._queue.put(self._stop_mark)
+            self.join()
+        elif self._file:
+            self._close_segment()
+        if discard:
+            for fname in self.files:
+                anchors = os.path.splitext(fname)[0] + ".anchors.csv"
+                for path in (fname, anchors):
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+
+    def _segment_name(self):
+        # существующий файл (запись до переподключения весов) не затираем
+        n = len(self.files)
+        while True:
+            suffix = f"_{n:03d}" if n else ""
+            fname = os.path.join(self.folder, f"{self.name}{suffix}.{self.fmt}")
+            if not os.path.exists(fname):
+                return fname
+            n += 1
+
+    def _open_segment(self):
+        fname = self._segment_name()
+        self._offset = 0.0
+        if self.clock is not None:
+            self._generation = self.clock.generation
+            self.experiment_start = self.clock.experiment_start
+            self._offset = self.clock.offset
+        if self.fmt == "bin":
+            self._file = open(fname, "wb")
+            write_header(self._file, self.experiment_start)
+        else:
+            self._file = open(fname, "w", newline="")
+            self._writer = csv.writer(self._file)
+            self._writer.writerow([self.experiment_start.strftime("%H:%M:%S.%f")])
+        self._segment_opened = time.monotonic()
+        self.files.append(fname)
+        self._sync()
+        self._anchors = os.path.splitext(fname)[0] + ".anchors.csv" if self.clock else None
+        self._last_anchor = None
+        self._write_anchor()
+
+    def _close_segment(self):
+        self._sync()
+        self._file.close()
+        self._file = None
+        self._write_anchor()
+
+    def _write_anchor(self):
+        """Опорная точка времени в <сегмент>.anchors.csv (если задан clock)."""
+        if not self._anchors:
+            return
+        elapsed, wall, drift = self.clock.anchor()
+        elapsed -= self._offset
+        new = self._last_anchor is None
+        with open(self._anchors, "a", newline="") as f:
+            writer = csv.writer(f)
+            if new:
+                writer.writerow(["elapsed_sec", "unix_time", "wall_time", "drift_ms"])
+            writer.writerow([f"{elapsed:.6f}", f"{wall:.6f}",
+                             datetime.fromtimestamp(wall).isoformat(sep=" "), f"{drift:.3f}"])
+        self._last_anchor = time.monotonic()
+
+    def _sync(self):
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+        self._last_flush = time.monotonic()
+
+    def _need_rotate(self):
+        if self.rotate_bytes and self._file.tell() >= self.rotate_bytes:
+            return True
+        if self.rotate_seconds and time.monotonic() - self._segment_opened >= self.rotate_seconds:
+            return True
+        return False
+
+    def run(self):
+        stopping = False
+        try:
+            while not stopping:
+                try:
+                    item = self._queue.get(timeout=self.flush_interval or 0.5)
+                except queue.Empty:
+                    item = None
+                batch = []
+                # забираем всё, что успело накопиться
+                while item is not None:
+                    if item is self._stop_mark:
+                        stopping = True
+                        break
+                    batch.extend(item)
+                    if len(batch) >= self.batch_size:
+                        break
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        item = None
+                if batch and self.clock is not None and self.clock.generation != self._generation:
+                    # новая отметка начала эксперимента - новый сегмент с новым заголовком
+                    self._close_segment()
+                    self._open_segment()
+                if batch:
+                    t0 = time.perf_counter()
+                    offset = self._offset
+                    if self.fmt == "bin":
+                        rec = pack_records(batch)
+                        if offset:
+                            rec["t"] -= offset
+                        self._file.write(rec.tobytes())
+                    elif offset:
+                        self._writer.writerows((t - offset, v, s) for t, v, s in batch)
+                    else:
+                        self._writer.writerows(batch)
+                    self.written += len(batch)
+                    _samples.add(len(batch))
+                    _write_ms.record((time.perf_counter() - t0) * 1000)
+                    _backlog.set(self._queue.qsize())
+                if time.monotonic() - self._last_flush >= self.flush_interval:
+                    self._sync()
+                if self._anchors and time.monotonic() - self._last_anchor >= self.anchor_interval:
+                    self._write_anchor()
+                if batch and self._need_rotate():
+                    self._close_segment()
+                    self._open_segment()
+        except Exception as e:
+            self.error = e
+            _errors.add()
+            log.error("recording to %s failed: %s", self.folder, e)
+            # то, что успело попасть в очередь, тоже уже не запишется
+            while True:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is not self._stop_mark:
+                    self.dropped += len(item)
+                    _dropped.add(len(item))
+        finally:
+            if self._file:
+                try:
+                    self._close_segment()
+                except (OSError, ValueError):
+                    self._file = None
@@ -0,0 +1,136 @@
+"""Чтение и разбор данных весов из последовательного порта (без зависимостей от Qt)."""
+import re
+import time
+
+from balance_metrics import METRICS
+
+_reads = METRICS.counter("serial.reads")
+_bytes = METRICS.counter("serial.bytes")
+_backlog = METRICS.gauge("serial.backlog_bytes")
+_lines = METRICS.counter("parse.lines")
+_failures = METRICS.counter("parse.failures")
+
+# ошибки чтения: пауза между попытками растёт от READ_RETRY_MIN до
+# READ_RETRY_MAX с, а если порт не читается READ_GIVE_UP с подряд
+# (весы отключили), чтение прекращается
+READ_RETRY_MIN = 0.05
+READ_RETRY_MAX = 2.0
+READ_GIVE_UP = 30.0
+
+
+class FrameParser:
+    """Разбор строки весов.
+
+    Значение - первое число в строке, признак стабильности - символ
+    stable_char в колонке stable_col (у наших весов 'S' в 13-й позиции).
+    """
+
+    def __init__(self, stable_col=12, stable_char="S", value_pattern=r"([\d.]+)"):
+        self.stable_col = stable_col
+        self.stable_char = stable_char.upper()
+        self._value_re = re.compile(value_pattern)
+
+    def parse(self, text):
+        """Строка -> (value|None, stable)."""
+        m = self._value_re.search(text)
+        try:
+            val = float(m.group(1)) if m else None
+        except ValueError:
+            val = None
+        stable = len(text) > self.stable_col and text[self.stable_col].upper() == self.stable_char
+        return val, stable
+
+
+class FrameReader:
+    """Чтение порта крупными кусками с разбиением на строки.
+
+    За один вызов read_lines() вычитывается всё, что накопилось в буфере
+    ОС (in_waiting), а не по одной строке; неполная последняя строка
+    остаётся в буфере до следующего вызова. stamp - time.perf_counter()
+    сразу после чтения, до разбора: момент прихода байтов.
+    """
+
+    def __init__(self, serial_conn, max_chunk=65536):
+        self.serial_conn = serial_conn
+        self.max_chunk = max_chunk
+        self.stamp = None
+        self._buf = bytearray()
+
+    def read_lines(self):
+        """Дождаться данных (не дольше таймаута порта) и вернуть готовые строки."""
+        waiting = self.serial_conn.in_waiting
+        _backlog.set(waiting)
+        chunk = self.serial_conn.read(min(max(waiting, 1), self.max_chunk))
+        if not chunk:
+            return []
+        self.stamp = time.perf_counter()
+        _reads.add()
+        _bytes.add(len(chunk))
+        buf = self._buf
+        buf += chunk
+        end = buf.rfind(b"\n")
+        if end < 0:
+            return []
+        lines = []
+        for raw in buf[:end].split(b"\n"):
+            text = raw.decode("ascii", errors="ignore").strip()
+            if text:
+                lines.append(text)
+        del buf[:end + 1]
+        return lines
+
+    def pending(self):
+        """Сколько байт ещё ждёт в порту."""
+        return self.serial_conn.in_waiting
+
+
+def read_batch(reader, parser, clock=None, on_lines=None):
+    """Прочитать всё доступное из порта -> (список (elapsed, value, stable), последняя строка).
+
+    elapsed - от начала сессии clock (SessionClock); без clock - сырая
+    метка perf_counter (её пересчитывает процесс, где живёт clock).
+    on_lines(lines) - получает сырые строки до разбора (ответы на команды).
+    """
+    lines = reader.read_lines()
+    if not lines:
+        return [], None
+    if on_lines is not None:
+        on_lines(lines)
+    # время - одно на всё прочитанное за раз, по монотонным часам
+    elapsed = reader.stamp if clock is None else reader.stamp - clock.origin
+    parse = parser.parse
+    batch = [(elapsed,) + parse(text) for text in lines]
+    _lines.add(len(batch))
+    # нераспознанные строки попадают в данные как None - считаем их
+    _failures.add(sum(1 for s in batch if s[1] is None))
+    return batch, lines[-1]
+
+
+class ReadRetry:
+    """Серия ошибок чтения порта: пауза перед повтором и момент, когда сдаться.
+
+    failed() после каждой ошибки -> (событие, пауза): событие "error" - первая
+    ошибка серии, "stopped" - порт не читается READ_GIVE_UP с, иначе None.
+    ok() после удачного чтения -> True, если серия ошибок на этом кончилась.
+    """
+
+    def __init__(self, give_up=READ_GIVE_UP):
+        self.give_up = give_up
+        self.failing_since = None
+        self.delay = READ_RETRY_MIN
+
+    def failed(self):
+        now = time.monotonic()
+        if self.failing_since is None:
+            self.failing_since, self.delay = now, READ_RETRY_MIN
+            return "error", self.delay
+        if now - self.failing_since >= self.give_up:
+            return "stopped", 0.0
+        self.delay = min(self.delay * 2, READ_RETRY_MAX)
+        return None, self.delay
+
+    def ok(self):
+        if self.failing_since is None:
+            return False
+        self.failing_since = None
+        return True
@@ -0,0 +1,293 @@
+"""Чтение порта в отдельном процессе с передачей отсчётов через общую память.
+
+Дочерний процесс только читает порт и пишет отсчёты в кольцо в общей
+памяти; GUI забирает их в своём темпе. Долгая перерисовка или модальное
+окно в GUI больше не мешают чтению порта, а переполнение кольца (GUI не
+успел забрать данные) учитывается счётчиком dropped. Время отсчётов в
+кольце - сырые метки perf_counter (общие для процессов машины), от
+начала сессии их считает читатель: read_new(origin=clock.origin).
+"""
+import queue
+import struct
+import threading
+import multiprocessing as mp
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from balance_serial import FrameParser, FrameReader, ReadRetry, read_batch
+from balance_commands import Command, CommandScheduler, default_expect
+
+# заголовок: записано отсчётов, потеряно (считает читатель), длина последней строки
+_HEADER = struct.Struct("<qqq")
+_RAW_SIZE = 128
+_DATA_OFFSET = 256
+
+
+class SharedSampleRing:
+    """Кольцо отсчётов в общей памяти: один писатель, один читатель.
+
+    Писатель сначала кладёт данные, потом увеличивает счётчик written;
+    читатель сравнивает written со своим счётчиком прочитанного. Если
+    писатель обогнал читателя больше чем на ёмкость, самые старые
+    непрочитанные отсчёты потеряны - их число копится в dropped.
+    """
+
+    def __init__(self, capacity, name=None):
+        self.capacity = int(capacity)
+        size = _DATA_OFFSET + self.capacity * (8 + 8 + 1)
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+            self.shm.buf[:_DATA_OFFSET] = bytes(_DATA_OFFSET)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        buf = self.shm.buf
+        self._header = np.ndarray(3, dtype=np.int64, buffer=buf)
+        self._raw = np.ndarray(_RAW_SIZE, dtype=np.uint8, buffer=buf, offset=_HEADER.size)
+        off = _DATA_OFFSET
+        self.t = np.ndarray(self.capacity, dtype=np.float64, buffer=buf, offset=off)
+        off += 8 * self.capacity
+        self.v = np.ndarray(self.capacity, dtype=np.float64, buffer=buf, offset=off)
+        off += 8 * self.capacity
+        self.stable = np.ndarray(self.capacity, dtype=np.bool_, buffer=buf, offset=off)
+        self._read = 0
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    @property
+    def written(self):
+        return int(self._header[0])
+
+    @property
+    def dropped(self):
+        return int(self._header[1])
+
+    # ─── писатель ───────────────────────────────────────────────────────
+    def write_many(self, samples):
+        n = len(samples)
+        if not n:
+            return
+        t, v, s = zip(*samples)
+        v = np.array(v, dtype=np.float64)    # None -> nan
+        if n > self.capacity:
+            t, v, s = t[-self.capacity:], v[-self.capacity:], s[-self.capacity:]
+        start = (self.written + n - len(t)) % self.capacity
+        first = min(len(t), self.capacity - start)
+        for dst, src in ((self.t, t), (self.v, v), (self.stable, s)):
+            src = np.asarray(src)
+            dst[start:start + first] = src[:first]
+            dst[:len(src) - first] = src[first:]
+        self._header[0] += n
+
+    def set_raw(self, text):
+        data = text.encode("ascii", errors="ignore")[:_RAW_SIZE]
+        self._raw[:len(data)] = np.frombuffer(data, dtype=np.uint8)
+        self._header[2] = len(data)
+
+    # ─── читатель ───────────────────────────────────────────────────────
+    def raw(self):
+        return self._raw[:int(self._header[2])].tobytes().decode("ascii", errors="ignore")
+
+    def read_new(self, limit=None, origin=0.0):
+        """Новые отсчёты списком (t - origin, value|None, stable)."""
+        written = self.written
+        n = written - self._read
+        if n <= 0:
+            return []
+        if n > self.capacity:
+            self._header[1] += n - self.capacity
+            self._read = written - self.capacity
+            n = self.capacity
+        if limit:
+            n = min(n, limit)
+        start = self._read % self.capacity
+        idx = (np.arange(start, start + n) % self.capacity) if start + n > self.capacity \
+            else slice(start, start + n)
+        t = (self.t[idx] - origin).tolist()
+        v = [None if x != x else x for x in self.v[idx].tolist()]
+        s = self.stable[idx].tolist()
+        # если писатель успел перезаписать прочитанное, отбрасываем испорченное
+        overrun = self.written - self._read - self.capacity
+        self._read += n
+        if overrun > 0:
+            self._header[1] += min(overrun, n)
+            cut = min(overrun, n)
+            t, v, s = t[cut:], v[cut:], s[cut:]
+        return list(zip(t, v, s))
+
+    def close(self):
+        self._header = self._raw = self.t = self.v = self.stable = None
+        self.shm.close()
+
+    def unlink(self):
+        self.shm.unlink()
+
+
+def _forward(commands, scheduler):
+    """Команды из родительского процесса -> CommandScheduler этого процесса."""
+    while True:
+        item = commands.get()
+        if item is None:
+            break
+        if isinstance(item, tuple):
+            scheduler.set_poll(item[1])
+        else:
+            scheduler.put(item)
+
+
+def _acquire(port, baudrate, shm_name, capacity, commands, results, status, stop):
+    """Тело дочернего процесса: порт -> общая память, очередь команд -> порт.
+
+    Команды пишет CommandScheduler рядом с портом; завершённые команды
+    (с ответом или таймаутом) возвращаются родителю через results. После
+    "ok" через status идут ("error", текст) - чтение перестало получаться,
+    ("recovered", None) и ("stopped", текст) - процесс сдался и выходит.
+    """
+    import serial
+    ring = SharedSampleRing(capacity, name=shm_name)
+    try:
+        conn = serial.Serial(port=port, baudrate=baudrate, timeout=0.1)
+    except Exception as e:
+        status.put(str(e))
+        ring.close()
+        return
+    status.put("ok")
+    reader = FrameReader(conn)
+    parser = FrameParser()
+    scheduler = CommandScheduler(conn.write, on_done=results.put)
+    scheduler.start()
+    threading.Thread(target=_forward, args=(commands, scheduler), daemon=True).start()
+    retry = ReadRetry()
+    try:
+        while not stop.is_set():
+            try:
+                batch, raw = read_batch(reader, parser, None, scheduler.on_lines)
+            except Exception as e:
+                event, delay = retry.failed()
+                if event is not None:
+                    status.put((event, str(e)))
+                if event == "stopped":
+                    break
+                stop.wait(delay)
+                continue
+            if retry.ok():
+                status.put(("recovered", None))
+            if batch:
+                ring.write_many(batch)
+                ring.set_raw(raw)
+    finally:
+        scheduler.stop()
+        conn.close()
+        ring.close()
+
+
+class AcquisitionProcess:
+    """Дочерний процесс, читающий один порт.
+
+    Команды отправляются как через CommandScheduler (submit, set_poll),
+    но пишет их в порт дочерний процесс; завершённые команды забираются
+    через done_commands(), новые отсчёты - через read_new().
+    """
+
+    def __init__(self, port, baudrate, capacity=1 << 20):
+        self.port = port
+        self.ring = SharedSampleRing(capacity)
+        ctx = mp.get_context("spawn")
+        self._commands = ctx.Queue()
+        self._results = ctx.Queue()
+        self._status = ctx.Queue()
+        self._next_id = 1
+        self._closed = False
+        self._stop = ctx.Event()
+        self._proc = ctx.Process(
+            target=_acquire, daemon=True,
+            args=(port, baudrate, self.ring.name, capacity,
+                  self._commands, self._results, self._status, self._stop),
+        )
+
+    def start(self, timeout=10.0):
+        """Запустить процесс и дождаться открытия порта (OSError при неудаче)."""
+        self._proc.start()
+        try:
+            result = self._status.get(timeout=timeout)
+        except queue.Empty:
+            result = "acquisition process did not start"
+        if result != "ok":
+            self.close()
+            raise OSError(result)
+
+    @property
+    def is_open(self):
+        return self._proc.is_alive()
+
+    def status_messages(self):
+        """Сообщения дочернего процесса об ошибках чтения с прошлого вызова (см. _acquire)."""
+        messages = []
+        try:
+            while True:
+                messages.append(self._status.get_nowait())
+        except queue.Empty:
+            pass
+        return messages
+
+    def submit(self, text, expect="default", timeout=2.0):
+        """Поставить команду в очередь дочернего процесса (без ожидания)."""
+        if expect == "default":
+            expect = default_expect(text)
+        cmd = Command(text, expect, timeout, id=self._next_id)
+        self._next_id += 1
+        self._commands.put(cmd)
+        return cmd
+
+    def set_poll(self, period):
+        self._commands.put(("poll", period))
+
+    def done_commands(self):
+        """Команды, завершённые в дочернем процессе с прошлого вызова."""
+        done = []
+        try:
+            while True:
+                done.append(self._results.get_nowait())
+        except queue.Empty:
+            pass
+        return done
+
+    def read_new(self, limit=None, origin=0.0):
+        return self.ring.read_new(limit, origin)
+
+    def raw(self):
+        return self.ring.raw()
+
+    @property
+    def written(self):
+        return self.ring.written
+
+    @property
+    def dropped(self):
+        return self.ring.dropped
+
+    def close(self):
+        """Остановить процесс и освободить общую память и очереди.
+
+        Вызывать и после того, как процесс завершился сам (сдался после
+        ошибок чтения): память и очереди всё равно нужно освободить.
+        Повторный вызов ничего не делает.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        self._stop.set()
+        self._commands.put(None)
+        if self._proc.pid is not None:
+            self._proc.join(timeout=2)
+            if self._proc.is_alive():
+                self._proc.terminate()
+        if self.ring.shm is not None and self.ring.t is not None:
+            self.ring.close()
+            self.ring.unlink()
+        # дочерний процесс уже не прочтёт команды - не ждать их отправки
+        for q in (self._commands, self._results, self._status):
+            q.cancel_join_thread()
+            q.close()
@@ -0,0 +1,222 @@
+"""Эмулятор весов для проверки программы без прибора.
+
+Выдаёт строки в формате весов (значение, признак стабильности 'S' в
+13-й колонке), отвечает на команды T, C, E, M, O и умеет портить часть
+строк. Работает двумя способами:
+
+* SimulatedSerial - объект с интерфейсом serial.Serial внутри процесса
+  (для тестов и balance_bench.py, на любой ОС);
+* псевдотерминал (Linux/macOS): python balance_sim.py --rate 10
+  печатает имя порта, к которому можно подключить GUI или balance_cli.py.
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import threading
+
+
+class BalanceModel:
+    """Поведение весов: масса, шум, дрейф, тара и формат строки.
+
+    rate - строк в секунду при непрерывном выводе (0 - без ограничения,
+    столько, сколько попросят); noise - СКО шума, г; drift - изменение
+    массы, г/с (испарение - отрицательное); malformed - доля испорченных
+    строк; settle - сколько секунд весы нестабильны после скачка массы.
+    """
+
+    def __init__(self, rate=10.0, mass=100.0, noise=0.002, drift=0.0,
+                 malformed=0.0, settle=2.0, step_every=None, seed=None):
+        self.rate = rate
+        self.mass = mass
+        self.noise = noise
+        self.drift = drift
+        self.malformed = malformed
+        self.settle = settle
+        self.step_every = step_every    # раз в сколько секунд ставить/снимать груз
+        self.rng = random.Random(seed)
+        self.tare = 0.0
+        self.output_on = True
+        self.continuous = True
+        self.sent = 0                    # сколько строк выдано
+        self._t0 = time.monotonic()
+        self._last_step = 0.0
+
+    def weight(self, now):
+        """Показание в момент now (monotonic) и признак стабильности."""
+        t = now - self._t0
+        if self.step_every and t - self._last_step >= self.step_every:
+            self._last_step = t
+            self.mass += self.rng.choice((-1, 1)) * self.rng.uniform(1, 20)
+        stable = t - self._last_step >= self.settle or not self.step_every
+        noise = self.noise * (1 if stable else 50)
+        value = self.mass + self.drift * t + self.rng.gauss(0, noise) - self.tare
+        return value, stable
+
+    def frame(self, now):
+        """Очередная строка (bytes) в формате весов."""
+        self.sent += 1
+        if self.malformed and self.rng.random() < self.malformed:
+            return self.rng.choice((b"\r\n", b"ERR\r\n", b"  \x00\xff--.-- g\r\n", b"+   12.3"))
+        value, stable = self.weight(now)
+        sign = "-" if value < 0 else "+"
+        # 0: знак, 1-8: число, 10: единица, 12: флаг стабильности
+        text = f"{sign}{abs(value):8.3f} g {'S' if stable else 'U'}\r\n"
+        return text.encode("ascii")
+
+    def command(self, cmd, now):
+        """Обработать команду; вернуть ответ (bytes) или b''."""
+        c = cmd.upper()
+        if c == "T":
+            self.tare += self.weight(now)[0]
+        elif c == "C":
+            return b"CAL OK\r\n"
+        elif c == "E":
+            return self.frame(now)
+        elif c == "O":
+            self.output_on = not self.output_on
+        elif c == "M":
+            # в меню непрерывный вывод переключается на вывод по E
+            self.continuous = not self.continuous
+        return b""
+
+
+class SimulatedSerial:
+    """Порт, за которым сидит BalanceModel (подмножество serial.Serial).
+
+    Строки появляются по времени с частотой model.rate; при rate=0
+    каждая операция чтения получает сразу burst строк.
+    """
+
+    def __init__(self, model=None, timeout=1.0, burst=1000):
+        self.model = model or BalanceModel()
+        self.timeout = timeout
+        self.burst = burst
+        self.is_open = True
+        self.port = "sim://"
+        self._buf = bytearray()
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _produce(self):
+        m = self.model
+        now = time.monotonic()
+        if not (m.output_on and m.continuous):
+            self._next = now
+            return
+        if m.rate <= 0:
+            for _ in range(self.burst):
+                self._buf += m.frame(now)
+            return
+        period = 1.0 / m.rate
+        while self._next <= now:
+            self._buf += m.frame(self._next)
+            self._next += period
+
+    @property
+    def in_waiting(self):
+        with self._lock:
+            self._produce()
+            return len(self._buf)
+
+    def read(self, size=1):
+        deadline = time.monotonic() + (self.timeout or 0)
+        while True:
+            with self._lock:
+                self._produce()
+                if self._buf:
+                    data = bytes(self._buf[:size])
+                    del self._buf[:size]
+                    return data
+            if not self.is_open or time.monotonic() >= deadline:
+                return b""
+            time.sleep(min(max(self._next - time.monotonic(), 0.001), 0.05))
+
+    def readline(self):
+        line = bytearray()
+        while not line.endswith(b"\n"):
+            ch = self.read(1)
+            if not ch:
+                break
+            line += ch
+        return bytes(line)
+
+    def write(self, data):
+        now = time.monotonic()
+        with self._lock:
+            for cmd in data.decode("ascii", errors="ignore").split("\r"):
+                cmd = cmd.strip()
+                if cmd:
+                    self._buf += self.model.command(cmd, now)
+        return len(data)
+
+    def reset_input_buffer(self):
+        with self._lock:
+            self._buf.clear()
+
+    def close(self):
+        self.is_open = False
+
+
+def run_pty(model, baud=None):
+    """Весы на псевдотерминале; возвращается только по Ctrl+C."""
+    import pty
+    import tty
+    import select
+    master, slave = pty.openpty()
+    tty.setraw(slave)
+    print(f"Simulated balance on {os.ttyname(slave)} (Ctrl+C to stop)", flush=True)
+    period = 1.0 / model.rate if model.rate > 0 else 0.0
+    # при заданной скорости порта не выдаём быстрее, чем он передал бы
+    byte_time = 10.0 / baud if baud else 0.0
+    next_t = time.monotonic()
+    try:
+        while True:
+            timeout = max(0.0, next_t - time.monotonic())
+            ready, _, _ = select.select([master], [], [], timeout)
+            now = time.monotonic()
+            if ready:
+                cmds = os.read(master, 1024).decode("ascii", errors="ignore")
+                for cmd in cmds.split("\r"):
+                    cmd = cmd.strip()
+                    if cmd:
+                        reply = model.command(cmd, now)
+                        if reply:
+                            os.write(master, reply)
+            if now >= next_t:
+                frame = b""
+                if model.output_on and model.continuous:
+                    frame = model.frame(now)
+                    os.write(master, frame)
+                next_t = max(next_t + period, now + len(frame) * byte_time)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        os.close(master)
+        os.close(slave)
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Serial balance simulator (pseudo-terminal).")
+    p.add_argument("--rate", type=float, default=10.0, help="lines per second (default 10)")
+    p.add_argument("--baud", type=int, default=2400, help="limit output to this baud rate, 0 - no limit")
+    p.add_argument("--mass", type=float, default=100.0, help="initial mass, g")
+    p.add_argument("--noise", type=float, default=0.002, help="noise std, g")
+    p.add_argument("--drift", type=float, default=0.0, help="mass change, g/s")
+    p.add_argument("--malformed", type=float, default=0.0, help="fraction of malformed lines")
+    p.add_argument("--step-every", type=float, default=None, help="put/remove a load every N s")
+    p.add_argument("--seed", type=int, default=None)
+    args = p.parse_args(argv)
+    if sys.platform == "win32":
+        print("Pseudo-terminals are not available on Windows; use a virtual COM port pair "
+              "(e.g. com0com) or SimulatedSerial in-process.", file=sys.stderr)
+        return 1
+    model = BalanceModel(rate=args.rate, mass=args.mass, noise=args.noise, drift=args.drift,
+                         malformed=args.malformed, step_every=args.step_every, seed=args.seed)
+    run_pty(model, baud=args.baud or None)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
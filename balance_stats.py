@@ -0,0 +1,200 @@
+"""Скользящая статистика по потоку отсчётов за O(1) на отсчёт (без зависимостей от Qt).
+
+Для окна по времени хранятся только суммы (n, Σt, Σv, Σt², Σv², Σtv):
+новый отсчёт прибавляется, вышедший из окна - вычитается. Из сумм
+получаются среднее, СКО и наклон (скорость изменения массы) методом
+наименьших квадратов. Время и значения сдвигаются на отсчёт в начале
+окна, чтобы суммы квадратов не теряли точность на многодневных записях;
+когда начало окна уходит от этой точки дальше чем на два окна, суммы
+пересчитываются от нового начала (O(n) раз в два окна).
+"""
+import os
+import csv
+import math
+import time
+from collections import deque
+
+
+class RollingWindow:
+    """Суммы по отсчётам за последние window секунд."""
+
+    def __init__(self, window):
+        self.window = float(window)
+        self._items = deque()
+        self.reset()
+
+    def reset(self, window=None):
+        if window is not None:
+            self.window = float(window)
+        self._items.clear()
+        self._t0 = None
+        self._v0 = None
+        self._zero()
+
+    def _zero(self):
+        self.n = 0
+        self.st = self.sv = self.stt = self.svv = self.stv = 0.0
+
+    def add(self, t, v):
+        if self._t0 is not None and t - self._t0 > 2 * self.window:
+            self._rebase(t)
+        if self._t0 is None:
+            self._t0, self._v0 = t, v
+        x, y = t - self._t0, v - self._v0
+        self._items.append((t, v))
+        self.n += 1
+        self.st += x
+        self.sv += y
+        self.stt += x * x
+        self.svv += y * y
+        self.stv += x * y
+        limit = t - self.window
+        items = self._items
+        while items and items[0][0] < limit:
+            ti, vi = items.popleft()
+            x, y = ti - self._t0, vi - self._v0
+            self.n -= 1
+            self.st -= x
+            self.sv -= y
+            self.stt -= x * x
+            self.svv -= y * y
+            self.stv -= x * y
+
+    def _rebase(self, t):
+        """Пересчитать суммы от первого отсчёта, который останется в окне к моменту t.
+
+        Если окно к этому моменту опустеет, началом станет следующий отсчёт.
+        """
+        items = self._items
+        limit = t - self.window
+        while items and items[0][0] < limit:
+            items.popleft()
+        self._zero()
+        if not items:
+            self._t0 = self._v0 = None
+            return
+        self._t0, self._v0 = items[0]
+        for ti, vi in items:
+            x, y = ti - self._t0, vi - self._v0
+            self.n += 1
+            self.st += x
+            self.sv += y
+            self.stt += x * x
+            self.svv += y * y
+            self.stv += x * y
+
+    @property
+    def mean(self):
+        return self._v0 + self.sv / self.n if self.n else None
+
+    @property
+    def std(self):
+        if self.n < 2:
+            return None
+        var = (self.svv - self.sv * self.sv / self.n) / (self.n - 1)
+        return math.sqrt(var) if var > 0 else 0.0
+
+    @property
+    def slope(self):
+        """Наклон v(t), единиц в секунду."""
+        if self.n < 2:
+            return None
+        den = self.stt - self.st * self.st / self.n
+        if den <= 0:
+            return None
+        return (self.stv - self.st * self.sv / self.n) / den
+
+
+class RollingStats:
+    """Статистика одного потока: среднее/СКО, скорость, дрейф, стабильность.
+
+    stats_window - окно для среднего, СКО и программной стабильности, с;
+    rate_window - окно для скорости изменения массы, с;
+    drift_window - длинное окно для дрейфа, с;
+    отсчёт стабилен, если СКО < stable_std и |скорость| < stable_rate (г/с).
+    """
+
+    FIELDS = ("elapsed_sec", "mean", "std", "rate_g_per_min", "drift_g_per_h", "stable_sw")
+
+    def __init__(self, stats_window=60.0, rate_window=10.0, drift_window=600.0,
+                 stable_std=0.002, stable_rate=0.0005):
+        self.stats = RollingWindow(stats_window)
+        self.rate = RollingWindow(rate_window)
+        self.drift = RollingWindow(drift_window)
+        self.stable_std = stable_std
+        self.stable_rate = stable_rate
+        self.last_t = None
+
+    def reset(self, stats_window=None, rate_window=None, drift_window=None):
+        self.stats.reset(stats_window)
+        self.rate.reset(rate_window)
+        self.drift.reset(drift_window)
+        self.last_t = None
+
+    def add(self, t, value):
+        if value is None:
+            return
+        self.stats.add(t, value)
+        self.rate.add(t, value)
+        self.drift.add(t, value)
+        self.last_t = t
+
+    def extend(self, samples):
+        """Пачка (elapsed, value, stable) - как из StreamThread."""
+        for t, value, _ in samples:
+            if value is not None:
+                self.add(t, value)
+
+    def is_stable(self):
+        std, rate = self.stats.std, self.rate.slope
+        if std is None or rate is None:
+            return False
+        return std < self.stable_std and abs(rate) < self.stable_rate
+
+    def snapshot(self):
+        """Текущие значения в порядке FIELDS (None, если данных мало)."""
+        rate = self.rate.slope
+        drift = self.drift.slope
+        return (
+            self.last_t,
+            self.stats.mean,
+            self.stats.std,
+            None if rate is None else rate * 60,
+            None if drift is None else drift * 3600,
+            self.is_stable(),
+        )
+
+
+class StatsLog:
+    """Запись снимков RollingStats в CSV рядом с данными эксперимента.
+
+    Как и StreamRecorder, сбрасывает строки на диск не реже раза в
+    flush_interval с (0 - после каждой), с fsync=True - и через os.fsync.
+    """
+
+    def __init__(self, fname, experiment_start, flush_interval=1.0, fsync=False):
+        self.fname = fname
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        os.makedirs(os.path.dirname(fname) or ".", exist_ok=True)
+        self._file = open(fname, "w", newline="")
+        self._writer = csv.writer(self._file)
+        self._writer.writerow([experiment_start.strftime("%H:%M:%S.%f")])
+        self._writer.writerow(RollingStats.FIELDS)
+        self._last_flush = time.monotonic()
+
+    def write(self, row):
+        if row[0] is None:
+            return
+        self._writer.writerow(row)
+        if time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+        self._last_flush = time.monotonic()
+
+    def close(self):
+        self._file.close()
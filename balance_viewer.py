@@ -0,0 +1,244 @@
+"""Просмотр сохранённых записей: ленивая загрузка и пирамида min/max (без зависимостей от Qt).
+
+Файл .bin отображается в память (SampleFile) и не читается целиком.
+CSV один раз разбирается кусками в двоичный кэш <файл>.cache.bin, дальше
+открывается так же, как .bin; сжатые архивом .csv.gz и .bin.gz тоже
+распаковываются в такой кэш. Для обзора строится пирамида: на нижнем
+уровне min/max по блокам из BLOCK отсчётов, на каждом следующем - по
+FACTOR блокам предыдущего. Пирамида кэшируется в <файл>.pyramid.npz и
+пересобирается, только если исходный файл изменился.
+
+На запрос видимого участка пирамида отдаёт самый грубый уровень, в котором
+на столбец пикселей ещё приходится хотя бы один блок; при сильном
+увеличении, когда отсчётов в окне мало, - сами отсчёты из файла.
+"""
+import os
+
+import numpy as np
+
+from balance_data import (RECORD_DTYPE, CsvReader, SampleFile, decimate_minmax, pack_flags,
+                          write_header)
+from balance_archive import decompress_file
+
+
+# ─── Загрузка ───────────────────────────────────────────────────────────
+
+def csv_to_bin(src, dst, chunk=8 << 20, progress=None):
+    """Разобрать CSV программы кусками по chunk байт в двоичный файл dst.
+
+    progress(доля) вызывается после каждого куска; для .csv.gz размер
+    текста заранее неизвестен - доля None.
+    """
+    reader = CsvReader(src, chunk)
+    size = None if src.lower().endswith(".gz") else os.path.getsize(src)
+    tmp = dst + ".tmp"
+    with open(tmp, "wb") as out:
+        write_header(out, reader.experiment_start)
+        for t, v, stable in reader:
+            rec = np.empty(len(t), dtype=RECORD_DTYPE)
+            rec["t"] = t
+            rec["v"] = v
+            rec["flags"] = pack_flags(stable, ~np.isnan(v))
+            rec.tofile(out)
+            if progress:
+                progress(min(reader.position / size, 1.0) if size else None)
+    os.replace(tmp, dst)
+
+
+def open_recording(fname, progress=None):
+    """Открыть .bin или .csv программы (или их .gz) как SampleFile без чтения в память.
+
+    progress(этап, доля) - ход разбора CSV в кэш (этап "converting").
+    """
+    lower = fname.lower()
+    if not lower.endswith((".csv", ".gz")):
+        return SampleFile(fname)
+    cache = fname + ".cache.bin"
+    if not os.path.exists(cache) or os.path.getmtime(cache) < os.path.getmtime(fname):
+        if progress:
+            progress("converting", None)
+        if lower.endswith(".bin.gz"):
+            decompress_file(fname, cache)
+        else:
+            csv_to_bin(fname, cache, progress=progress and (lambda x: progress("converting", x)))
+    return SampleFile(cache)
+
+
+# ─── Пирамида min/max ───────────────────────────────────────────────────
+
+def _reduce(lo, hi, factor):
+    """min/max по группам из factor элементов (хвост - неполная группа)."""
+    n = -(-len(lo) // factor) * factor
+    if n != len(lo):
+        pad = np.full(n - len(lo), np.nan)
+        lo = np.concatenate([lo, pad])
+        hi = np.concatenate([hi, pad])
+    return (np.fmin.reduce(lo.reshape(-1, factor), axis=1),
+            np.fmax.reduce(hi.reshape(-1, factor), axis=1))
+
+
+class MinMaxPyramid:
+    """Многоуровневая сводка min/max для быстрого обзора длинной записи."""
+
+    BLOCK = 64
+    FACTOR = 8
+    TOP = 2048          # уровни строятся, пока блоков больше этого
+
+    def __init__(self, levels):
+        self.levels = levels    # [(размер блока, t начала блока, min, max)], от мелкого к крупному
+
+    @classmethod
+    def build(cls, samples, chunk=1 << 22, progress=None):
+        """Построить по отсчётам (SampleFile), читая их кусками по chunk; progress(доля)."""
+        n = len(samples)
+        chunk -= chunk % cls.BLOCK
+        ts, los, his = [], [], []
+        for i in range(0, n, chunk):
+            j = min(i + chunk, n)
+            v = samples.v[i:j].astype(np.float64)
+            lo, hi = _reduce(v, v, cls.BLOCK)
+            ts.append(np.array(samples.t[i:j:cls.BLOCK]))
+            los.append(lo)
+            his.append(hi)
+            if progress:
+                progress(j / n)
+        t = np.concatenate(ts) if ts else np.empty(0)
+        lo = np.concatenate(los) if los else np.empty(0)
+        hi = np.concatenate(his) if his else np.empty(0)
+        levels = [(cls.BLOCK, t, lo, hi)]
+        while len(levels[-1][1]) > cls.TOP:
+            block, t, lo, hi = levels[-1]
+            lo, hi = _reduce(lo, hi, cls.FACTOR)
+            levels.append((block * cls.FACTOR, t[::cls.FACTOR], lo, hi))
+        return cls(levels)
+
+    def save(self, fname, stamp):
+        arrays = {"stamp": np.array(stamp, dtype=np.int64)}
+        for k, (block, t, lo, hi) in enumerate(self.levels):
+            arrays[f"block{k}"] = np.array(block)
+            arrays[f"t{k}"] = t
+            arrays[f"lo{k}"] = lo
+            arrays[f"hi{k}"] = hi
+        tmp = fname + ".tmp.npz"
+        np.savez(tmp, **arrays)
+        os.replace(tmp, fname)
+
+    @classmethod
+    def load(cls, fname, stamp):
+        """Пирамида из кэша или None, если его нет или он устарел."""
+        try:
+            with np.load(fname) as z:
+                if z["stamp"].tolist() != list(stamp):
+                    return None
+                levels = []
+                k = 0
+                while f"t{k}" in z:
+                    levels.append((int(z[f"block{k}"]), z[f"t{k}"], z[f"lo{k}"], z[f"hi{k}"]))
+                    k += 1
+        except (OSError, KeyError, ValueError):
+            return None
+        return cls(levels) if levels else None
+
+    def value_range(self):
+        """(min, max) по всей записи или None."""
+        _, _, lo, hi = self.levels[-1]
+        if not len(lo) or np.all(np.isnan(lo)):
+            return None
+        return float(np.nanmin(lo)), float(np.nanmax(hi))
+
+    def index(self, samples, x, side):
+        """searchsorted по времени записи без чтения всего столбца t с диска.
+
+        Сначала поиск по началам блоков нижнего уровня, затем - внутри
+        одного блока (поиск прямо по отображённому столбцу копировал бы его).
+        """
+        block, bt, _, _ = self.levels[0]
+        b = max(int(np.searchsorted(bt, x, side=side)) - 1, 0)
+        lo, hi = b * block, min((b + 2) * block, len(samples))
+        return lo + int(np.searchsorted(np.asarray(samples.t[lo:hi]), x, side=side))
+
+    def query(self, samples, t0, t1, columns):
+        """Видимый участок [t0, t1]: не больше ~2*columns точек (t, v) для линии."""
+        columns = max(1, int(columns))
+        t = samples.t
+        i0 = self.index(samples, t0, "left")
+        i1 = self.index(samples, t1, "right")
+        n = i1 - i0
+        if n <= 0:
+            return np.empty(0), np.empty(0)
+        per_column = n / columns
+        level = None
+        for lev in self.levels:
+            if lev[0] <= per_column:
+                level = lev
+        if level is None:
+            # мелкий масштаб: сами отсчёты, их в окне немного
+            return decimate_minmax(np.asarray(t[i0:i1]), np.asarray(samples.v[i0:i1], dtype=np.float64),
+                                   t0, t1, columns)
+        block, bt, lo, hi = level
+        b0, b1 = i0 // block, -(-i1 // block)
+        return _blocks_to_columns(bt[b0:b1], lo[b0:b1], hi[b0:b1], t0, t1, columns)
+
+
+def _blocks_to_columns(t, lo, hi, t0, t1, columns):
+    """Свести блоки к столбцам пикселей: пары (min, max) как у decimate_minmax."""
+    edges = np.linspace(t0, t1, columns + 1)
+    starts = np.unique(np.searchsorted(t, edges[:-1], side="left"))
+    starts = starts[starts < len(t)]
+    if not len(starts):
+        return np.empty(0), np.empty(0)
+    starts[0] = 0
+    out_t = np.repeat(t[starts], 2)
+    out_v = np.empty(2 * len(starts))
+    out_v[0::2] = np.fmin.reduceat(lo, starts)
+    out_v[1::2] = np.fmax.reduceat(hi, starts)
+    return out_t, out_v
+
+
+def _stamp(fname):
+    st = os.stat(fname)
+    return st.st_size, st.st_mtime_ns
+
+
+def open_pyramid(samples, source, progress=None):
+    """Пирамида для записи source: из кэша рядом с файлом или построенная заново.
+
+    progress(этап, доля) - ход построения (этап "overview").
+    """
+    cache = source + ".pyramid.npz"
+    stamp = _stamp(samples.fname)
+    pyramid = MinMaxPyramid.load(cache, stamp)
+    if pyramid is None:
+        pyramid = MinMaxPyramid.build(samples, progress=progress and (lambda x: progress("overview", x)))
+        try:
+            pyramid.save(cache, stamp)
+        except OSError:
+            pass    # папка только для чтения - обойдёмся без кэша
+    return pyramid
+
+
+class Recording:
+    """Открытая для просмотра запись: отсчёты в памяти-отображении и пирамида."""
+
+    def __init__(self, fname, progress=None):
+        self.fname = fname
+        self.samples = open_recording(fname, progress)
+        self.pyramid = open_pyramid(self.samples, fname, progress)
+
+    def __len__(self):
+        return len(self.samples)
+
+    @property
+    def experiment_start(self):
+        return self.samples.experiment_start
+
+    def time_range(self):
+        if not len(self.samples):
+            return None
+        return float(self.samples.t[0]), float(self.samples.t[-1])
+
+    def value_range(self):
+        return self.pyramid.value_range()
+
+    def query(self, t0, t1, columns):
+        return self.pyramid.query(self.samples, t0, t1, columns)